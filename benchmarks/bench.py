@@ -0,0 +1,434 @@
+"""
+Benchmark suite for the extract, load and dashboard-query paths
+
+Every case runs in a fresh interpreter inside a scratch directory:
+
+- extract: WeatherExtractor.fetch_multiple_cities against the local fake
+  OWM server (benchmarks/owm_stub.py), with configurable latency, server
+  errors and 429s
+- transform: transform.transform_payloads over a batch of raw payloads
+- load: DataLoader.load_weather_dataframe into a freshly created database
+- queries: the dashboard queries (queries.py) against a freshly loaded database
+- backfill: backfill.run_backfill from the fake server's history API into a
+  freshly created database, across a pool of worker processes
+
+Each case reports throughput, p50/p99 latency (per HTTP request, per load
+batch, per query, per backfill chunk, or per whole transform batch) and peak RSS, and is compared against the stored
+baseline in benchmarks/baseline.json.
+
+    python3 benchmarks/bench.py                        # all suites, 10 / 1k / 100k
+    python3 benchmarks/bench.py --suite load --sizes 1000
+    python3 benchmarks/bench.py --update               # record a new baseline
+
+The database is a temporary SQLite file unless --db-url points at a
+throwaway PostgreSQL database. All pipeline tables in it are dropped and
+recreated for every case.
+"""
+
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, 'src')
+BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline.json')
+
+SUITES = ('extract', 'transform', 'load', 'queries', 'backfill')
+SIZES = (10, 1000, 100000)
+
+#distinct cities in the load/query datasets; larger sizes add more hours per city
+MAX_CITIES = 1000
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, math.ceil(q / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #bytes on macOS, kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def summarize(items, elapsed, latencies, **extra):
+    return {
+        'items': items,
+        'elapsed_s': round(elapsed, 3),
+        'throughput': round(items / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'peak_mb': round(peak_rss_mb(), 1),
+        **extra
+    }
+
+
+def fresh_database():
+    """Drop and recreate every pipeline table in the DATABASE_URL database"""
+    from db import get_engine
+    from models import Base
+
+    engine = get_engine(statement_timeout=0)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    if engine.dialect.name == 'postgresql':
+        from partitions import ensure_partitions
+        ensure_partitions(engine)
+
+
+def make_frame(rows):
+    """Synthetic extractor output: up to MAX_CITIES cities, one row per city-hour"""
+    import pandas as pd
+    from utils import utc_now
+
+    cities = min(rows, MAX_CITIES)
+    hours = -(-rows // cities)
+    start = utc_now().replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours)
+    fetched_at = utc_now()
+
+    records = []
+    for i in range(rows):
+        city = i % cities
+        records.append({
+            'city': f"City {city:04d}",
+            'country': 'US',
+            'timestamp': start + timedelta(hours=i // cities),
+            'fetched_at': fetched_at,
+            'temperature': round(-10 + (i * 7919 % 450) / 10, 2),
+            'feels_like': round(-12 + (i * 7919 % 450) / 10, 2),
+            'temp_min': round(-11 + (i * 7919 % 450) / 10, 2),
+            'temp_max': round(-9 + (i * 7919 % 450) / 10, 2),
+            'humidity': i % 100,
+            'pressure': 990 + i % 40,
+            'weather_main': ('Clear', 'Clouds', 'Rain', 'Snow')[i % 4],
+            'weather_description': 'benchmark',
+            'wind_speed': i % 15,
+            'wind_direction': i % 360,
+            'cloudiness': i % 100,
+            'visibility': 10000,
+            'latitude': (city % 180) - 90 + 0.5,
+            'longitude': (city * 7 % 360) - 180 + 0.5
+        })
+    return pd.DataFrame(records)
+
+
+def _serve_stub(ready, options):
+    """Child process: run the fake OWM API and report its URL"""
+    from owm_stub import OWMStub
+
+    stub = OWMStub(**options)
+    ready.put(stub.url)
+    stub.server.serve_forever()
+
+
+def bench_extract(size, args):
+    import multiprocessing
+    from extract import WeatherExtractor
+
+    class TimedExtractor(WeatherExtractor):
+        latencies = []
+
+        def _get(self, *a, **kw):
+            start = time.perf_counter()
+            try:
+                return super()._get(*a, **kw)
+            finally:
+                self.latencies.append(time.perf_counter() - start)
+
+    cities = [f"City {i:06d}" for i in range(size)]
+    options = {
+        'latency': args.latency_ms / 1000,
+        'jitter': args.jitter_ms / 1000,
+        'error_rate': args.error_rate,
+        'throttle_rate': args.throttle_rate,
+        'retry_after': args.retry_after
+    }
+
+    #the stub gets its own process so it does not compete with the extractor for the GIL
+    ready = multiprocessing.Queue()
+    server = multiprocessing.Process(target=_serve_stub, args=(ready, options), daemon=True)
+    server.start()
+    try:
+        #the token bucket is opened wide: this measures the pipeline, not the API plan
+        extractor = TimedExtractor('benchmark', max_workers=args.workers, rate_limit=10**9, burst=10**9,
+                                   mode=args.mode, api_root=ready.get(timeout=30), city_id_cache=None,
+                                   response_cache=None)
+        start = time.perf_counter()
+        df = extractor.fetch_multiple_cities(cities)
+        elapsed = time.perf_counter() - start
+        extractor.close()
+    finally:
+        server.terminate()
+        server.join()
+
+    return summarize(len(df), elapsed, TimedExtractor.latencies, requests=len(TimedExtractor.latencies))
+
+
+def bench_transform(size, args):
+    from owm_stub import payload, city_id
+    from transform import transform_payloads
+    from utils import utc_now
+
+    fetched_at = utc_now()
+    dt = int(time.time())
+    raws = []
+    for i in range(size):
+        name = f"City {i:06d}"
+        raws.append({'city': name, 'fetched_at': fetched_at, 'payload': payload(name, city_id(name), dt)})
+
+    #a few repeats so small batches are not all timer noise
+    latencies = []
+    for _ in range(args.query_repeats):
+        start = time.perf_counter()
+        records, rejects = transform_payloads(raws)
+        latencies.append(time.perf_counter() - start)
+    elapsed = sum(latencies)
+
+    return summarize(len(records) * len(latencies), elapsed, latencies, rejected=len(rejects))
+
+
+def bench_load(size, args):
+    from load import DataLoader
+
+    class TimedLoader(DataLoader):
+        latencies = []
+
+        def insert_weather_rows(self, rows):
+            start = time.perf_counter()
+            try:
+                return super().insert_weather_rows(rows)
+            finally:
+                self.latencies.append(time.perf_counter() - start)
+
+    fresh_database()
+    df = make_frame(size)
+
+    loader = TimedLoader()
+    start = time.perf_counter()
+    success, errors = loader.load_weather_dataframe(df, batch_size=args.batch_size)
+    elapsed = time.perf_counter() - start
+    loader.close()
+
+    return summarize(success, elapsed, TimedLoader.latencies, errors=errors)
+
+
+def bench_queries(size, args):
+    from sqlalchemy import text
+    from db import dispose_engines, get_engine
+    from load import DataLoader
+    from utils import utc_now
+    import queries
+
+    fresh_database()
+    with DataLoader() as loader:
+        loader.load_weather_dataframe(make_frame(size), batch_size=args.batch_size)
+
+    engine = get_engine()
+    cities = queries.list_cities(engine)[:5]
+    since = utc_now() - timedelta(days=7)
+    with engine.connect() as conn:
+        last_id = conn.execute(text("SELECT MAX(id) FROM weather_data")).scalar()
+
+    #the calls the dashboard makes for one page view with a city filter
+    cases = {
+        'list_cities': lambda: queries.list_cities(engine),
+        'record_count': lambda: queries.record_count(engine, cities, since),
+        'summary_metrics': lambda: queries.summary_metrics(engine, since=since),
+        'mean_by_city': lambda: queries.mean_by_city(engine, 'temperature', cities, since),
+        'condition_counts': lambda: queries.condition_counts(engine, cities, since),
+        'temperature_ranges': lambda: queries.temperature_ranges(engine, cities, since),
+        'rollup_mean_by_city': lambda: queries.rollup_mean_by_city(engine, 'temperature', cities, since),
+        'latest_per_city': lambda: queries.latest_per_city(engine, cities),
+        'weather_rows': lambda: queries.weather_rows(engine, cities, since),
+        #the dashboard buffer's refresh when nothing new has been loaded
+        'weather_rows_after': lambda: queries.weather_rows_after(engine, after_id=last_id, since=since),
+    }
+
+    latencies = []
+    per_query = {}
+    failed = {}
+    start = time.perf_counter()
+    for name, run in cases.items():
+        timings = []
+        try:
+            for _ in range(args.query_repeats):
+                t0 = time.perf_counter()
+                run()
+                timings.append(time.perf_counter() - t0)
+        except Exception as e:
+            failed[name] = str(e).splitlines()[0]
+            continue
+        latencies.extend(timings)
+        per_query[name] = round(percentile(timings, 50) * 1000, 2)
+    elapsed = time.perf_counter() - start
+    dispose_engines()
+
+    return summarize(len(latencies), elapsed, latencies, per_query_p50_ms=per_query, failed=failed)
+
+
+def bench_backfill(size, args):
+    import multiprocessing
+    from backfill import HistorySource, run_backfill
+    from utils import utc_now
+
+    #same shape as the load dataset: up to MAX_CITIES cities, one row per city-hour
+    cities = [f"City {i:04d}" for i in range(min(size, MAX_CITIES))]
+    hours = -(-size // len(cities))
+    end = utc_now().replace(minute=0, second=0, microsecond=0)
+    locations = {city: {'coord': {'lat': 0.5, 'lon': 0.5}, 'sys': {'country': 'US'}} for city in cities}
+    options = {
+        'latency': args.latency_ms / 1000,
+        'jitter': args.jitter_ms / 1000,
+        'error_rate': args.error_rate,
+        'throttle_rate': args.throttle_rate,
+        'retry_after': args.retry_after
+    }
+
+    fresh_database()
+    ready = multiprocessing.Queue()
+    server = multiprocessing.Process(target=_serve_stub, args=(ready, options), daemon=True)
+    server.start()
+    try:
+        url = ready.get(timeout=30)
+        source = HistorySource('benchmark', locations, history_root=url, api_root=url, rate_limit=10**9,
+                               burst=10**9, max_workers=max(1, args.workers // args.backfill_workers))
+        latencies = []
+        start = time.perf_counter()
+        summary = run_backfill(source, cities, end - timedelta(hours=hours), end, workers=args.backfill_workers,
+                               on_chunk=lambda result: latencies.append(result['seconds']))
+        elapsed = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.join()
+
+    return summarize(summary['loaded'], elapsed, latencies, chunks=summary['chunks'], failed_chunks=summary['failed'])
+
+
+CASES = {'extract': bench_extract, 'transform': bench_transform, 'load': bench_load, 'queries': bench_queries,
+         'backfill': bench_backfill}
+
+
+def run_case(suite, size, args, workdir):
+    """Run one case in a fresh interpreter and return its result dict"""
+    env = {
+        **os.environ,
+        'PYTHONPATH': os.pathsep.join([SRC, ROOT, os.path.join(ROOT, 'benchmarks')]),
+        'DATABASE_URL': args.db_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+    }
+    command = [sys.executable, os.path.abspath(__file__), '--case', suite, '--size', str(size)] + args.passthrough
+    result = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True)
+
+    for line in reversed(result.stdout.splitlines()):
+        if line.startswith('RESULT '):
+            return json.loads(line[len('RESULT '):])
+    raise RuntimeError(f"{suite}/{size} failed:\n{result.stderr[-2000:]}")
+
+
+def regressions(key, result, baseline, tolerance):
+    """Compare one result against its baseline entry"""
+    base = baseline.get(key)
+    if not base:
+        return []
+
+    found = []
+    if result['throughput'] < base['throughput'] / tolerance:
+        found.append(f"{key}: throughput {result['throughput']}/s < {base['throughput']}/s / {tolerance}")
+    #small absolute slack so sub-millisecond latencies do not flap
+    if result['p99_ms'] > base['p99_ms'] * tolerance + 5:
+        found.append(f"{key}: p99 {result['p99_ms']} ms > {base['p99_ms']} ms x {tolerance}")
+    if result['peak_mb'] > base['peak_mb'] * tolerance:
+        found.append(f"{key}: peak memory {result['peak_mb']} MB > {base['peak_mb']} MB x {tolerance}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark extract, load and dashboard queries")
+    parser.add_argument('--suite', default=','.join(SUITES), help="Comma-separated: extract,transform,load,queries,backfill")
+    parser.add_argument('--sizes', default=','.join(str(s) for s in SIZES), help="Comma-separated cities/rows")
+    parser.add_argument('--db-url', help="Throwaway database URL (its pipeline tables are dropped); default temp SQLite")
+    parser.add_argument('--tolerance', type=float, default=1.5)
+    parser.add_argument('--update', action='store_true', help="Store the results as the new baseline")
+    parser.add_argument('--output', help="Also write the raw results to this JSON file")
+
+    case_args = parser.add_argument_group('case options (forwarded to each case)')
+    case_args.add_argument('--workers', type=int, default=16)
+    case_args.add_argument('--mode', default='city', choices=['city', 'group'])
+    case_args.add_argument('--latency-ms', type=float, default=20)
+    case_args.add_argument('--jitter-ms', type=float, default=10)
+    case_args.add_argument('--error-rate', type=float, default=0.01)
+    case_args.add_argument('--throttle-rate', type=float, default=0.01)
+    case_args.add_argument('--retry-after', type=int, default=1)
+    case_args.add_argument('--batch-size', type=int, default=5000)
+    case_args.add_argument('--query-repeats', type=int, default=5)
+    case_args.add_argument('--backfill-workers', type=int, default=4)
+
+    parser.add_argument('--case', choices=list(CASES), help=argparse.SUPPRESS)
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print('RESULT ' + json.dumps(CASES[args.case](args.size, args)))
+        return
+
+    args.passthrough = []
+    for action in case_args._group_actions:
+        args.passthrough += [action.option_strings[0], str(getattr(args, action.dest))]
+
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+
+    results = {}
+    failures = []
+    print(f"{'case':<16} {'items':>8} {'items/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'peak MB':>8}")
+    for suite in args.suite.split(','):
+        for size in (int(s) for s in args.sizes.split(',')):
+            key = f"{suite}/{size}"
+            with tempfile.TemporaryDirectory() as workdir:
+                result = run_case(suite, size, args, workdir)
+            results[key] = result
+            failures += regressions(key, result, baseline, args.tolerance)
+            print(f"{key:<16} {result['items']:>8} {result['throughput']:>10} "
+                  f"{result['p50_ms']:>9} {result['p99_ms']:>9} {result['peak_mb']:>8}")
+            for name, error in result.get('failed', {}).items():
+                print(f"  ! {name} failed: {error}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.update:
+        baseline.update({
+            key: {metric: result[metric] for metric in ('throughput', 'p50_ms', 'p99_ms', 'peak_mb')}
+            for key, result in results.items()
+        })
+        with open(BASELINE, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Baseline written to {BASELINE}")
+
+    if failures:
+        print("\nPerformance regression:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
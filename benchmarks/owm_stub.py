@@ -0,0 +1,218 @@
+"""
+Local fake OpenWeatherMap server for benchmarks
+
+Serves /weather (by ?q= name or ?id=), /group (?id=1,2,...) and the
+history API's /history/city (?q= or ?id=, start, end) with deterministic
+payloads, optional latency, server errors and 429s, so the extractor and
+the backfill can be benchmarked without touching the real API:
+
+    python3 benchmarks/owm_stub.py --port 8765 --latency-ms 50 --throttle-rate 0.02
+    OWM_API_ROOT=http://127.0.0.1:8765 python3 src/extract.py
+    OWM_API_ROOT=http://127.0.0.1:8765 OWM_HISTORY_ROOT=http://127.0.0.1:8765 python3 src/backfill.py ...
+"""
+
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def city_id(name):
+    """Stable fake OWM city ID for a city name"""
+    return zlib.crc32(name.encode('utf-8')) & 0x7fffffff
+
+
+def payload(name, owm_id, dt):
+    """Current-weather payload shaped like OWM's, varied per city"""
+    seed = owm_id % 1000
+    return {
+        'id': owm_id,
+        'name': name,
+        'dt': dt,
+        'coord': {'lat': (seed % 180) - 90 + 0.5, 'lon': (seed * 7 % 360) - 180 + 0.5},
+        'sys': {'country': 'US'},
+        'main': {
+            'temp': 270 + seed % 40,
+            'feels_like': 269 + seed % 40,
+            'temp_min': 268 + seed % 40,
+            'temp_max': 272 + seed % 40,
+            'humidity': seed % 100,
+            'pressure': 990 + seed % 40
+        },
+        'weather': [{'main': 'Clouds', 'description': 'scattered clouds'}],
+        'wind': {'speed': seed % 15, 'deg': seed % 360},
+        'clouds': {'all': seed % 100},
+        'visibility': 10000
+    }
+
+
+def history_item(owm_id, dt):
+    """One hourly entry of a history/city response: no coord, sys or name, temperature follows the day"""
+    item = payload('', owm_id, dt)
+    for key in ('id', 'name', 'coord', 'sys'):
+        del item[key]
+    swing = 5 * math.sin(2 * math.pi * (dt % 86400) / 86400)
+    for key in ('temp', 'feels_like', 'temp_min', 'temp_max'):
+        item['main'][key] = round(item['main'][key] + swing, 2)
+    return item
+
+
+#the history API returns at most one week of hourly entries per call
+HISTORY_MAX_ENTRIES = 169
+
+
+class OWMStub:
+    """In-process fake OWM API on a background thread
+
+    Args:
+        port: Port to listen on (0 = pick a free one)
+        latency: Mean response latency in seconds
+        jitter: Max extra latency in seconds, uniformly distributed
+        error_rate: Fraction of requests answered with 500
+        throttle_rate: Fraction of requests answered with 429
+        retry_after: Retry-After seconds sent with 429s
+        seed: Random seed, so runs are reproducible
+    """
+
+    def __init__(self, port=0, latency=0.0, jitter=0.0, error_rate=0.0, throttle_rate=0.0,
+                 retry_after=1, seed=42):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.names = {}
+        self.requests = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def _roll(self):
+        """Pick this request's latency and failure mode"""
+        with self.lock:
+            self.requests += 1
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            roll = self.random.random()
+        if roll < self.throttle_rate:
+            return delay, 429
+        if roll < self.throttle_rate + self.error_rate:
+            return delay, 500
+        return delay, 200
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            #headers and body go out in separate writes; without TCP_NODELAY every
+            #keep-alive response stalls ~40 ms on Nagle + delayed ACK
+            disable_nagle_algorithm = True
+
+            def _send(self, status, body=None, headers=None):
+                data = json.dumps(body).encode('utf-8') if body is not None else b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = parse_qs(url.query)
+                delay, status = stub._roll()
+                if delay:
+                    time.sleep(delay)
+
+                if status == 429:
+                    return self._send(429, {'cod': 429, 'message': 'rate limited'},
+                                      {'Retry-After': str(stub.retry_after)})
+                if status == 500:
+                    return self._send(500, {'cod': 500, 'message': 'internal error'})
+
+                #observation time advances every 10 minutes, like OWM's
+                dt = int(time.time()) // 600 * 600
+                path = url.path.rstrip('/')
+
+                if path.endswith('/weather') and 'q' in params:
+                    name = params['q'][0]
+                    owm_id = city_id(name)
+                    with stub.lock:
+                        stub.names[owm_id] = name
+                    return self._send(200, payload(name, owm_id, dt))
+
+                if path.endswith('/weather') and 'id' in params:
+                    owm_id = int(params['id'][0])
+                    return self._send(200, payload(stub.names.get(owm_id, str(owm_id)), owm_id, dt))
+
+                if path.endswith('/history/city') and ('q' in params or 'id' in params):
+                    owm_id = int(params['id'][0]) if 'id' in params else city_id(params['q'][0])
+                    start = int(params.get('start', ['0'])[0])
+                    end = int(params.get('end', [str(dt)])[0])
+                    first = -(-start // 3600) * 3600
+                    hours = range(first, min(end, dt) + 1, 3600)[:HISTORY_MAX_ENTRIES]
+                    items = [history_item(owm_id, hour) for hour in hours]
+                    return self._send(200, {'cod': '200', 'city_id': owm_id, 'cnt': len(items), 'list': items})
+
+                if path.endswith('/group') and 'id' in params:
+                    ids = [int(i) for i in params['id'][0].split(',') if i]
+                    items = [payload(stub.names.get(i, str(i)), i, dt) for i in ids]
+                    return self._send(200, {'cnt': len(items), 'list': items})
+
+                self._send(404, {'cod': '404', 'message': 'city not found'})
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake OpenWeatherMap API")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--throttle-rate', type=float, default=0)
+    parser.add_argument('--retry-after', type=int, default=1)
+    args = parser.parse_args()
+
+    stub = OWMStub(args.port, args.latency_ms / 1000, args.jitter_ms / 1000,
+                   args.error_rate, args.throttle_rate, args.retry_after)
+    print(f"Fake OWM API on {stub.url} (OWM_API_ROOT={stub.url})")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Cold-start benchmark for the pipeline entry points
+
+Imports each entry module in a fresh interpreter with `-X importtime` and
+fails (exit 1) when:
+
+- a module that must stay lazy (pandas, pyarrow, SQLAlchemy, torch) is
+  imported at startup, or
+- the cumulative import time exceeds the stored baseline by more than the
+  allowed tolerance (relative, plus a small absolute slack).
+
+    python3 benchmarks/startup.py            # check against the baseline
+    python3 benchmarks/startup.py --update   # record a new baseline
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, 'src')
+BASELINE = os.path.join(ROOT, 'benchmarks', 'startup_baseline.json')
+
+#entry module -> top-level packages it must not import eagerly
+ENTRY_POINTS = {
+    'extract': ['pandas', 'pyarrow', 'sqlalchemy', 'torch'],
+    'stream': ['pandas', 'pyarrow', 'sqlalchemy', 'torch'],
+    'load': ['pandas', 'pyarrow', 'torch'],
+}
+
+
+def measure(module, repeats):
+    """Best-of-N cumulative import time (ms) and the top-level packages loaded"""
+    best = None
+    loaded = set()
+
+    #run in a scratch directory so log files and caches stay out of the repo
+    with tempfile.TemporaryDirectory() as workdir:
+        env = {**os.environ, 'PYTHONPATH': SRC}
+
+        for _ in range(repeats):
+            result = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                cwd=workdir, env=env, capture_output=True, text=True
+            )
+            if result.returncode != 0:
+                raise RuntimeError(f"import {module} failed:\n{result.stderr}")
+
+            for line in result.stderr.splitlines():
+                if not line.startswith('import time:') or '|' not in line:
+                    continue
+                _, cumulative, name = [part.strip() for part in line[len('import time:'):].split('|')]
+                if not cumulative.isdigit():
+                    continue
+                loaded.add(name.split('.')[0])
+                if name == module:
+                    ms = int(cumulative) / 1000
+                    best = ms if best is None else min(best, ms)
+
+    return best, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check entry-point cold start against the baseline")
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help="Fail when import time exceeds baseline x tolerance")
+    parser.add_argument('--slack-ms', type=float, default=50,
+                        help="Absolute allowance on top of the tolerance, for noisy runners")
+    parser.add_argument('--update', action='store_true', help="Write the measured times as the new baseline")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+
+    failures = []
+    measured = {}
+    for module, forbidden in ENTRY_POINTS.items():
+        ms, loaded = measure(module, args.repeats)
+        measured[module] = round(ms, 1)
+
+        eager = sorted(set(forbidden) & loaded)
+        if eager:
+            failures.append(f"{module}: imports {', '.join(eager)} at startup")
+
+        limit = baseline.get(module, {}).get('import_ms')
+        status = ''
+        if limit is not None:
+            status = f"(baseline {limit:.1f} ms)"
+            if ms > limit * args.tolerance + args.slack_ms:
+                failures.append(f"{module}: {ms:.1f} ms > {args.tolerance}x baseline {limit:.1f} ms + {args.slack_ms:.0f} ms")
+        print(f"{module:<10} {ms:8.1f} ms {status}")
+
+    if args.update:
+        with open(BASELINE, 'w') as f:
+            json.dump({module: {'import_ms': ms} for module, ms in measured.items()}, f, indent=2)
+            f.write('\n')
+        print(f"Baseline written to {BASELINE}")
+
+    if failures:
+        print("\nStartup regression:")
+        for failure in failures:
+            print(f"  - {failure}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
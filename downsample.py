@@ -0,0 +1,101 @@
+"""
+Server-side downsampling of time series for the dashboard charts
+
+A year of hourly readings for thousands of cities is millions of points,
+far more than a chart can show. Series are reduced to a point budget before
+they are sent to the browser:
+
+- lttb: Largest-Triangle-Three-Buckets, keeps the points that shape the line
+- min_max: the lowest and highest point of each bucket, keeps every extreme
+"""
+
+import numpy as np
+
+METHODS = ('lttb', 'min_max')
+
+
+def lttb(x, y, points):
+    """Indices of the points Largest-Triangle-Three-Buckets keeps
+
+    Args:
+        x, y: Float arrays of the same length, x ascending, no NaNs
+        points: Number of points to keep (first and last are always kept)
+    Returns:
+        Ascending index array
+    """
+    n = len(x)
+    if points >= n or points < 3:
+        return np.arange(n)
+
+    #points - 2 buckets over the interior points; every bucket is non-empty since points < n
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    sizes = np.diff(edges)
+    mean_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / sizes
+    mean_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / sizes
+    #the third corner of each triangle is the next bucket's mean (the last point for the last bucket)
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.append(mean_y[1:], y[-1])
+
+    selected = np.empty(points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+        area = np.abs((x[a] - next_x[i]) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y[i] - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def min_max(x, y, points):
+    """Indices of the minimum and maximum of each of points // 2 buckets
+
+    Args:
+        x, y: Arrays of the same length, x ascending, no NaNs in y
+        points: Approximate number of points to keep
+    Returns:
+        Ascending index array, including the first and last point
+    """
+    n = len(y)
+    buckets = points // 2
+    if buckets < 1 or points >= n:
+        return np.arange(n)
+
+    bucket = (np.arange(n) * buckets) // n
+    #sorted by (bucket, y): each bucket's first entry is its minimum, its last the maximum
+    order = np.lexsort((y, bucket))
+    starts = np.flatnonzero(np.r_[True, bucket[order][1:] != bucket[order][:-1]])
+    ends = np.r_[starts[1:], n] - 1
+    return np.unique(np.concatenate([[0, n - 1], order[starts], order[ends]]))
+
+
+def decimate(df, x, y, by=None, points=5000, method='lttb'):
+    """Downsample every series in a long-format DataFrame
+
+    Args:
+        df: One row per reading
+        x: Time column
+        y: Value column (rows where it is missing are dropped)
+        by: Optional series column, e.g. city_name; the point budget is split across series
+        points: Total number of points to keep
+        method: 'lttb' or 'min_max'
+    Returns:
+        The kept rows, sorted by series and time
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown downsampling method: {method}")
+    pick = lttb if method == 'lttb' else min_max
+
+    df = df.dropna(subset=[y]).sort_values([by, x] if by else [x], kind='stable', ignore_index=True)
+    if len(df) <= points:
+        return df
+
+    xs = df[x].to_numpy(dtype='datetime64[ns]').astype('int64').astype('float64')
+    ys = df[y].to_numpy(dtype='float64')
+    groups = df.groupby(by, sort=False).indices.values() if by else [np.arange(len(df))]
+    groups = list(groups)
+    per_series = max(points // len(groups), 3)
+
+    keep = [rows[pick(xs[rows], ys[rows], per_series)] for rows in groups]
+    return df.take(np.sort(np.concatenate(keep)))
@@ -0,0 +1,206 @@
+"""
+Per-process buffer of recent observations for the Streamlit dashboard
+
+The buffer is filled once with the last DASHBOARD_BUFFER_HOURS of
+weather_data, then each refresh only asks the database for rows with an id
+above the highest one it has seen, so the cost of a refresh depends on how
+many rows arrived since the last one, not on the size of the history. ids
+are handed out when a row is inserted, not when its transaction commits, so
+a refresh also re-reads the last DASHBOARD_REREAD_IDS ids below that mark
+and skips the ones it already holds; a slow loader transaction that commits
+after a faster one is picked up on the next refresh instead of being lost.
+
+Rows are kept in a ring of hourly slots keyed by observation hour. Slots
+that fall out of the window are dropped whole, and if the buffer grows past
+DASHBOARD_BUFFER_MAX_ROWS the oldest slots go first. Widgets whose time
+window is fully covered are answered from memory (see covers()); anything
+older still goes to queries.py.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pandas as pd
+import queries
+
+BUFFER_HOURS = int(os.getenv('DASHBOARD_BUFFER_HOURS', 24 * 7))
+BUFFER_MAX_ROWS = int(os.getenv('DASHBOARD_BUFFER_MAX_ROWS', 1000000))
+REFRESH_SECONDS = int(os.getenv('DASHBOARD_REFRESH_SECONDS', 60))
+REREAD_IDS = int(os.getenv('DASHBOARD_REREAD_IDS', 20000))
+
+ROW_COLUMNS = ['city_name', 'temperature', 'feels_like', 'humidity', 'pressure',
+               'weather_description', 'wind_speed', 'timestamp']
+
+
+def _hour(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+class ObservationBuffer:
+    """Recent weather_data rows held in memory and topped up incrementally
+
+    Args:
+        engine: SQLAlchemy engine for weather_data
+        hours: Window kept in memory, in hours
+        max_rows: Upper bound on buffered rows
+        refresh_interval: Minimum seconds between two database round trips
+        reread_ids: How far below the highest seen id each refresh reads again
+    """
+
+    def __init__(self, engine, hours=BUFFER_HOURS, max_rows=BUFFER_MAX_ROWS, refresh_interval=REFRESH_SECONDS,
+                 reread_ids=REREAD_IDS):
+        self.engine = engine
+        self.window = timedelta(hours=hours)
+        self.max_rows = max_rows
+        self.refresh_interval = refresh_interval
+        self.reread_ids = reread_ids
+        self.slots = {}
+        self.rows = 0
+        self.last_id = None
+        self.recent_ids = set()
+        self.floor = None
+        self.refreshed_at = None
+        self.version = None
+        self.frame_cache = None
+        self.lock = threading.Lock()
+
+    def refresh(self, version=None, force=False):
+        """Fetch rows loaded since the last refresh and evict expired slots
+
+        Args:
+            version: Current data version (see query_cache.py); when it has not
+                     changed since the last refresh there is nothing new to fetch
+            force: Skip the refresh_interval check (the dashboard's refresh button)
+        Returns:
+            Number of new rows fetched
+        """
+        with self.lock:
+            now = time.monotonic()
+            if not force and self.refreshed_at is not None and now - self.refreshed_at < self.refresh_interval:
+                return 0
+            #timestamps are stored as naive UTC
+            cutoff = _hour(datetime.now(timezone.utc).replace(tzinfo=None) - self.window)
+            if version is not None and version == self.version:
+                self._evict(cutoff)
+                return 0
+
+            after_id = None if self.last_id is None else max(self.last_id - self.reread_ids, 0)
+            new = queries.weather_rows_after(self.engine, after_id=after_id, since=cutoff)
+            self.refreshed_at = now
+            self.version = version
+
+            if self.recent_ids:
+                new = new[~new['id'].isin(self.recent_ids)]
+            if not new.empty:
+                new['timestamp'] = pd.to_datetime(new['timestamp'])
+                self.last_id = max(self.last_id or 0, int(new['id'].max()))
+                for hour, chunk in new.groupby(new['timestamp'].dt.floor('h')):
+                    self.slots.setdefault(hour.to_pydatetime(), []).append(chunk)
+                self.rows += len(new)
+                self.frame_cache = None
+                low = self.last_id - self.reread_ids
+                self.recent_ids = {i for i in self.recent_ids if i > low}
+                self.recent_ids.update(int(i) for i in new['id'] if i > low)
+            elif self.last_id is None:
+                #empty table: remember that the window has been read
+                self.last_id = 0
+
+            self._evict(cutoff)
+            return len(new)
+
+    def _evict(self, cutoff):
+        """Drop slots older than cutoff, then the oldest ones over max_rows"""
+        floor = cutoff
+        evicted = False
+        for hour in sorted(self.slots):
+            if hour >= cutoff and self.rows <= self.max_rows:
+                break
+            self.rows -= sum(len(chunk) for chunk in self.slots.pop(hour))
+            floor = max(floor, hour + timedelta(hours=1))
+            evicted = True
+        if evicted:
+            self.frame_cache = None
+        self.floor = max(floor, self.floor) if self.floor is not None else floor
+
+    def covers(self, since):
+        """True if every observation at or after since is in the buffer"""
+        return since is not None and self.floor is not None and since >= self.floor
+
+    def frame(self, cities=None, since=None):
+        """Buffered rows, optionally filtered by city and start time"""
+        with self.lock:
+            if self.frame_cache is None:
+                chunks = [chunk for hour in sorted(self.slots) for chunk in self.slots[hour]]
+                self.frame_cache = (pd.concat(chunks, ignore_index=True) if chunks
+                                    else pd.DataFrame(columns=queries.BUFFER_COLUMNS)
+                                    .astype({'timestamp': 'datetime64[ns]'}))
+            df = self.frame_cache
+
+        mask = pd.Series(True, index=df.index)
+        if cities:
+            mask &= df['city_name'].isin(cities)
+        if since is not None:
+            mask &= df['timestamp'] >= since
+        return df[mask]
+
+    #in-memory versions of the queries.py functions the dashboard calls, same return shapes
+
+    def record_count(self, cities=None, since=None):
+        return len(self.frame(cities, since))
+
+    def summary_metrics(self, cities=None, since=None):
+        df = self.frame(cities, since)
+        temps = df.dropna(subset=['temperature'])
+        extremes = {}
+        for name, pick in (('hottest', 'idxmax'), ('coldest', 'idxmin')):
+            row = temps.loc[getattr(temps['temperature'], pick)()] if not temps.empty else None
+            extremes[name] = {'city_name': row['city_name'], 'temperature': row['temperature']} if row is not None else None
+
+        return {
+            'total_cities': int(df['city_name'].nunique()),
+            'avg_temperature': temps['temperature'].mean() if not temps.empty else None,
+            **extremes
+        }
+
+    def mean_by_city(self, column, cities=None, since=None):
+        if column not in queries.NUMERIC_COLUMNS:
+            raise ValueError(f"Unsupported column: {column}")
+        df = self.frame(cities, since)
+        means = df.groupby('city_name')[column].mean().sort_values(ascending=False)
+        return means.reset_index()
+
+    def condition_counts(self, cities=None, since=None):
+        counts = self.frame(cities, since)['weather_main'].value_counts(dropna=False)
+        return counts.rename_axis('weather_main').reset_index(name='count')
+
+    def _ordered_rows(self, cities, since, city_order):
+        """Rows in queries.weather_rows_page order: city_order's cities first, then by city_id, newest first"""
+        df = self.frame(cities, since)
+        pinned = {city_id: i for i, city_id in enumerate(city_order or [])}
+        rank = df['city_id'].map(pinned).fillna(len(pinned)).to_numpy()
+        timestamps = df['timestamp'].to_numpy(dtype='datetime64[ns]').astype('int64')
+        order = np.lexsort((-timestamps, df['city_id'].to_numpy(), rank))
+        return df[['city_id'] + ROW_COLUMNS].take(order).reset_index(drop=True), rank[order], timestamps[order]
+
+    def weather_rows_page(self, cities=None, since=None, limit=100, after=None, city_order=None):
+        rows, rank, timestamps = self._ordered_rows(cities, since, city_order)
+        if after is not None:
+            after_city, after_ts = after
+            pinned = list(city_order or [])
+            after_rank = pinned.index(after_city) if after_city in pinned else len(pinned)
+            city = rows['city_id'].to_numpy()
+            same = (rank == after_rank) & (city == after_city)
+            later = (rank > after_rank) | ((rank == after_rank) & (city > after_city))
+            rows = rows[later | (same & (timestamps < pd.Timestamp(after_ts).value))]
+        return rows.head(limit).reset_index(drop=True)
+
+    def iter_weather_rows(self, cities=None, since=None, city_order=None, chunksize=50000):
+        rows = self._ordered_rows(cities, since, city_order)[0][ROW_COLUMNS]
+        for start in range(0, len(rows), chunksize):
+            yield rows.iloc[start:start + chunksize]
+
+    def series(self, column, cities=None, since=None):
+        """Long-format city_name / timestamp / column rows for the time-series chart"""
+        return self.frame(cities, since)[['city_name', 'timestamp', column]]
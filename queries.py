@@ -0,0 +1,377 @@
+"""
+Query layer for the Streamlit dashboard
+
+Every widget gets its own query with the city filter, the time window and
+the aggregation pushed down into PostgreSQL, so each call returns only the
+handful of rows it renders instead of the full weather history.
+"""
+
+import pandas as pd
+from sqlalchemy import bindparam, text
+
+#columns that may be averaged per city (whitelisted because they are formatted into SQL)
+NUMERIC_COLUMNS = {'temperature', 'feels_like', 'humidity', 'pressure', 'wind_speed', 'cloudiness', 'visibility'}
+
+#metrics kept in the weather_hourly / weather_daily rollups (see src/rollups.py)
+ROLLUP_METRICS = {'temperature', 'humidity', 'wind_speed', 'pressure'}
+ROLLUP_TABLES = {'hour': 'weather_hourly', 'day': 'weather_daily'}
+
+#columns of weather_rows_after, i.e. of every row the dashboard's ObservationBuffer holds
+BUFFER_COLUMNS = ['id', 'city_id', 'city_name', 'timestamp', 'temperature', 'feels_like', 'temp_min', 'temp_max',
+                  'humidity', 'pressure', 'weather_main', 'weather_description', 'wind_speed',
+                  'cloudiness', 'visibility']
+
+
+def _where(cities=None, since=None, alias='w', time_column='timestamp', after_id=None):
+    """Build the WHERE clause shared by all dashboard queries
+
+    Args:
+        cities: Optional list of city names to keep
+        since: Optional datetime; only rows at or after it are kept
+        after_id: Optional row id; only rows with a larger id are kept
+    Returns:
+        (sql, params, bindparams)
+    """
+    clauses = []
+    params = {}
+    binds = []
+
+    if cities:
+        clauses.append("c.city_name IN :cities")
+        params['cities'] = list(cities)
+        binds.append(bindparam('cities', expanding=True))
+
+    if since is not None:
+        clauses.append(f"{alias}.{time_column} >= :since")
+        params['since'] = since
+
+    if after_id is not None:
+        clauses.append(f"{alias}.id > :after_id")
+        params['after_id'] = after_id
+
+    sql = ("WHERE " + " AND ".join(clauses)) if clauses else ""
+    return sql, params, binds
+
+
+def _read(engine, sql, params, binds):
+    query = text(sql)
+    if binds:
+        query = query.bindparams(*binds)
+    with engine.connect() as conn:
+        return pd.read_sql(query, conn, params=params)
+
+
+def data_version(engine):
+    """Current data version, bumped by the loader after each committed load (0 if never bumped)"""
+    versions = _read(engine, "SELECT version FROM data_version WHERE id = 1", {}, [])['version']
+    return int(versions.iloc[0]) if not versions.empty else 0
+
+
+def list_cities(engine):
+    """All city names, sorted"""
+    return _read(engine, "SELECT city_name FROM cities ORDER BY city_name", {}, [])['city_name'].tolist()
+
+
+def city_ids(engine, names):
+    """city_ids of the given city names, in the same order; unknown names are left out"""
+    if not names:
+        return []
+    df = _read(engine, "SELECT city_id, city_name FROM cities WHERE city_name IN :names",
+               {'names': list(names)}, [bindparam('names', expanding=True)])
+    ids = dict(zip(df['city_name'], df['city_id']))
+    return [int(ids[name]) for name in names if name in ids]
+
+
+def record_count(engine, cities=None, since=None):
+    """Number of weather rows matching the filters"""
+    where, params, binds = _where(cities, since)
+    sql = f"""
+    SELECT COUNT(*) AS records
+    FROM weather_data w
+    JOIN cities c ON w.city_id = c.city_id
+    {where}
+    """
+    return int(_read(engine, sql, params, binds)['records'].iloc[0])
+
+
+def summary_metrics(engine, cities=None, since=None):
+    """Headline metrics: city count, average temperature, hottest and coldest reading
+
+    Returns:
+        Dictionary with total_cities, avg_temperature, hottest and coldest
+        (the last two are dicts with city_name and temperature, or None)
+    """
+    where, params, binds = _where(cities, since)
+    totals = _read(engine, f"""
+    SELECT COUNT(DISTINCT w.city_id) AS total_cities, AVG(w.temperature) AS avg_temperature
+    FROM weather_data w
+    JOIN cities c ON w.city_id = c.city_id
+    {where}
+    """, params, binds).iloc[0]
+
+    extremes = {}
+    for name, order in (('hottest', 'DESC'), ('coldest', 'ASC')):
+        row = _read(engine, f"""
+        SELECT c.city_name, w.temperature
+        FROM weather_data w
+        JOIN cities c ON w.city_id = c.city_id
+        {where}
+        ORDER BY w.temperature {order} NULLS LAST
+        LIMIT 1
+        """, params, binds)
+        extremes[name] = row.iloc[0].to_dict() if not row.empty else None
+
+    return {
+        'total_cities': int(totals['total_cities']),
+        'avg_temperature': totals['avg_temperature'],
+        **extremes
+    }
+
+
+def mean_by_city(engine, column, cities=None, since=None):
+    """Average of one numeric column per city, highest first"""
+    if column not in NUMERIC_COLUMNS:
+        raise ValueError(f"Unsupported column: {column}")
+
+    where, params, binds = _where(cities, since)
+    sql = f"""
+    SELECT c.city_name, AVG(w.{column}) AS {column}
+    FROM weather_data w
+    JOIN cities c ON w.city_id = c.city_id
+    {where}
+    GROUP BY c.city_name
+    ORDER BY {column} DESC
+    """
+    return _read(engine, sql, params, binds)
+
+
+def condition_counts(engine, cities=None, since=None):
+    """Number of observations per weather condition"""
+    where, params, binds = _where(cities, since)
+    sql = f"""
+    SELECT w.weather_main, COUNT(*) AS count
+    FROM weather_data w
+    JOIN cities c ON w.city_id = c.city_id
+    {where}
+    GROUP BY w.weather_main
+    ORDER BY count DESC
+    """
+    return _read(engine, sql, params, binds)
+
+
+def temperature_ranges(engine, cities=None, since=None):
+    """Lowest minimum, highest maximum and mean temperature per city"""
+    where, params, binds = _where(cities, since)
+    sql = f"""
+    SELECT c.city_name,
+           MIN(w.temp_min) AS temp_min,
+           MAX(w.temp_max) AS temp_max,
+           AVG(w.temperature) AS temperature
+    FROM weather_data w
+    JOIN cities c ON w.city_id = c.city_id
+    {where}
+    GROUP BY c.city_name
+    ORDER BY c.city_name
+    """
+    return _read(engine, sql, params, binds)
+
+
+def rollup_mean_by_city(engine, column, cities=None, since=None, grain='hour'):
+    """Average of one metric per city, read from the hourly or daily rollup
+
+    Bucket means are weighted by their sample counts, so the result matches
+    an average over the raw rows in the same buckets.
+    """
+    if column not in ROLLUP_METRICS:
+        raise ValueError(f"Unsupported rollup metric: {column}")
+
+    where, params, binds = _where(cities, since, alias='r', time_column='bucket')
+    sql = f"""
+    SELECT c.city_name, SUM(r.{column}_avg * r.sample_count) / SUM(r.sample_count) AS {column}
+    FROM {ROLLUP_TABLES[grain]} r
+    JOIN cities c ON r.city_id = c.city_id
+    {where}
+    GROUP BY c.city_name
+    ORDER BY {column} DESC
+    """
+    return _read(engine, sql, params, binds)
+
+
+def rollup_temperature_ranges(engine, cities=None, since=None, grain='hour'):
+    """Same as temperature_ranges, read from the hourly or daily rollup"""
+    where, params, binds = _where(cities, since, alias='r', time_column='bucket')
+    sql = f"""
+    SELECT c.city_name,
+           MIN(r.temp_min) AS temp_min,
+           MAX(r.temp_max) AS temp_max,
+           SUM(r.temperature_avg * r.sample_count) / SUM(r.sample_count) AS temperature
+    FROM {ROLLUP_TABLES[grain]} r
+    JOIN cities c ON r.city_id = c.city_id
+    {where}
+    GROUP BY c.city_name
+    ORDER BY c.city_name
+    """
+    return _read(engine, sql, params, binds)
+
+
+def latest_per_city(engine, cities=None):
+    """Most recent observation for each city, read from the latest_weather table"""
+    where, params, binds = _where(cities, alias='l')
+    sql = f"""
+    SELECT c.city_name, c.country, c.latitude, c.longitude,
+           l.timestamp, l.temperature, l.feels_like, l.humidity,
+           l.weather_main, l.weather_description, l.wind_speed
+    FROM latest_weather l
+    JOIN cities c ON l.city_id = c.city_id
+    {where}
+    ORDER BY c.city_name
+    """
+    return _read(engine, sql, params, binds)
+
+
+def _weather_rows_sql(where, order="w.timestamp DESC"):
+    return f"""
+    SELECT c.city_name, w.temperature, w.feels_like, w.humidity, w.pressure,
+           w.weather_description, w.wind_speed, w.timestamp
+    FROM weather_data w
+    JOIN cities c ON w.city_id = c.city_id
+    {where}
+    ORDER BY {order}
+    """
+
+
+def weather_rows(engine, cities=None, since=None):
+    """Raw observations for the data table, newest first"""
+    where, params, binds = _where(cities, since)
+    return _read(engine, _weather_rows_sql(where), params, binds)
+
+
+def _rows_page(engine, cities, since, limit, clause, params, binds, order):
+    """Up to limit data table rows (plus city_id) matching the filters and an extra clause"""
+    where, filter_params, filter_binds = _where(cities, since)
+    if clause:
+        where = f"{where} AND {clause}" if where else f"WHERE {clause}"
+    params = {**filter_params, **params, 'limit': int(limit)}
+    sql = f"""
+    SELECT w.city_id, c.city_name, w.temperature, w.feels_like, w.humidity, w.pressure,
+           w.weather_description, w.wind_speed, w.timestamp
+    FROM weather_data w
+    JOIN cities c ON w.city_id = c.city_id
+    {where}
+    ORDER BY {order}
+    LIMIT :limit
+    """
+    return _read(engine, sql, params, filter_binds + binds)
+
+
+def weather_rows_page(engine, cities=None, since=None, limit=100, after=None, city_order=None):
+    """One page of raw observations for the data table
+
+    Rows go city by city, each city's rows newest first: the cities in
+    city_order first, in that order, then every other city by city_id. A page
+    starts right after the previous page's last row (keyset pagination), so
+    each query is a range scan on ux_weather_data_city_timestamp no matter how
+    deep the page is.
+
+    Args:
+        limit: Page size
+        after: (city_id, timestamp) of the previous page's last row, None for the first page
+        city_order: Optional list of city_ids shown first, in that order
+    Returns:
+        DataFrame with city_id and the data table columns
+    """
+    pinned = list(city_order or [])
+    after_city, after_ts = after if after is not None else (None, None)
+    if after_city is None:
+        first = 0
+    else:
+        first = pinned.index(after_city) if after_city in pinned else len(pinned)
+
+    pages = []
+    remaining = int(limit)
+    #the few pinned cities are read one at a time, each from its own index range
+    for city_id in pinned[first:]:
+        clause, params = "w.city_id = :city_id", {'city_id': city_id}
+        if city_id == after_city:
+            clause += " AND w.timestamp < :after_ts"
+            params['after_ts'] = after_ts
+        page = _rows_page(engine, cities, since, remaining, clause, params, [], "w.timestamp DESC")
+        if not page.empty:
+            pages.append(page)
+        remaining -= len(page)
+        if remaining <= 0:
+            return pd.concat(pages, ignore_index=True)
+
+    clauses, params, binds = [], {}, []
+    if pinned:
+        clauses.append("w.city_id NOT IN :pinned")
+        params['pinned'] = pinned
+        binds.append(bindparam('pinned', expanding=True))
+    if after_city is not None and after_city not in pinned:
+        clauses.append("(w.city_id > :after_city OR (w.city_id = :after_city AND w.timestamp < :after_ts))")
+        params.update(after_city=after_city, after_ts=after_ts)
+    rest = _rows_page(engine, cities, since, remaining, " AND ".join(clauses), params, binds,
+                      "w.city_id, w.timestamp DESC")
+    if not pages:
+        return rest
+    return pd.concat(pages + [rest] if not rest.empty else pages, ignore_index=True)
+
+
+def iter_weather_rows(engine, cities=None, since=None, city_order=None, chunksize=50000):
+    """Raw observations for the CSV export, in DataFrame chunks
+
+    Walks the same keyset pages as the data table, so the export never holds
+    more than one chunk in memory and never sorts the whole result.
+    """
+    after = None
+    while True:
+        chunk = weather_rows_page(engine, cities, since, chunksize, after, city_order)
+        if chunk.empty:
+            return
+        last = chunk.iloc[-1]
+        after = (int(last['city_id']), pd.Timestamp(last['timestamp']).to_pydatetime())
+        yield chunk.drop(columns='city_id')
+        if len(chunk) < chunksize:
+            return
+
+
+def rollup_series(engine, column, cities=None, since=None, grain='hour'):
+    """Per-city time series of one metric from the hourly or daily rollup
+
+    Returns:
+        DataFrame with city_name, timestamp (bucket start) and the metric's bucket mean
+    """
+    if column not in ROLLUP_METRICS:
+        raise ValueError(f"Unsupported rollup metric: {column}")
+
+    where, params, binds = _where(cities, since, alias='r', time_column='bucket')
+    sql = f"""
+    SELECT c.city_name, r.bucket AS timestamp, r.{column}_avg AS {column}
+    FROM {ROLLUP_TABLES[grain]} r
+    JOIN cities c ON r.city_id = c.city_id
+    {where}
+    ORDER BY c.city_name, r.bucket
+    """
+    return _read(engine, sql, params, binds)
+
+
+def weather_rows_after(engine, after_id=None, since=None):
+    """Observations loaded after a given row id, in load order
+
+    Used by the dashboard's ObservationBuffer to fetch only what is new since
+    its last refresh. ids grow with every insert, so this also picks up late
+    observations whose timestamp is older than ones already seen; since bounds
+    the scan to the partitions inside the buffer window. ids are assigned at
+    insert, not commit, so callers pass an after_id some way below the highest
+    id they hold and drop the rows they already have.
+    """
+    where, params, binds = _where(since=since, after_id=after_id)
+    columns = ', '.join('c.city_name' if col == 'city_name' else f'w.{col}' for col in BUFFER_COLUMNS)
+    sql = f"""
+    SELECT {columns}
+    FROM weather_data w
+    JOIN cities c ON w.city_id = c.city_id
+    {where}
+    ORDER BY w.id
+    """
+    return _read(engine, sql, params, binds)
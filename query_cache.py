@@ -0,0 +1,377 @@
+"""
+Shared result cache for the dashboard's queries
+
+Every dashboard session and replica asks the database the same handful of
+questions, so results are cached in a store they can all reach. Entries are
+keyed by the query name, its parameters and the current data version (the
+data_version row the loader bumps after each committed load), so they stay
+valid until new data arrives and nothing has to be cleared by hand. When an
+entry is missing, one caller computes it while the others wait for the
+result, so N viewers cost about one database query per refresh.
+
+Backends (QUERY_CACHE):
+- memory: in-process LRU, shared by the sessions of one replica
+- disk: SQLite file at QUERY_CACHE_PATH, shared by replicas on one host
+- redis: any Redis-compatible server at QUERY_CACHE_URL, shared by all
+  replicas; QUERY_CACHE_URL=local:// uses LocalRedis, an in-process
+  stand-in with the same commands, for development
+- none: no caching
+
+Entries are stored as bytes, DataFrames as Arrow IPC streams and any other
+result as JSON. Nothing is pickled: a shared store (e.g. Redis) is writable
+by more than this dashboard, and unpickling an entry would run whatever code
+was put there.
+
+Settings are in src/config.py.
+"""
+
+import functools
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from config import (QUERY_CACHE, QUERY_CACHE_PATH, QUERY_CACHE_URL, QUERY_CACHE_SIZE, QUERY_CACHE_TTL,
+                    DATA_VERSION_CHECK_SECONDS)
+
+#how long other callers wait for the one computing a missing entry
+COMPUTE_LOCK_SECONDS = 30
+
+#version used while the data_version table cannot be read: plain time buckets, like a TTL
+FALLBACK_VERSION_SECONDS = 300
+
+#prefix of a stored entry, naming its format
+ARROW_FORMAT = b'arrow:'
+JSON_FORMAT = b'json:'
+
+#returned by QueryCache._get for a missing entry (a cached result may be None)
+_MISSING = object()
+
+logger = logging.getLogger(__name__)
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"{type(value).__name__} cannot be stored in the query cache")
+
+
+def dumps(result):
+    """Serialize a query result: a DataFrame as an Arrow IPC stream, anything else as JSON"""
+    if isinstance(result, pd.DataFrame):
+        table = pa.Table.from_pandas(result)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return ARROW_FORMAT + sink.getvalue().to_pybytes()
+    return JSON_FORMAT + json.dumps(result, default=_json_default).encode('utf-8')
+
+
+def loads(value):
+    """Inverse of dumps; raises ValueError for anything dumps did not write"""
+    value = bytes(value)
+    if value.startswith(ARROW_FORMAT):
+        with pa.ipc.open_stream(value[len(ARROW_FORMAT):]) as reader:
+            return reader.read_pandas()
+    if value.startswith(JSON_FORMAT):
+        return json.loads(value[len(JSON_FORMAT):])
+    raise ValueError("unknown query cache entry format")
+
+
+class MemoryBackend:
+    """Thread-safe in-process LRU with per-entry expiry"""
+
+    def __init__(self, max_entries=QUERY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.entries[key] = (time.time() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def add(self, key, value, ttl):
+        """Set key only if it is absent; True if this call set it"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] >= time.time():
+                return False
+            self.entries[key] = (time.time() + ttl, value)
+            return True
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+class SQLiteBackend:
+    """SQLite-file backend shared by every process on the same machine"""
+
+    #expired rows are purged once every this many writes
+    PURGE_EVERY = 200
+
+    def __init__(self, path=QUERY_CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)")
+        self.lock = threading.Lock()
+        self.writes = 0
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM entries WHERE key = ? AND expires >= ?",
+                                    (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO entries (key, value, expires) VALUES (?, ?, ?)",
+                              (key, value, time.time() + ttl))
+            self._purge()
+
+    def add(self, key, value, ttl):
+        """Set key only if it is absent; True if this call set it"""
+        with self.lock:
+            now = time.time()
+            self.conn.execute("DELETE FROM entries WHERE key = ? AND expires < ?", (key, now))
+            inserted = self.conn.execute("INSERT OR IGNORE INTO entries (key, value, expires) VALUES (?, ?, ?)",
+                                         (key, value, now + ttl)).rowcount
+            return inserted == 1
+
+    def delete(self, key):
+        with self.lock:
+            self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def _purge(self):
+        self.writes += 1
+        if self.writes % self.PURGE_EVERY == 0:
+            self.conn.execute("DELETE FROM entries WHERE expires < ?", (time.time(),))
+
+    def close(self):
+        self.conn.close()
+
+
+class LocalRedis:
+    """In-process stand-in for the few Redis commands RedisBackend uses"""
+
+    def __init__(self):
+        self.memory = MemoryBackend(max_entries=QUERY_CACHE_SIZE)
+
+    def get(self, key):
+        return self.memory.get(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        ttl = ex if ex is not None else QUERY_CACHE_TTL
+        if nx:
+            return True if self.memory.add(key, value, ttl) else None
+        self.memory.set(key, value, ttl)
+        return True
+
+    def delete(self, key):
+        self.memory.delete(key)
+        return 1
+
+
+class RedisBackend:
+    """Backend for any Redis-compatible server (Redis, Valkey, KeyDB, ...)
+
+    Args:
+        client: redis.Redis client or a LocalRedis stand-in
+        prefix: Namespace for this dashboard's keys
+    """
+
+    def __init__(self, client, prefix='weather:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, value, ex=max(1, int(ttl)))
+
+    def add(self, key, value, ttl):
+        """Set key only if it is absent; True if this call set it"""
+        return bool(self.client.set(self.prefix + key, value, ex=max(1, int(ttl)), nx=True))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    @classmethod
+    def from_url(cls, url=QUERY_CACHE_URL):
+        if url.startswith('local://'):
+            return cls(LocalRedis())
+        import redis
+
+        return cls(redis.Redis.from_url(url))
+
+
+class QueryCache:
+    """Version-keyed, single-flight result cache on top of a backend
+
+    Args:
+        backend: MemoryBackend, SQLiteBackend or RedisBackend
+        version_source: Callable returning the current data version from the database
+        ttl: Seconds an entry is kept even if the version never changes
+        version_check: Seconds a data version is reused before checking again
+    """
+
+    def __init__(self, backend, version_source, ttl=QUERY_CACHE_TTL, version_check=DATA_VERSION_CHECK_SECONDS):
+        self.backend = backend
+        self.version_source = version_source
+        self.ttl = ttl
+        self.version_check = version_check
+        self.local_version = None
+        self.local_version_at = 0
+        self.lock = threading.Lock()
+        self.key_locks = [threading.Lock() for _ in range(64)]
+        self.hits = 0
+        self.misses = 0
+
+    def _read_version(self):
+        try:
+            return str(self.version_source())
+        except Exception as e:
+            logger.warning(f"Cannot read data version, caching by time instead: {e}")
+            return f"t{int(time.time() // FALLBACK_VERSION_SECONDS)}"
+
+    def version(self, refresh=False):
+        """Current data version
+
+        The version is reused in-process for version_check seconds and shared
+        through the backend for the same time, so replicas together read it
+        from the database about once per version_check.
+
+        Args:
+            refresh: Ignore both copies and read it from the database now
+        """
+        with self.lock:
+            now = time.monotonic()
+            if not refresh and self.local_version is not None and now - self.local_version_at < self.version_check:
+                return self.local_version
+
+            version = None if refresh else self._backend_call('get', 'data_version')
+            if version is None:
+                version = self._read_version().encode('utf-8')
+                self._backend_call('set', 'data_version', version, self.version_check)
+            self.local_version = version.decode('utf-8')
+            self.local_version_at = now
+            return self.local_version
+
+    def _backend_call(self, method, *args):
+        """Backend errors (e.g. Redis down) degrade to a cache miss instead of failing the page"""
+        try:
+            return getattr(self.backend, method)(*args)
+        except Exception as e:
+            logger.warning(f"Query cache {method} failed: {e}")
+            return None
+
+    def _key(self, name, args):
+        digest = hashlib.sha1(repr(args).encode('utf-8')).hexdigest()
+        return f"query:{self.version()}:{name}:{digest}"
+
+    def _get(self, key):
+        """Deserialized entry, or _MISSING if it is absent or was not written by dumps()"""
+        value = self._backend_call('get', key)
+        if value is None:
+            return _MISSING
+        try:
+            return loads(value)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable query cache entry {key}: {e}")
+            return _MISSING
+
+    def get_or_compute(self, name, args, compute):
+        """Cached result of compute() for this query name, arguments and data version"""
+        key = self._key(name, args)
+        result = self._get(key)
+        if result is not _MISSING:
+            self.hits += 1
+            return result
+
+        #one computation per key in this process, and a lock entry across processes
+        with self.key_locks[hash(key) % len(self.key_locks)]:
+            result = self._get(key)
+            if result is not _MISSING:
+                self.hits += 1
+                return result
+
+            lock_key = key + ':lock'
+            leader = self._backend_call('add', lock_key, b'1', COMPUTE_LOCK_SECONDS)
+            if not leader:
+                result = self._wait_for(key, lock_key)
+                if result is not _MISSING:
+                    self.hits += 1
+                    return result
+
+            self.misses += 1
+            try:
+                result = compute()
+                self._backend_call('set', key, dumps(result), self.ttl)
+            finally:
+                if leader:
+                    self._backend_call('delete', lock_key)
+            return result
+
+    def _wait_for(self, key, lock_key):
+        """Poll for another process's result until it lands or its lock goes away"""
+        deadline = time.monotonic() + COMPUTE_LOCK_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            result = self._get(key)
+            if result is not _MISSING or self._backend_call('get', lock_key) is None:
+                return result
+        return _MISSING
+
+    def cached(self, func):
+        """Decorator: cache func's result by its name and positional arguments"""
+        @functools.wraps(func)
+        def wrapper(*args):
+            return self.get_or_compute(func.__name__, args, lambda: func(*args))
+        return wrapper
+
+
+class NoCache(QueryCache):
+    """QueryCache that always computes (QUERY_CACHE=none)"""
+
+    def __init__(self):
+        super().__init__(MemoryBackend(), version_source=lambda: 0)
+
+    def get_or_compute(self, name, args, compute):
+        self.misses += 1
+        return compute()
+
+
+def build_query_cache(version_source, kind=QUERY_CACHE):
+    """Create the configured cache: 'memory', 'disk', 'redis' or 'none'"""
+    if kind == 'memory':
+        return QueryCache(MemoryBackend(), version_source)
+    if kind == 'disk':
+        return QueryCache(SQLiteBackend(), version_source)
+    if kind == 'redis':
+        return QueryCache(RedisBackend.from_url(), version_source)
+    if kind == 'none':
+        return NoCache()
+    raise ValueError(f"Unknown query cache: {kind}")
@@ -0,0 +1,584 @@
+"""
+Historical backfill: load past observations for a set of cities
+
+The extractor only snapshots the current weather. A backfill loads a date
+range for a set of cities from one of two sources:
+
+- the OWM history API (or a local stub, via OWM_HISTORY_ROOT), which
+  returns hourly observations, at most one week per request
+- archived Parquet or CSV dumps with the landing-zone columns
+  (city, timestamp, temperature, ...), e.g. an old data/landing tree
+
+The work is split into chunks: BACKFILL_CHUNK_DAYS x BACKFILL_CHUNK_CITIES
+for the history API, one file for archives. A pool of BACKFILL_WORKERS
+processes fetches each chunk, transforms and validates it, and bulk loads
+it with DataLoader.load_observations. Every finished chunk is recorded in
+backfill_chunks, so running the same command again after an interruption
+skips what was already loaded:
+
+    python3 src/backfill.py --start 2023-01-01 --end 2025-01-01 --cities Lisbon Porto
+    python3 src/backfill.py --archive dumps/2023/ --start 2023-01-01
+
+Loading is idempotent (observations dedupe on city and time), so a chunk
+that was loaded but not yet checkpointed when the job stopped is simply
+loaded again. Rollups are refreshed per chunk and the data version is
+bumped once at the end.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from sqlalchemy import String, delete, insert, inspect, select
+from config import (CITIES, MAX_WORKERS, RATE_LIMIT_PER_MINUTE, RATE_LIMIT_BURST, OWM_API_ROOT, OWM_HISTORY_ROOT,
+                    LOAD_BATCH_SIZE, RETENTION_MONTHS, BACKFILL_WORKERS, BACKFILL_CHUNK_DAYS, BACKFILL_CHUNK_CITIES)
+from db import dispose_engines, get_engine
+from extract import WeatherExtractor
+from models import BackfillChunk, BackfillJob, City, bump_data_version
+from logger import setup_logger
+from metrics import metrics, export as export_metrics
+from utils import utc_epoch, utc_now
+
+load_dotenv()
+logger = setup_logger()
+
+#the history API returns at most one week of hourly observations per request
+HISTORY_MAX_DAYS = 7
+
+ARCHIVE_FORMATS = {'.parquet': 'parquet', '.csv': 'csv'}
+
+
+def _windows(start, end, days):
+    """Split [start, end) into consecutive windows of at most `days` days"""
+    step = timedelta(days=days)
+    while start < end:
+        yield start, min(start + step, end)
+        start += step
+
+
+class HistoryExtractor(WeatherExtractor):
+    """WeatherExtractor for the OWM history API
+
+    Reuses the extractor's rate limiter, retries and bounded thread pool;
+    each request is one city over at most HISTORY_MAX_DAYS.
+    """
+
+    def __init__(self, api_key, history_root=OWM_HISTORY_ROOT, **kwargs):
+        super().__init__(api_key, city_id_cache=None, response_cache=None, **kwargs)
+        self.history_url = f"{history_root}/history/city"
+
+    def _locate_once(self, city, attempt=0):
+        """Coordinates and country of a city, from one current-weather request"""
+        response, delay = self._get(self.base_url, {'q': city}, city, attempt)
+        if response is None:
+            return None, delay
+        data = response.json()
+        return {'coord': data.get('coord'), 'sys': {'country': (data.get('sys') or {}).get('country')}}, None
+
+    def locate(self, cities):
+        """Look up the coord/sys fields that history entries do not carry
+
+        Returns:
+            Dictionary of city name -> {'coord', 'sys'} (cities OWM does not know are left out)
+        """
+        cities = list(cities)
+        return {cities[idx]: found for idx, found in self._run_tasks(self._locate_once, cities) if found}
+
+    def _fetch_window_once(self, task, attempt=0):
+        """Fetch the hourly history of one city for one window
+
+        Returns:
+            (entries, retry_delay) - see _get
+        """
+        city, start, end = task
+        response, delay = self._get(
+            self.history_url,
+            {'q': city, 'type': 'hour', 'start': int(utc_epoch(start)), 'end': int(utc_epoch(end)) - 1},
+            f"{city} {start:%Y-%m-%d}..{end:%Y-%m-%d}",
+            attempt,
+            target='history'
+        )
+        if response is None:
+            return None, delay
+        with metrics.timer('json_decode'):
+            return response.json().get('list', []), None
+
+    def fetch_history(self, cities, start, end, locations):
+        """Raw payloads of every hourly observation of cities in [start, end)
+
+        Args:
+            cities: City names
+            start, end: Time range
+            locations: Output of locate(), merged into each entry so the
+                       transform sees the same shape as a current-weather payload
+        Returns:
+            (raws, failed) - raws as transform.transform_payloads takes them, failed
+            is the number of city windows that could not be fetched
+        """
+        tasks = [(city, s, e) for city in cities for s, e in _windows(start, end, HISTORY_MAX_DAYS)]
+        fetched_at = utc_now()
+        raws = []
+        failed = 0
+        for idx, entries in self._run_tasks(self._fetch_window_once, tasks):
+            if entries is None:
+                failed += 1
+                continue
+            city = tasks[idx][0]
+            raws.extend({'city': city, 'fetched_at': fetched_at, 'payload': {**entry, **locations[city]}}
+                        for entry in entries)
+        return raws, failed
+
+
+class HistorySource:
+    """Backfill source reading the OWM history API
+
+    Only plain settings are kept until read() is first called in a worker
+    process, so the source can be handed to the process pool.
+
+    Args:
+        api_key: OpenWeatherMap API key
+        locations: Output of HistoryExtractor.locate() for the cities to backfill
+        history_root: Base URL of the history API
+        api_root: Base URL of the current-weather API
+        rate_limit: Calls per minute for this process (split the plan across workers)
+        burst: Max calls that can go out back to back
+        max_workers: Concurrent requests per process
+    """
+
+    kind = 'history'
+
+    def __init__(self, api_key, locations, history_root=OWM_HISTORY_ROOT, api_root=OWM_API_ROOT,
+                 rate_limit=RATE_LIMIT_PER_MINUTE, burst=RATE_LIMIT_BURST, max_workers=MAX_WORKERS):
+        self.api_key = api_key
+        self.locations = locations
+        self.history_root = history_root
+        self.api_root = api_root
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.max_workers = max_workers
+        self.extractor = None
+
+    def describe(self):
+        return {'source': self.kind, 'root': self.history_root}
+
+    def plan(self, cities, start, end, chunk_days=BACKFILL_CHUNK_DAYS, chunk_cities=BACKFILL_CHUNK_CITIES):
+        """Split the job into time x city chunks, oldest window first"""
+        cities = [city for city in cities if city in self.locations]
+        chunks = []
+        for s, e in _windows(start, end, chunk_days):
+            for i in range(0, len(cities), chunk_cities):
+                members = cities[i:i + chunk_cities]
+                label = members[0] if len(members) == 1 else f"{members[0]} +{len(members) - 1}"
+                chunks.append({'chunk_id': chunk_id(cities=members, start=s, end=e), 'cities': members,
+                               'start': s, 'end': e, 'label': f"{label} {s:%Y-%m-%d}..{e:%Y-%m-%d}"})
+        return chunks
+
+    def read(self, chunk):
+        """Yield (records, rejects) for a chunk
+
+        Raises after yielding if some requests failed, so the chunk is not
+        checkpointed and the next run fetches it again.
+        """
+        from transform import transform_payloads
+
+        if self.extractor is None:
+            self.extractor = HistoryExtractor(self.api_key, self.history_root, api_root=self.api_root,
+                                              rate_limit=self.rate_limit, burst=self.burst,
+                                              max_workers=self.max_workers)
+        raws, failed = self.extractor.fetch_history(chunk['cities'], chunk['start'], chunk['end'], self.locations)
+        yield transform_payloads(raws)
+        if failed:
+            raise RuntimeError(f"{failed} history requests failed")
+
+
+def read_archive(path, start=None, end=None, cities=None, batch_size=LOAD_BATCH_SIZE):
+    """Stream records from one archived Parquet or CSV file
+
+    City and time filters are pushed down to the Parquet scan; CSV files
+    are parsed with the landing-zone column types.
+
+    Args:
+        path: .parquet or .csv file with landing.SCHEMA column names
+        start: Optional inclusive start datetime
+        end: Optional exclusive end datetime
+        cities: Optional list of city names
+        batch_size: Max records per yielded DataFrame
+    Yields:
+        DataFrames of matching records
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    from landing import SCHEMA
+
+    if ARCHIVE_FORMATS[os.path.splitext(path)[1].lower()] == 'csv':
+        import pyarrow.csv as csv
+        file_format = ds.CsvFileFormat(convert_options=csv.ConvertOptions(
+            column_types={field.name: field.type for field in SCHEMA}))
+    else:
+        file_format = 'parquet'
+
+    dataset = ds.dataset(path, format=file_format)
+    columns = [name for name in SCHEMA.names if name in dataset.schema.names]
+    if 'city' not in columns or 'timestamp' not in columns:
+        raise ValueError(f"{path} has no city or timestamp column")
+
+    filters = []
+    if start is not None:
+        filters.append(ds.field('timestamp') >= pa.scalar(start, pa.timestamp('us')))
+    if end is not None:
+        filters.append(ds.field('timestamp') < pa.scalar(end, pa.timestamp('us')))
+    if cities:
+        filters.append(ds.field('city').isin(list(cities)))
+
+    expression = None
+    for f in filters:
+        expression = f if expression is None else expression & f
+
+    for batch in dataset.to_batches(columns=columns, filter=expression, batch_size=batch_size):
+        if batch.num_rows:
+            yield batch.to_pandas()
+
+
+def archive_files(paths):
+    """Expand files and directories into the sorted list of archive files they contain"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, _, names in os.walk(path):
+                files += [os.path.join(folder, name) for name in names
+                          if os.path.splitext(name)[1].lower() in ARCHIVE_FORMATS]
+        elif os.path.splitext(path)[1].lower() in ARCHIVE_FORMATS:
+            files.append(path)
+        else:
+            raise ValueError(f"Not a Parquet or CSV file: {path}")
+    return sorted(files)
+
+
+class ArchiveSource:
+    """Backfill source reading archived Parquet or CSV dumps
+
+    Each file is one chunk. Records go through transform.validate_records,
+    so they are checked like API payloads and rejects are stored.
+
+    Args:
+        paths: Files and/or directories (searched recursively)
+    """
+
+    kind = 'archive'
+
+    def __init__(self, paths):
+        self.files = archive_files(paths)
+
+    def describe(self):
+        return {'source': self.kind, 'files': self.files}
+
+    def plan(self, cities, start, end, chunk_days=None, chunk_cities=None):
+        """One chunk per file, each filtered to the job's cities and time range"""
+        return [{'chunk_id': chunk_id(path=path), 'path': path, 'cities': cities, 'start': start, 'end': end,
+                 'label': path[-200:]}
+                for path in self.files]
+
+    def read(self, chunk):
+        """Yield (records, rejects) per record batch of the chunk's file"""
+        from transform import validate_records
+
+        for df in read_archive(chunk['path'], chunk['start'], chunk['end'], chunk['cities']):
+            yield validate_records(df)
+
+
+def locate_cities(engine, extractor, cities):
+    """coord/sys fields for cities: from the cities table when known, otherwise from the API
+
+    Returns:
+        Dictionary of city name -> {'coord', 'sys'}
+    """
+    query = (select(City.city_name, City.country, City.latitude, City.longitude)
+             .where(City.city_name.in_(list(cities))))
+    with engine.connect() as conn:
+        locations = {
+            name: {'coord': {'lat': lat, 'lon': lon}, 'sys': {'country': country}}
+            for name, country, lat, lon in conn.execute(query)
+            if lat is not None and lon is not None
+        }
+
+    unknown = [city for city in cities if city not in locations]
+    if unknown:
+        logger.info(f"Looking up coordinates of {len(unknown)} new cities")
+        locations.update(extractor.locate(unknown))
+    for city in cities:
+        if city not in locations:
+            logger.error(f"Could not locate {city}, skipping it")
+    return locations
+
+
+def chunk_id(**content):
+    """Checkpoint key of a chunk, from what it loads rather than its place in the plan
+
+    Cities that cannot be located, or archive files that appear, change the
+    plan between runs; a positional id would then point at other work.
+    """
+    return hashlib.sha1(json.dumps(content, default=str, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def job_id(source, cities, start, end, chunk_days, chunk_cities):
+    """Stable name for a backfill, so rerunning the same command resumes it
+
+    Built only from the arguments the caller passed: an open end (None) is
+    left out, and job_end() pins it when the job first runs.
+    """
+    spec = {**source.describe(), 'cities': cities, 'start': start,
+            'chunk_days': chunk_days, 'chunk_cities': chunk_cities}
+    if end is not None:
+        spec['end'] = end
+    digest = hashlib.sha1(json.dumps(spec, default=str, sort_keys=True).encode('utf-8')).hexdigest()
+    return f"{source.kind}-{digest[:12]}"
+
+
+def job_end(engine, job, start, end):
+    """End of a job's time range, recorded in backfill_jobs when the job first runs
+
+    Args:
+        end: Requested end, or None for "now" on the first run and the same
+             time again on every rerun
+    Returns:
+        The end to plan chunks with
+    """
+    with engine.begin() as conn:
+        stored = conn.execute(select(BackfillJob.end).where(BackfillJob.job == job)).scalar()
+        if stored is not None and end is None:
+            return stored
+        if stored is None:
+            end = end or utc_now()
+            conn.execute(insert(BackfillJob).values(job=job, start=start, end=end, created_at=utc_now()))
+    return end
+
+
+def completed_chunks(engine, job):
+    """chunk_ids of a job that are already loaded"""
+    with engine.connect() as conn:
+        return set(conn.execute(select(BackfillChunk.chunk_id).where(BackfillChunk.job == job)).scalars())
+
+
+def prepare(engine, start):
+    """Create the checkpoint table and, on PostgreSQL, monthly partitions back to start"""
+    #DDL can outlast the default statement timeout
+    ddl_engine = get_engine(statement_timeout=0)
+    BackfillJob.__table__.create(ddl_engine, checkfirst=True)
+    inspector = inspect(ddl_engine)
+    if inspector.has_table('backfill_chunks'):
+        columns = {column['name']: column['type'] for column in inspector.get_columns('backfill_chunks')}
+        if not isinstance(columns['chunk_id'], String):
+            #checkpoints keyed by position in the plan cannot be matched to chunks; their rows reload harmlessly
+            logger.warning("Dropping backfill_chunks with positional chunk ids; unfinished jobs reload from the start")
+            BackfillChunk.__table__.drop(ddl_engine)
+    BackfillChunk.__table__.create(ddl_engine, checkfirst=True)
+    if start is None or engine.dialect.name != 'postgresql':
+        return
+
+    from partitions import add_months, ensure_partitions
+
+    today = utc_now()
+    cutoff = datetime(*add_months(today.year, today.month, -RETENTION_MONTHS), 1)
+    if start < cutoff:
+        logger.warning(f"Backfilling from {start:%Y-%m-%d}, before the {RETENTION_MONTHS}-month retention window: "
+                       f"partitions.py will expire months before {cutoff:%Y-%m}")
+    ensure_partitions(ddl_engine, since=start)
+
+
+def run_chunk(source, loader, job, chunk):
+    """Fetch, transform and load one chunk, then record its checkpoint
+
+    Returns:
+        Dictionary with chunk_id, label, loaded, errors, rejected, seconds,
+        and error if the chunk failed (it is then not checkpointed)
+    """
+    started = time.perf_counter()
+    result = {'chunk_id': chunk['chunk_id'], 'label': chunk['label'], 'loaded': 0, 'errors': 0, 'rejected': 0}
+    try:
+        for records, rejects in source.read(chunk):
+            ok, failed = loader.load_observations(records, bump_version=False)
+            result['loaded'] += ok
+            result['errors'] += failed
+            result['rejected'] += len(rejects)
+            loader.load_rejects(rejects)
+
+        with loader.unit_of_work() as session:
+            session.execute(delete(BackfillChunk).where(BackfillChunk.job == job,
+                                                        BackfillChunk.chunk_id == chunk['chunk_id']))
+            session.execute(insert(BackfillChunk).values(job=job, chunk_id=chunk['chunk_id'], label=chunk['label'],
+                                                         rows_loaded=result['loaded'], completed_at=utc_now()))
+    except Exception as e:
+        #returned rather than raised: database errors do not always survive pickling back to the parent
+        result['error'] = str(e).splitlines()[0]
+
+    result['seconds'] = time.perf_counter() - started
+    return result
+
+
+#per-process state of a pool worker: its source and one DataLoader reused for every chunk
+_worker = {}
+
+
+def _start_worker(source):
+    #Ctrl-C goes to the whole process group; the parent lets running chunks finish
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker['source'] = source
+
+
+def _run_worker_chunk(job, chunk):
+    from load import DataLoader
+
+    if 'loader' not in _worker:
+        _worker['loader'] = DataLoader()
+    return run_chunk(_worker['source'], _worker['loader'], job, chunk)
+
+
+def _run_chunks(source, job, chunks, workers):
+    """Yield chunk results in completion order, from a process pool when workers > 1"""
+    if workers <= 1 or len(chunks) <= 1:
+        from load import DataLoader
+
+        with DataLoader() as loader:
+            for chunk in chunks:
+                yield run_chunk(source, loader, job, chunk)
+        return
+
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_start_worker, initargs=(source,))
+    try:
+        futures = [pool.submit(_run_worker_chunk, job, chunk) for chunk in chunks]
+        for future in as_completed(futures):
+            yield future.result()
+    finally:
+        #on an interrupt, queued chunks are dropped and running ones finish
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def run_backfill(source, cities, start, end, job=None, workers=BACKFILL_WORKERS, chunk_days=BACKFILL_CHUNK_DAYS,
+                 chunk_cities=BACKFILL_CHUNK_CITIES, restart=False, on_chunk=None):
+    """Load every chunk of a backfill job that has not been loaded yet
+
+    Args:
+        source: HistorySource or ArchiveSource
+        cities: City names (None = every city in an archive)
+        start, end: Time range; optional for archives. With end None the job runs up to
+                    the time it was first started, on every rerun (see job_end)
+        job: Job name (default: derived from the arguments, see job_id)
+        workers: Worker processes
+        chunk_days, chunk_cities: Chunk size for the history API
+        restart: Forget the job's checkpoints and load everything again
+        on_chunk: Optional callback(result) for each finished chunk (see run_chunk)
+    Returns:
+        Summary dictionary: job, chunks, skipped, completed, failed, loaded, errors, rejected
+    """
+    engine = get_engine()
+    prepare(engine, start)
+    job = job or job_id(source, cities, start, end, chunk_days, chunk_cities)
+
+    if restart:
+        with engine.begin() as conn:
+            conn.execute(delete(BackfillChunk).where(BackfillChunk.job == job))
+            conn.execute(delete(BackfillJob).where(BackfillJob.job == job))
+    end = job_end(engine, job, start, end)
+
+    chunks = source.plan(cities, start, end, chunk_days, chunk_cities)
+    done = completed_chunks(engine, job)
+    pending = [chunk for chunk in chunks if chunk['chunk_id'] not in done]
+    logger.info(f"Backfill {job}: {len(chunks)} chunks, {len(chunks) - len(pending)} already loaded, "
+                f"{len(pending)} to go on {workers} workers")
+
+    summary = {'job': job, 'chunks': len(chunks), 'skipped': len(chunks) - len(pending),
+               'completed': 0, 'failed': 0, 'loaded': 0, 'errors': 0, 'rejected': 0}
+    try:
+        for result in _run_chunks(source, job, pending, workers):
+            failed = 'error' in result
+            summary['failed' if failed else 'completed'] += 1
+            for key in ('loaded', 'errors', 'rejected'):
+                summary[key] += result[key]
+            metrics.inc('backfill_chunks', result='failed' if failed else 'completed')
+            metrics.observe('backfill_chunk', result['seconds'])
+            if failed:
+                logger.error(f"Chunk {result['label']} failed, rerun to retry it: {result['error']}")
+            else:
+                logger.info(f"Chunk {result['label']}: {result['loaded']} rows in {result['seconds']:.1f}s "
+                            f"({summary['completed'] + summary['skipped']}/{len(chunks)} done)")
+            if on_chunk:
+                on_chunk(result)
+    finally:
+        #rows are committed per chunk (also by chunks still running when interrupted);
+        #one bump refreshes cached dashboard results
+        if pending:
+            with engine.begin() as conn:
+                bump_data_version(conn)
+        metrics.inc('rows_loaded', summary['loaded'])
+
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill historical observations")
+    parser.add_argument('--start', type=datetime.fromisoformat, help="Inclusive start, UTC (YYYY-MM-DD[THH:MM])")
+    parser.add_argument('--end', type=datetime.fromisoformat, help="Exclusive end, UTC (default: when the job was first started)")
+    parser.add_argument('--cities', nargs='+', help="City names (default: config.CITIES, or all cities in an archive)")
+    parser.add_argument('--cities-file', help="File with one city name per line")
+    parser.add_argument('--archive', nargs='+', metavar='PATH',
+                        help="Parquet/CSV files or directories to load instead of the history API")
+    parser.add_argument('--workers', type=int, default=BACKFILL_WORKERS)
+    parser.add_argument('--chunk-days', type=int, default=BACKFILL_CHUNK_DAYS)
+    parser.add_argument('--chunk-cities', type=int, default=BACKFILL_CHUNK_CITIES)
+    parser.add_argument('--rate-limit', type=int, default=RATE_LIMIT_PER_MINUTE,
+                        help="History API calls per minute, shared by all workers")
+    parser.add_argument('--job', help="Job name for checkpoints (default: derived from the arguments)")
+    parser.add_argument('--restart', action='store_true', help="Ignore checkpoints and load every chunk again")
+    args = parser.parse_args()
+
+    cities = args.cities
+    if args.cities_file:
+        with open(args.cities_file) as f:
+            cities = (cities or []) + [line.strip() for line in f if line.strip()]
+    workers = max(1, args.workers)
+
+    if args.archive:
+        source = ArchiveSource(args.archive)
+        logger.info(f"Backfilling from {len(source.files)} archive files")
+    else:
+        if args.start is None:
+            parser.error("--start is required for the history API")
+        api_key = os.getenv('WEATHER_API_KEY')
+        if not api_key:
+            logger.error("No API key found! check your .env file")
+            return
+
+        cities = list(dict.fromkeys(cities or CITIES))
+        #each worker process gets its own token bucket, so the plan is split between them
+        rate_limit = max(1, args.rate_limit / workers)
+        burst = max(1, RATE_LIMIT_BURST // workers)
+        extractor = HistoryExtractor(api_key, rate_limit=rate_limit, burst=burst)
+        locations = locate_cities(get_engine(), extractor, cities)
+        extractor.close()
+        source = HistorySource(api_key, locations, rate_limit=rate_limit, burst=burst,
+                               max_workers=max(1, MAX_WORKERS // workers))
+
+    try:
+        summary = run_backfill(source, cities, args.start, args.end, args.job, workers,
+                               args.chunk_days, args.chunk_cities, args.restart)
+    except KeyboardInterrupt:
+        logger.info("Backfill interrupted, run the same command again to resume")
+        return
+    finally:
+        export_metrics('backfill')
+        dispose_engines()
+
+    print(f"Backfill {summary['job']}: {summary['loaded']} rows loaded, {summary['errors']} failed, "
+          f"{summary['rejected']} rejected; {summary['completed']} chunks done, {summary['skipped']} skipped, "
+          f"{summary['failed']} failed")
+    if summary['failed']:
+        print("Run the same command again to retry the failed chunks")
+
+
+if __name__ == "__main__":
+    main()
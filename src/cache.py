@@ -0,0 +1,139 @@
+"""
+Response cache for OpenWeatherMap payloads
+
+OWM refreshes a station's observation roughly every 10 minutes, so a city
+whose cached payload is still fresh does not need another HTTP call, and a
+payload whose upstream `dt` has not advanced does not need another DB row.
+Entries are keyed by city name and stored in one of two backends:
+
+- MemoryCache: in-process LRU, for long-running processes
+- DiskCache: SQLite file, survives restarts and one-off runs
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config import (RESPONSE_CACHE, RESPONSE_CACHE_PATH, RESPONSE_CACHE_SIZE,
+                    RESPONSE_CACHE_TTL, OBSERVATION_INTERVAL)
+
+
+class MemoryCache:
+    """Thread-safe in-memory LRU backend"""
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class DiskCache:
+    """SQLite-file backend shared by every run on the same machine"""
+
+    def __init__(self, path=RESPONSE_CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, entry TEXT NOT NULL)")
+        self.conn.commit()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT entry FROM responses WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, entry):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO responses (key, entry) VALUES (?, ?)", (key, json.dumps(entry)))
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class ResponseCache:
+    """Freshness rules on top of a cache backend
+
+    An entry is fresh when it was fetched less than `ttl` seconds ago, or
+    when its observation (`dt`) is younger than the upstream refresh
+    interval. Stale entries keep their ETag so the next request can be
+    conditional.
+    """
+
+    def __init__(self, backend, ttl=RESPONSE_CACHE_TTL, observation_interval=OBSERVATION_INTERVAL):
+        self.backend = backend
+        self.ttl = ttl
+        self.observation_interval = observation_interval
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    def is_fresh(self, entry, now=None):
+        now = now or time.time()
+        if now - entry['fetched_at'] < self.ttl:
+            return True
+        dt = entry['data'].get('dt')
+        return dt is not None and now - dt < self.observation_interval
+
+    def store(self, key, data, etag=None):
+        """Save a payload fetched just now; returns the new entry"""
+        with self.lock:
+            previous = self.backend.get(key) or {}
+            entry = {
+                'data': data,
+                'etag': etag or (previous.get('etag') if previous.get('data') == data else None),
+                'fetched_at': time.time(),
+                'emitted_dt': previous.get('emitted_dt'),
+            }
+            self.backend.set(key, entry)
+        return entry
+
+    def already_emitted(self, key, dt):
+        """True if the observation at `dt` is no newer than the last one loaded (see mark_emitted)"""
+        if dt is None:
+            return False
+        entry = self.backend.get(key)
+        return entry is not None and entry.get('emitted_dt') is not None and dt <= entry['emitted_dt']
+
+    def mark_emitted(self, key, dt):
+        """Record that the observation at `dt` was loaded
+
+        Only call this once the load carrying it has committed, so an
+        observation from a failed load is handed on again by the next run.
+        """
+        if dt is None:
+            return
+        with self.lock:
+            entry = self.backend.get(key)
+            if entry is None or (entry.get('emitted_dt') is not None and dt <= entry['emitted_dt']):
+                return
+            entry['emitted_dt'] = dt
+            self.backend.set(key, entry)
+
+
+def build_response_cache(kind=RESPONSE_CACHE):
+    """Create the configured cache: 'memory', 'disk' or 'none'"""
+    if kind == 'memory':
+        return ResponseCache(MemoryCache())
+    if kind == 'disk':
+        return ResponseCache(DiskCache())
+    if kind == 'none':
+        return None
+    raise ValueError(f"Unknown response cache: {kind}")
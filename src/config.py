@@ -2,6 +2,11 @@
 Configuration setting for all pipeline
 """
 
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
 CITIES= [
     'Boston', 
     'New York', 
@@ -18,4 +23,95 @@ CITIES= [
 #Max retries
 MAX_RETRIES= 3
 REQUEST_TIMEOUT= 10
-RETRY_DELAY= 2
\ No newline at end of file
+RETRY_DELAY= 2
+MAX_BACKOFF= 60
+
+#Concurrent extraction (1 worker = sequential)
+MAX_WORKERS= 16
+
+#Token bucket sized to the API plan (free tier: 60 calls/minute)
+RATE_LIMIT_PER_MINUTE= 60
+RATE_LIMIT_BURST= 10
+
+#Rows per set-based INSERT when bulk loading
+LOAD_BATCH_SIZE= 5000
+
+#weather_data monthly partitions
+PARTITION_MONTHS_AHEAD= 3
+RETENTION_MONTHS= 24
+
+#Parquet landing zone for extracted records
+LANDING_DIR= 'data/landing'
+#raw API payloads, kept so a batch can be transformed again (see transform.py)
+RAW_LANDING_DIR= 'data/raw'
+LANDING_COMPRESSION= 'zstd'
+
+#Streaming mode: records flow extractor -> bounded queue -> loader micro-batches
+STREAM_QUEUE_SIZE= 1000
+STREAM_BATCH_SIZE= 200
+STREAM_FLUSH_SECONDS= 5
+
+#OpenWeatherMap API root (override with OWM_API_ROOT to use a local stub)
+OWM_API_ROOT= os.getenv('OWM_API_ROOT', 'http://api.openweathermap.org/data/2.5')
+
+#'city' = one request per city by name, 'group' = bulk requests by OWM city ID
+EXTRACT_MODE= os.getenv('EXTRACT_MODE', 'city')
+GROUP_SIZE= 20
+CITY_ID_CACHE= 'data/owm_city_ids.json'
+
+#Response cache: 'disk' (survives restarts and one-off runs), 'memory' (LRU) or 'none'
+RESPONSE_CACHE= os.getenv('RESPONSE_CACHE', 'disk')
+RESPONSE_CACHE_PATH= 'data/response_cache.sqlite'
+RESPONSE_CACHE_SIZE= 5000
+RESPONSE_CACHE_TTL= 300
+#how often OWM refreshes a station's observation, in seconds
+OBSERVATION_INTERVAL= 600
+
+#Scheduler daemon: poll interval in seconds per city tier
+#e.g. {'hot': {'interval': 900, 'cities': ['Miami']}, 'default': {...}}
+CITY_TIERS= {
+    'default': {'interval': 3600, 'cities': CITIES},
+}
+SCHEDULER_MAX_BATCH= 100
+
+#Sharded extraction: cities are hashed into SHARD_COUNT shards that workers lease from Postgres
+SHARD_COUNT= 16
+SHARD_INTERVAL= 3600
+SHARD_LEASE_SECONDS= 300
+
+#Metrics: Prometheus text file (node_exporter textfile collector), JSON run log,
+#and an optional HTTP /metrics endpoint for the long-running processes (0 = off)
+LOG_DIR= 'logs'
+METRICS_FILE= os.getenv('METRICS_FILE', 'logs/weather_pipeline.prom')
+METRICS_JSON_LOG= os.getenv('METRICS_JSON_LOG', 'logs/metrics.jsonl')
+METRICS_PORT= int(os.getenv('METRICS_PORT', '0'))
+
+#Database connection pool (one shared engine per process, see db.py)
+DB_POOL_SIZE= int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW= int(os.getenv('DB_MAX_OVERFLOW', '5'))
+DB_POOL_TIMEOUT= 30
+DB_POOL_RECYCLE= 1800
+DB_CONNECT_TIMEOUT= 10
+#per-statement limit in milliseconds (0 = none); maintenance commands lift it
+DB_STATEMENT_TIMEOUT_MS= int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '60000'))
+#set when connecting through PgBouncer in transaction pooling mode
+DB_PGBOUNCER= os.getenv('DB_PGBOUNCER', '').lower() in ('1', 'true', 'yes')
+
+#Historical backfill (see backfill.py): OWM history API root (point it at a local stub for testing),
+#work split into chunks of BACKFILL_CHUNK_DAYS x BACKFILL_CHUNK_CITIES run by BACKFILL_WORKERS processes
+OWM_HISTORY_ROOT= os.getenv('OWM_HISTORY_ROOT', 'https://history.openweathermap.org/data/2.5')
+BACKFILL_WORKERS= int(os.getenv('BACKFILL_WORKERS', '4'))
+BACKFILL_CHUNK_DAYS= 7
+BACKFILL_CHUNK_CITIES= 50
+
+#Dashboard: the CSV export is built in memory for st.download_button, so it is capped
+DASHBOARD_EXPORT_MAX_ROWS= int(os.getenv('DASHBOARD_EXPORT_MAX_ROWS', '200000'))
+
+#Dashboard query-result cache (see query_cache.py): 'memory', 'disk', 'redis' or 'none'
+QUERY_CACHE= os.getenv('QUERY_CACHE', 'memory')
+QUERY_CACHE_PATH= os.getenv('QUERY_CACHE_PATH', 'data/query_cache.sqlite')
+QUERY_CACHE_URL= os.getenv('QUERY_CACHE_URL', 'local://')
+QUERY_CACHE_SIZE= int(os.getenv('QUERY_CACHE_SIZE', '512'))
+QUERY_CACHE_TTL= int(os.getenv('QUERY_CACHE_TTL', '3600'))
+#how long a data version read from the database is trusted before asking again
+DATA_VERSION_CHECK_SECONDS= float(os.getenv('DATA_VERSION_CHECK_SECONDS', '5'))
@@ -0,0 +1,101 @@
+"""
+Shared SQLAlchemy engine factory
+
+Loaders, maintenance commands and the dashboard all get their engine from
+get_engine(), so everything in one process shares a single connection
+pool instead of opening its own connections:
+
+- pool_size / max_overflow bound the connections a process holds, and
+  pool_pre_ping replaces connections the server or a proxy has dropped
+- every PostgreSQL statement runs under DB_STATEMENT_TIMEOUT_MS
+- with DB_PGBOUNCER set (transaction pooling), no session state is set at
+  connect time; the timeout is applied per transaction with SET LOCAL
+
+A forked child (e.g. a multiprocessing worker) gets a fresh engine on its
+first call instead of reusing the parent's sockets.
+"""
+
+import os
+import threading
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from config import (DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE,
+                    DB_CONNECT_TIMEOUT, DB_STATEMENT_TIMEOUT_MS, DB_PGBOUNCER)
+from models import get_database_url
+from metrics import metrics
+
+#(url, statement_timeout, pgbouncer) -> (pid, engine)
+_engines = {}
+_lock = threading.Lock()
+
+
+def engine_options(url, statement_timeout=DB_STATEMENT_TIMEOUT_MS, pgbouncer=DB_PGBOUNCER):
+    """create_engine() keyword arguments for a database URL
+
+    Pool settings only apply to PostgreSQL; other databases (the SQLite
+    files used by benchmarks) keep SQLAlchemy's defaults.
+    """
+    if make_url(url).get_backend_name() != 'postgresql':
+        return {}
+
+    connect_args = {'connect_timeout': DB_CONNECT_TIMEOUT, 'application_name': 'weather_pipeline'}
+    if statement_timeout and not pgbouncer:
+        connect_args['options'] = f"-c statement_timeout={int(statement_timeout)}"
+
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': True,
+        'connect_args': connect_args,
+    }
+
+
+def _build(url, statement_timeout, pgbouncer):
+    engine = create_engine(url, **engine_options(url, statement_timeout, pgbouncer))
+
+    @event.listens_for(engine, 'connect')
+    def _count_connection(dbapi_connection, connection_record):
+        metrics.inc('db_connections')
+
+    if pgbouncer and statement_timeout and engine.dialect.name == 'postgresql':
+        @event.listens_for(engine, 'begin')
+        def _set_statement_timeout(conn):
+            conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(statement_timeout)}")
+
+    return engine
+
+
+def get_engine(url=None, statement_timeout=DB_STATEMENT_TIMEOUT_MS, pgbouncer=DB_PGBOUNCER):
+    """The process-wide engine for a database
+
+    Args:
+        url: SQLAlchemy URL (default: models.get_database_url())
+        statement_timeout: Per-statement limit in milliseconds, 0 for none
+                           (maintenance commands that rewrite whole tables)
+        pgbouncer: Connecting through PgBouncer in transaction pooling mode
+    Returns:
+        Engine shared by every caller with the same arguments in this process
+    """
+    url = url or get_database_url()
+    key = (url, statement_timeout, pgbouncer)
+    with _lock:
+        pid, engine = _engines.get(key, (None, None))
+        if engine is not None and pid != os.getpid():
+            #inherited through fork: leave the parent's connections alone
+            engine.dispose(close=False)
+            engine = None
+        if engine is None:
+            engine = _build(url, statement_timeout, pgbouncer)
+            _engines[key] = (os.getpid(), engine)
+        return engine
+
+
+def dispose_engines():
+    """Close every pooled connection (end of a run, or tests)"""
+    with _lock:
+        for pid, engine in _engines.values():
+            if pid == os.getpid():
+                engine.dispose()
+        _engines.clear()
@@ -1,16 +1,22 @@
 import requests
-import pandas as pd
-from datetime import datetime
+from requests.adapters import HTTPAdapter
 import os
+import json
+import argparse
 from dotenv import load_dotenv
 import time
-from config import CITIES, MAX_RETRIES,RETRY_DELAY,REQUEST_TIMEOUT
+import heapq
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from config import CITIES, MAX_RETRIES,RETRY_DELAY,MAX_BACKOFF,REQUEST_TIMEOUT,MAX_WORKERS,RATE_LIMIT_PER_MINUTE,RATE_LIMIT_BURST
+from config import OWM_API_ROOT,EXTRACT_MODE,GROUP_SIZE,CITY_ID_CACHE
 from logger import setup_logger
-from torch.utils.data import DataLoader
-from load import DataLoader
-import inspect
-print(f"DEBUG: DataLoader is from: {inspect.getfile(DataLoader)}")
-print(f"DEBUG: DataLoader.__init__ signature: {inspect.signature(DataLoader.__init__)}")
+from utils import TokenBucket, backoff_delay, utc_from_epoch, utc_now
+from cache import build_response_cache
+from stream import stream_to_database
+from metrics import metrics, export as export_metrics
+
+#pandas (extract summary), pyarrow (landing) and SQLAlchemy (load) are imported
+#inside the functions that use them, so importing this module stays cheap
 
 #load environment variables
 load_dotenv()
@@ -19,128 +25,440 @@ API_KEY=os.getenv('WEATHER_API_KEY')
 #setup logger
 logger = setup_logger()
 
+#result for a city whose upstream observation has not changed since it was last loaded
+UNCHANGED=object()
+
 class WeatherExtractor:
     """Class to handle weather data extraction"""
 
-    def __init__(self,api_key):
+    def __init__(self,api_key,max_workers=MAX_WORKERS,rate_limit=RATE_LIMIT_PER_MINUTE,burst=RATE_LIMIT_BURST,
+                 mode=EXTRACT_MODE,api_root=OWM_API_ROOT,city_id_cache=CITY_ID_CACHE,response_cache='default'):
+        """
+        Args:
+            api_key: OpenWeatherMap API key
+            max_workers: Number of concurrent requests (1 = sequential)
+            rate_limit: Calls per minute allowed by the API plan
+            burst: Max calls that can go out back to back
+            mode: 'city' for one request per city, 'group' for bulk requests by OWM city ID
+            api_root: Base URL of the OWM API (point it at a local stub for testing)
+            city_id_cache: JSON file mapping city names to OWM city IDs (group mode)
+            response_cache: ResponseCache, None to disable, or 'default' for the configured one
+        """
         self.api_key=api_key
-        self.base_url="http://api.openweathermap.org/data/2.5/weather"
+        self.base_url=f"{api_root}/weather"
+        self.group_url=f"{api_root}/group"
+        self.max_workers=max(1,max_workers)
+        self.rate_limiter=TokenBucket.per_minute(rate_limit,burst)
+        self.mode=mode
+        self.city_id_cache=city_id_cache
+        self.city_ids=None
+        self.response_cache=build_response_cache() if response_cache=='default' else response_cache
+
+        #one pooled keep-alive session shared by all workers, so TCP/TLS
+        #setup is paid once per connection instead of once per city
+        self.session=requests.Session()
+        adapter=HTTPAdapter(pool_connections=1,pool_maxsize=self.max_workers)
+        self.session.mount('http://',adapter)
+        self.session.mount('https://',adapter)
+
+    def _get(self,url,params,label,attempt=0,headers=None,target=None):
+        """Make a single rate-limited API request
 
-    def fetch_weather_data(self,city,retry_count=0):
-        """Fetch weather data from OpenWeatherMap API
         Args:
-            city: City name
-            retry_count: Current retry attempt number
+            url: Endpoint URL
+            params: Query parameters (the API key is added here)
+            label: What is being fetched, for log messages
+            attempt: Current retry attempt number
+            headers: Optional extra request headers
+            target: Latency metric label (default: the city, or 'group' for group requests)
         Returns:
-            Dictionary with weather data or None if failed 
+            (response, retry_delay) - response is set on 200/304, retry_delay
+            is None when no retry is needed, otherwise the number of seconds to
+            wait before the next attempt
         """
-        
-        url = f"{self.base_url}?q={city}&appid={self.api_key}"
-
         try:
-            logger.info(f'fetching weather for {city}...')
+            logger.info(f'fetching weather for {label}...')
 
-            response=requests.get(url,timeout=REQUEST_TIMEOUT)
+            #wait for a token instead of a fixed sleep
+            waited=time.perf_counter()
+            self.rate_limiter.acquire()
+            metrics.observe('rate_limit_wait',time.perf_counter()-waited)
 
-            if response.status_code==200:
-                data=response.json()
+            #per-city latency; group requests share one series
+            target=target or (label if url==self.base_url else 'group')
+            with metrics.timer('http_request',target=target):
+                response=self.session.get(
+                    url,
+                    params={**params,'appid':self.api_key},
+                    headers=headers,
+                    timeout=REQUEST_TIMEOUT
+                )
+            metrics.inc('http_responses',status=response.status_code)
 
-                #extract the important stuff
-                weather={
-                    'city': city,
-                    'country': data['sys'].get('country','Unknown'),
-                    'timestamp':datetime.now(),
-                    'temperature':round(data['main']['temp']-273.15,2),
-                    'feels_like':round(data['main']['feels_like']-273.15,2),
-                    'temp_min':round(data['main']['temp_min']-273.15,2),
-                    'temp_max':round(data['main']['temp_max']-273.15,2),
-                    'humidity':data['main']['humidity'],
-                    'pressure':data['main']['pressure'],
-                    'weather_main':data['weather'][0]['main'],
-                    'weather_description':data['weather'][0]['description'],
-                    'wind_speed':data['wind'].get('speed',0),
-                    'wind_direction':data['wind'].get('deg',0),
-                    'cloudiness':data.get('clouds',{}).get('all',0),
-                    'visibility':data.get('visibilty',0),
-                    'latitude':data['coord']['lat'],
-                    'longitude':data['coord']['lon']
-                }
-            
-                logger.info(f'Success! {city}: {weather["temperature"]}°C, {weather['weather_description']}')
-                return weather
+            if response.status_code in (200,304):
+                return response, None
             
             elif response.status_code==401:
                 logger.error("Invalid API key!")
-                return None
+                return None, None
             
             elif response.status_code==404:
-                logger.error(f"City not found: {city}")
-                return None
+                logger.error(f"City not found: {label}")
+                return None, None
         
             else:
-                logger.warning(f'API returned status {response.status_code} for {city}')
-
-                #retry logic
-                if retry_count < MAX_RETRIES:
-                    logger.info(f"Retrying {city} (attempt {retry_count+1}/{MAX_RETRIES})...")
-                    time.sleep(RETRY_DELAY)
-                    return self.fetch_wetaher_data(city, retry_count+1)
-                else:
-                    logger.error(f"Failed to fetch {city} after {MAX_RETRIES} attempts")
-                    return None
+                logger.warning(f'API returned status {response.status_code} for {label}')
+                retry_after=response.headers.get('Retry-After')
+                if response.status_code==429:
+                    metrics.inc('http_rate_limited')
                 
         except requests.exceptions.Timeout:
-            logger.warning(f"Timeout for {city}")
+            logger.warning(f"Timeout for {label}")
+            metrics.inc('http_errors',kind='timeout')
+            retry_after=None
+
+        except requests.exceptions.ConnectionError as e:
+            logger.warning(f"Connection error for {label}: {str(e)}")
+            metrics.inc('http_errors',kind='connection')
+            retry_after=None
+
+        #retry logic
+        if attempt < MAX_RETRIES:
+            delay=backoff_delay(attempt,RETRY_DELAY,MAX_BACKOFF,retry_after)
+            logger.info(f"Retrying {label} in {delay:.1f}s (attempt {attempt+1}/{MAX_RETRIES})...")
+            metrics.inc('http_retries')
+            return None, delay
+
+        logger.error(f"Failed to fetch {label} after {MAX_RETRIES} attempts")
+        metrics.inc('http_failures')
+        return None, None
+
+    def _emit(self,city,data):
+        """Hand a raw payload on unless its observation was already loaded (see mark_loaded)
+
+        Returns:
+            {'city', 'fetched_at', 'payload'} for transform.transform_payloads, or UNCHANGED
+        """
+        if self.response_cache and self.response_cache.already_emitted(city,data.get('dt')):
+            logger.info(f"{city}: observation unchanged since last run, skipping")
+            metrics.inc('observations_unchanged')
+            return UNCHANGED
+        logger.info(f"Success! {city}")
+        return {'city':city,'fetched_at':utc_now(),'payload':data}
+
+    def mark_loaded(self,raws,loaded,city_ids):
+        """Record that raw payloads from this extractor are in the database
+
+        Only payloads whose row committed are recorded; the rest (failed rows,
+        rejects) are handed on again by the next fetch.
+
+        Args:
+            raws: Raw payload records that went into the load
+            loaded: (city_id, timestamp) keys from DataLoader.load_observations(..., return_keys=True)
+            city_ids: Dictionary of city name -> city_id (DataLoader.city_cache)
+        """
+        if not self.response_cache:
+            return
+        for raw in raws:
+            dt=raw['payload'].get('dt')
+            try:
+                key=(city_ids.get(raw['city']),utc_from_epoch(float(dt)))
+            except (TypeError,ValueError,OverflowError,OSError):
+                continue
+            if key in loaded:
+                self.response_cache.mark_emitted(raw['city'],dt)
+
+    def _fetch_once(self,city,attempt=0):
+        """Make a single request for a city, unless its cached payload is still fresh
+
+        Returns:
+            (raw, retry_delay) - see _get
+        """
+        entry=self.response_cache.get(city) if self.response_cache else None
+        if entry and self.response_cache.is_fresh(entry):
+            logger.debug(f"Cache hit for {city}")
+            metrics.inc('response_cache',result='fresh')
+            return self._emit(city,entry['data']), None
+
+        #conditional request: a 304 means the cached payload is still current
+        headers={'If-None-Match':entry['etag']} if entry and entry.get('etag') else None
+        response, delay=self._get(self.base_url,{'q':city},city,attempt,headers)
+        if response is None:
+            return None, delay
+
+        if response.status_code==304:
+            metrics.inc('response_cache',result='not_modified')
+            data=entry['data']
+        else:
+            with metrics.timer('json_decode'):
+                data=response.json()
+        if self.response_cache:
+            self.response_cache.store(city,data,response.headers.get('ETag'))
+        return self._emit(city,data), None
+
+    def _fetch_group_once(self,chunk,attempt=0):
+        """Fetch a chunk of cities with one call to the group endpoint
+
+        Args:
+            chunk: List of (city name, OWM city ID)
+        Returns:
+            (raws, retry_delay) - raws maps city name -> raw payload record
+        """
+        response, delay=self._get(
+            self.group_url,
+            {'id':','.join(str(owm_id) for _,owm_id in chunk)},
+            f"{len(chunk)} cities ({chunk[0][0]}...)",
+            attempt
+        )
+        if response is None:
+            return None, delay
+
+        names={owm_id:city for city,owm_id in chunk}
+        raws={}
+        with metrics.timer('json_decode'):
+            items=response.json().get('list',[])
+        for item in items:
+            city=names.get(item.get('id'))
+            if city:
+                if self.response_cache:
+                    self.response_cache.store(city,item)
+                raws[city]=self._emit(city,item)
+        return raws, None
+
+    def _resolve_once(self,city,attempt=0):
+        """Look up the OWM city ID for a city name
+
+        Returns:
+            (owm_id, retry_delay) - see _get
+        """
+        response, delay=self._get(self.base_url,{'q':city},city,attempt)
+        if response is None:
+            return None, delay
+        return response.json()['id'], None
+
+    def resolve_city_ids(self,cities):
+        """Map city names to OWM city IDs, only asking the API for unknown names
+
+        The mapping is cached in memory and in the city_id_cache JSON file, so
+        each city costs one lookup request once, ever.
+
+        Returns:
+            Dictionary of city name -> OWM city ID (unresolvable cities are left out)
+        """
+        if self.city_ids is None:
+            self.city_ids={}
+            if self.city_id_cache and os.path.exists(self.city_id_cache):
+                with open(self.city_id_cache) as f:
+                    self.city_ids=json.load(f)
+
+        unknown=[city for city in dict.fromkeys(cities) if city not in self.city_ids]
+        if unknown:
+            logger.info(f"Resolving OWM city IDs for {len(unknown)} cities")
+            for idx,owm_id in self._run_tasks(self._resolve_once,unknown):
+                if owm_id is not None:
+                    self.city_ids[unknown[idx]]=owm_id
+
+            if self.city_id_cache:
+                os.makedirs(os.path.dirname(self.city_id_cache) or '.',exist_ok=True)
+                with open(self.city_id_cache,'w') as f:
+                    json.dump(self.city_ids,f,indent=2,sort_keys=True)
+
+        return {city:self.city_ids[city] for city in cities if city in self.city_ids}
+
+    def _run_tasks(self,fetch,items):
+        """
+        Run fetch(item, attempt) concurrently over items and yield results as they finish
+
+        At most 2 x max_workers requests are in flight at any time, so memory
+        stays bounded even for very long (or generated) item lists.
+
+        Yields:
+        (index, result) in completion order; result is None for failed items
+        """
+        items=enumerate(items)
+        max_in_flight=self.max_workers*2
+
+        #requests are paced by the token bucket, so wall-clock time follows
+        #the rate limit rather than the number of cities. Retries wait in a
+        #heap on this thread, so backoff never holds a worker slot.
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            pending={}
+            retries=[]
+            exhausted=False
+
+            while True:
+                #submit retries whose backoff has elapsed, then top up with new items
+                now=time.monotonic()
+                while retries and retries[0][0]<=now:
+                    _,idx,item,attempt=heapq.heappop(retries)
+                    pending[pool.submit(fetch,item,attempt)]=(idx,item,attempt)
+
+                while not exhausted and len(pending)<max_in_flight:
+                    nxt=next(items,None)
+                    if nxt is None:
+                        exhausted=True
+                        break
+                    idx,item=nxt
+                    pending[pool.submit(fetch,item,0)]=(idx,item,0)
+
+                if not pending:
+                    if not retries:
+                        return
+                    time.sleep(retries[0][0]-now)
+                    continue
+
+                metrics.set_gauge('extract_in_flight',len(pending))
+                metrics.set_gauge('extract_retry_queue',len(retries))
+                timeout=retries[0][0]-now if retries else None
+                done,_=wait(pending,timeout=timeout,return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    idx,item,attempt=pending.pop(future)
+                    result,delay=future.result()
+                    if delay is not None:
+                        heapq.heappush(retries,(time.monotonic()+delay,idx,item,attempt+1))
+                    else:
+                        yield idx,result
 
-            if retry_count < MAX_RETRIES:
-                    logger.info(f"Retrying {city} (attempt {retry_count+1}/{MAX_RETRIES})...")
-                    time.sleep(RETRY_DELAY)
-                    return self.fetch_wetaher_data(city, retry_count+1)
+    def _iter_grouped(self,cities):
+        """Group-mode counterpart of iter_payloads: GROUP_SIZE cities per request"""
+        cities=list(cities)
+        city_ids=self.resolve_city_ids(cities)
+
+        positions={}
+        for idx,city in enumerate(cities):
+            #cities with a fresh cached payload do not need to be in any group request
+            entry=self.response_cache.get(city) if self.response_cache else None
+            if entry and self.response_cache.is_fresh(entry):
+                metrics.inc('response_cache',result='fresh')
+                yield idx,self._emit(city,entry['data'])
+            elif city in city_ids:
+                positions.setdefault(city,[]).append(idx)
             else:
-                logger.error(f"Timeout on {city} after {MAX_RETRIES} attempts")
-                return None
-            
-    def fetch_multiple_cities(self,cities):
+                logger.error(f"No OWM city ID for {city}, skipping")
+                yield idx,None
+
+        resolved=list(positions)
+        chunks=[[(city,city_ids[city]) for city in resolved[i:i+GROUP_SIZE]] for i in range(0,len(resolved),GROUP_SIZE)]
+
+        for chunk_idx,raws in self._run_tasks(self._fetch_group_once,chunks):
+            raws=raws or {}
+            for city,_ in chunks[chunk_idx]:
+                for idx in positions[city]:
+                    yield idx,raws.get(city)
+
+    def iter_payloads(self,cities):
         """
-        Fetch weather data for multiple cities
+        Fetch cities concurrently and yield raw payloads as they finish
 
         Args:
-        Cities: List of city names
+        cities: Iterable of city names
+
+        Yields:
+        (index, raw) in completion order; raw is a {'city', 'fetched_at', 'payload'}
+        dict, or None for failed cities. Cities whose observation has not changed
+        since it was last yielded (according to the response cache) are left out.
+        """
+        if self.mode=='group':
+            results=self._iter_grouped(cities)
+        else:
+            results=self._run_tasks(self._fetch_once,cities)
+
+        for idx,raw in results:
+            if raw is not UNCHANGED:
+                metrics.inc('cities_extracted',result='ok' if raw else 'failed')
+                yield idx,raw
+
+    def fetch_payloads(self,cities):
+        """
+        Fetch raw payloads for multiple cities
+
+        Args:
+        cities: List of city names
 
         Returns:
-        Datframe with weather data
+        List of raw payload dicts in input order (failed and unchanged cities left out)
         """
         logger.info(f"Starting extraction for {len(cities)} cities")
         logger.info("="*60)
 
-        all_weather=[]
-        successful=0
+        results={}
         failed=0
 
-        for city in cities:
-            weather=self.fetch_weather_data(city)
-            if weather:
-                all_weather.append(weather)
-                successful+=1
-            else:
-                failed+=1
-            
-            #small delay to avoid rate limiting
-            time.sleep(0.5)
+        with metrics.timer('stage',stage='extract'):
+            for idx,raw in self.iter_payloads(cities):
+                if raw:
+                    results[idx]=raw
+                else:
+                    failed+=1
+
+        unchanged=len(cities)-len(results)-failed
 
         logger.info("="*60)
-        logger.info(f"Extraction complete for {successful}, {failed} failed")
+        logger.info(f"Extraction complete for {len(results)}, {failed} failed, {unchanged} unchanged")
 
-        if all_weather:
-            df=pd.DataFrame(all_weather)
-            return df
-        else:
-            logger.error("No data extracted")
-            return pd.DataFrame()    
+        if not results:
+            if failed==0 and unchanged:
+                logger.info("No new observations since the last run")
+            else:
+                logger.error("No data extracted")
+
+        return [results[idx] for idx in sorted(results)]
+
+    def fetch_multiple_cities(self,cities):
+        """
+        Fetch weather data for multiple cities
+
+        Rejected records are only logged here; use fetch_payloads and
+        transform.transform_payloads to keep them.
+
+        Args:
+        Cities: List of city names
+
+        Returns:
+        Datframe with weather data
+        """
+        from transform import transform_payloads
+
+        records,_=transform_payloads(self.fetch_payloads(cities))
+        return records.to_pandas()
+
+    def close(self):
+        """Close the pooled HTTP session"""
+        self.session.close()
+
+def run_streaming(extractor):
+    """Stream records from the extractor into the database in micro-batches"""
+    from landing import write_run
+    from load import DataLoader
+
+    print("\n" + "="*80)
+    print("Streaming Data into Database")
+    print("="*80)
+
+    try:
+        with DataLoader() as loader:
+            success, errors=stream_to_database(
+                extractor,
+                loader,
+                CITIES,
+                on_batch=write_run
+            )
+        print(f'Successfully loaded {success} records into the database!')
+        if errors>0:
+            print(f"{errors} recordsfailed to load")
+    except Exception as e:
+        logger.error(f"Streaming load failed:{str(e)}")
+        print(f"Database loading failed: {str(e)}")
 
 def main():
     """Main function to run the extraction"""
 
+    parser=argparse.ArgumentParser(description="Extract weather data and load it into the database")
+    parser.add_argument('--stream',action='store_true',
+                        help="Load records in micro-batches as they arrive instead of after the full run")
+    args=parser.parse_args()
+
     logger.info("Weather Data Pipeline - Extraction Started")
     logger.info(f"API Key: {'Found' if API_KEY else 'Missing'}")
 
@@ -151,8 +469,28 @@ def main():
     #create extractor
     extractor=WeatherExtractor(API_KEY)
 
-    #fetch data
-    df = extractor.fetch_multiple_cities(CITIES)
+    if args.stream:
+        run_streaming(extractor)
+        extractor.close()
+        export_metrics('extract',mode='stream')
+        logger.info("Pipeline completed!")
+        return
+
+    from landing import write_run
+    from load import DataLoader
+    from transform import transform_payloads
+
+    #fetch raw payloads, then transform the whole run in one columnar pass
+    raws = extractor.fetch_payloads(CITIES)
+    extractor.close()
+    records, rejects = transform_payloads(raws)
+
+    #save raw payloads and records to the parquet landing zone
+    with metrics.timer('stage',stage='landing'):
+        write_run(raws, records)
+
+    #zero-copy DataFrame view, only for the summary below
+    df = records.to_pandas()
 
     if not df.empty:
         #Display summary
@@ -170,11 +508,6 @@ def main():
         #Show first few rows
         print("\nFirst 5 records:")
         print(df[['city','temperature','humidity','weather_description']].head())
-        
-        #save to csv
-        output_file=f"data/weather_{datetime.now().strftime('%Y%m%d_%H%m%s')}.csv"
-        df.to_csv(output_file,index=False)
-        logger.info("Data saved to data/weather_latest.csv")
 
         #load into the db
         print("\n" + "="*80)
@@ -182,9 +515,10 @@ def main():
         print("="*80)
 
         try:
-            loader=DataLoader()
-            success, errors=loader.load_weather_dataframe(df)
-            loader.close()
+            with DataLoader() as loader, metrics.timer('stage',stage='load'):
+                success, errors, loaded=loader.load_observations(records,return_keys=True)
+                loader.load_rejects(rejects)
+            extractor.mark_loaded(raws,loaded,loader.city_cache)
             print(f'Successfully loaded {success} records into the database!')
             if errors>0:
                 print(f"{errors} recordsfailed to load")
@@ -194,7 +528,11 @@ def main():
 
     else:
         logger.error("No data to save!")
+        if len(rejects):
+            with DataLoader() as loader:
+                loader.load_rejects(rejects)
 
+    export_metrics('extract',mode='batch')
     logger.info("Pipeline completed!")
 
 if __name__=="__main__":
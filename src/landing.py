@@ -0,0 +1,287 @@
+"""
+Parquet landing zone for extracted weather data
+
+Each extraction run is written as a small typed, compressed Parquet file under
+
+    data/landing/date=YYYY-MM-DD/hour=HH/weather_<run>.parquet
+
+and `compact` later merges a finished day's hourly files into one
+date=YYYY-MM-DD/weather_<date>.parquet file. read_landing() pushes
+date, time, city and column selection down to the Parquet scan so
+replays only read what they need.
+
+The raw API payloads of each run are landed the same way under
+data/raw/ (city, fetched_at and the payload JSON), so records can be
+re-derived with transform.py after a transform fix.
+
+    python3 src/landing.py compact            # every day before today (UTC)
+    python3 src/landing.py compact --date 2025-10-16
+"""
+
+import argparse
+import json
+import os
+from datetime import date
+import pyarrow as pa
+import pyarrow.parquet as pq
+from observations import ObservationBatch
+from config import LANDING_DIR, RAW_LANDING_DIR, LANDING_COMPRESSION
+from logger import setup_logger
+from utils import utc_now
+
+logger = setup_logger()
+
+SCHEMA = pa.schema([
+    ('city', pa.string()),
+    ('country', pa.string()),
+    ('timestamp', pa.timestamp('us')),
+    ('fetched_at', pa.timestamp('us')),
+    ('temperature', pa.float64()),
+    ('feels_like', pa.float64()),
+    ('temp_min', pa.float64()),
+    ('temp_max', pa.float64()),
+    ('humidity', pa.float64()),
+    ('pressure', pa.float64()),
+    ('weather_main', pa.string()),
+    ('weather_description', pa.string()),
+    ('wind_speed', pa.float64()),
+    ('wind_direction', pa.float64()),
+    ('cloudiness', pa.float64()),
+    ('visibility', pa.int64()),
+    ('latitude', pa.float64()),
+    ('longitude', pa.float64()),
+])
+
+RAW_SCHEMA = pa.schema([
+    ('city', pa.string()),
+    ('fetched_at', pa.timestamp('us')),
+    ('payload', pa.string()),
+])
+
+#date=/hour= directories; compacted daily files have no hour
+PARTITION_SCHEMA = pa.schema([('date', pa.string()), ('hour', pa.string())])
+DATASET_SCHEMA = pa.unify_schemas([SCHEMA, PARTITION_SCHEMA])
+
+
+def _date_dir(root, day):
+    return os.path.join(root, f"date={day.isoformat()}")
+
+
+def _hour_dir(root, run_time):
+    folder = os.path.join(_date_dir(root, run_time.date()), f"hour={run_time:%H}")
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def write_landing(df, root=LANDING_DIR, run_time=None):
+    """Write one extraction run to the landing zone
+
+    Args:
+        df: ObservationBatch from transform.transform_payloads, a DataFrame
+            (e.g. from WeatherExtractor.fetch_multiple_cities) or a list of record dicts
+        root: Landing zone directory
+        run_time: Run timestamp used for the partition and file name (default now)
+    Returns:
+        Path of the written file
+    """
+    run_time = run_time or utc_now()
+    folder = _hour_dir(root, run_time)
+
+    #columns missing from older producers are written as nulls
+    if isinstance(df, ObservationBatch):
+        table = df.to_arrow(SCHEMA)
+    elif isinstance(df, list):
+        table = pa.Table.from_pylist(df, schema=SCHEMA)
+    else:
+        table = pa.Table.from_pandas(df.reindex(columns=SCHEMA.names).astype(object), schema=SCHEMA, preserve_index=False)
+    path = os.path.join(folder, f"weather_{run_time:%Y%m%d_%H%M%S_%f}.parquet")
+    pq.write_table(table, path, compression=LANDING_COMPRESSION)
+
+    logger.info(f"Landed {table.num_rows} records in {path}")
+    return path
+
+
+def write_raw(raws, root=RAW_LANDING_DIR, run_time=None):
+    """Write one run's raw API payloads to the raw landing zone
+
+    Args:
+        raws: List of {'city', 'fetched_at', 'payload'} dicts from the extractor
+        root: Raw landing zone directory
+        run_time: Run timestamp used for the partition and file name (default now)
+    Returns:
+        Path of the written file
+    """
+    run_time = run_time or utc_now()
+    table = pa.Table.from_pydict({
+        'city': [raw['city'] for raw in raws],
+        'fetched_at': [raw['fetched_at'] for raw in raws],
+        'payload': [json.dumps(raw['payload'], separators=(',', ':')) for raw in raws],
+    }, schema=RAW_SCHEMA)
+    path = os.path.join(_hour_dir(root, run_time), f"payloads_{run_time:%Y%m%d_%H%M%S_%f}.parquet")
+    pq.write_table(table, path, compression=LANDING_COMPRESSION)
+
+    logger.info(f"Landed {table.num_rows} raw payloads in {path}")
+    return path
+
+
+def write_run(raws, records, run_time=None):
+    """Land one run: raw payloads and transformed records share a run timestamp"""
+    run_time = run_time or utc_now()
+    if raws:
+        write_raw(raws, run_time=run_time)
+    if len(records):
+        write_landing(records, run_time=run_time)
+
+
+def compact_day(day, root=LANDING_DIR, schema=SCHEMA, sort_by='timestamp'):
+    """Merge a day's hourly files (and any earlier compacted file) into one daily file
+
+    Returns:
+        Path of the daily file, or None if there was nothing to compact
+    """
+    folder = _date_dir(root, day)
+    hour_dirs = [os.path.join(folder, name) for name in os.listdir(folder)
+                 if name.startswith('hour=')] if os.path.isdir(folder) else []
+    if not hour_dirs:
+        return None
+
+    target = os.path.join(folder, f"weather_{day:%Y%m%d}.parquet")
+    sources = [os.path.join(d, name) for d in hour_dirs for name in sorted(os.listdir(d)) if name.endswith('.parquet')]
+    if os.path.exists(target):
+        sources.insert(0, target)
+
+    #pyarrow.dataset pulls in pandas, so only the read/compact paths import it
+    import pyarrow.dataset as ds
+
+    #reading through a dataset fills columns missing from older files with nulls
+    table = ds.dataset(sources, format='parquet', schema=schema).to_table().sort_by(sort_by)
+
+    #write next to the target and swap in, so readers never see a partial file
+    tmp = target + '.tmp'
+    pq.write_table(table, tmp, compression=LANDING_COMPRESSION)
+    os.replace(tmp, target)
+    #only the files merged above: a writer may have landed new ones since they were listed
+    for path in sources:
+        if path != target:
+            os.remove(path)
+    for d in hour_dirs:
+        try:
+            os.rmdir(d)
+        except OSError:
+            pass
+
+    logger.info(f"Compacted {len(sources)} files into {target} ({table.num_rows} records)")
+    return target
+
+
+def compact_landing(root=LANDING_DIR, before=None, schema=SCHEMA, sort_by='timestamp'):
+    """Compact every day in the landing zone older than `before` (default today, UTC)"""
+    #partitions are named after the UTC run time (see _hour_dir)
+    before = before or utc_now().date()
+    compacted = []
+    if not os.path.isdir(root):
+        return compacted
+
+    for name in sorted(os.listdir(root)):
+        if not name.startswith('date='):
+            continue
+        day = date.fromisoformat(name[len('date='):])
+        if day < before and compact_day(day, root, schema, sort_by):
+            compacted.append(day)
+    return compacted
+
+
+def read_landing(root=LANDING_DIR, start=None, end=None, cities=None, columns=None):
+    """Read landed records back with predicate and column pushdown
+
+    Args:
+        root: Landing zone directory
+        start: Optional inclusive start datetime
+        end: Optional exclusive end datetime
+        cities: Optional list of city names
+        columns: Optional list of columns to read (default all)
+    Returns:
+        DataFrame of matching records
+    """
+    if not os.path.isdir(root):
+        return pa.table({}, schema=SCHEMA).to_pandas()
+
+    import pyarrow.dataset as ds
+
+    partitioning = ds.partitioning(PARTITION_SCHEMA, flavor='hive')
+    dataset = ds.dataset(root, format='parquet', schema=DATASET_SCHEMA, partitioning=partitioning)
+
+    #date bounds prune whole directories, timestamp bounds use row-group statistics
+    filters = []
+    if start is not None:
+        filters.append(ds.field('date') >= start.date().isoformat())
+        filters.append(ds.field('timestamp') >= pa.scalar(start, pa.timestamp('us')))
+    if end is not None:
+        filters.append(ds.field('date') <= end.date().isoformat())
+        filters.append(ds.field('timestamp') < pa.scalar(end, pa.timestamp('us')))
+    if cities:
+        filters.append(ds.field('city').isin(list(cities)))
+
+    expression = None
+    for f in filters:
+        expression = f if expression is None else expression & f
+
+    columns = columns or SCHEMA.names
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+
+def read_raw(root=RAW_LANDING_DIR, start=None, end=None):
+    """Read raw payloads back for reprocessing
+
+    Args:
+        root: Raw landing zone directory
+        start: Optional inclusive start datetime (on fetched_at)
+        end: Optional exclusive end datetime (on fetched_at)
+    Returns:
+        List of {'city', 'fetched_at', 'payload'} dicts, as the extractor produces them
+    """
+    if not os.path.isdir(root):
+        return []
+
+    import pyarrow.dataset as ds
+
+    partitioning = ds.partitioning(PARTITION_SCHEMA, flavor='hive')
+    dataset = ds.dataset(root, format='parquet', schema=pa.unify_schemas([RAW_SCHEMA, PARTITION_SCHEMA]),
+                         partitioning=partitioning)
+
+    expression = None
+    if start is not None:
+        expression = (ds.field('date') >= start.date().isoformat()) & \
+            (ds.field('fetched_at') >= pa.scalar(start, pa.timestamp('us')))
+    if end is not None:
+        bound = (ds.field('date') <= end.date().isoformat()) & \
+            (ds.field('fetched_at') < pa.scalar(end, pa.timestamp('us')))
+        expression = bound if expression is None else expression & bound
+
+    table = dataset.to_table(columns=RAW_SCHEMA.names, filter=expression).sort_by('fetched_at')
+    return [
+        {'city': city, 'fetched_at': fetched_at, 'payload': json.loads(payload)}
+        for city, fetched_at, payload in zip(
+            table['city'].to_pylist(), table['fetched_at'].to_pylist(), table['payload'].to_pylist())
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the Parquet landing zone")
+    sub = parser.add_subparsers(dest='command', required=True)
+    compact = sub.add_parser('compact', help="Merge hourly files into daily files")
+    compact.add_argument('--date', type=date.fromisoformat, help="Only compact this day (YYYY-MM-DD)")
+    compact.add_argument('--root', default=LANDING_DIR)
+    compact.add_argument('--raw-root', default=RAW_LANDING_DIR)
+    args = parser.parse_args()
+
+    if args.date:
+        compact_day(args.date, args.root)
+        compact_day(args.date, args.raw_root, RAW_SCHEMA, 'fetched_at')
+    else:
+        compact_landing(args.root)
+        compact_landing(args.raw_root, schema=RAW_SCHEMA, sort_by='fetched_at')
+
+
+if __name__ == "__main__":
+    main()
@@ -1,42 +1,120 @@
-from sqlalchemy import create_engine
+from contextlib import contextmanager
+import numpy as np
+from sqlalchemy import insert, select
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import sessionmaker
-from models import City, WeatherData, get_database_url
+from db import get_engine
+from models import City, WeatherData, LatestWeather, WeatherReject, bump_data_version
+from observations import ObservationBatch
+from config import LOAD_BATCH_SIZE
+from rollups import refresh_rollups
 from logger import setup_logger
-import pandas as pd
+from metrics import metrics
+
+#columns written to weather_data, in the order the extractor produces them
+WEATHER_COLUMNS = [
+    'timestamp', 'fetched_at', 'temperature', 'feels_like', 'temp_min', 'temp_max',
+    'humidity', 'pressure', 'weather_main', 'weather_description',
+    'wind_speed', 'wind_direction', 'cloudiness', 'visibility'
+]
 
 logger = setup_logger()
 
 
 class DataLoader:
-    """Handles loading data into the database"""
+    """Handles loading data into the database
+
+    Use it as a context manager so its session is always closed:
+
+        with DataLoader() as loader:
+            loader.load_observations(batch)
+
+    Every write runs in a unit_of_work(), so a failure rolls back and the
+    connection goes back to the shared pool (see db.py) instead of staying
+    checked out in a failed transaction.
+    """
     
-    def __init__(self):
-        """Initialize database connection"""
-        self.engine = create_engine(get_database_url())
+    def __init__(self, engine=None):
+        """Initialize database connection
+
+        Args:
+            engine: Optional engine; defaults to the process-wide one from db.get_engine()
+        """
+        self.engine = engine or get_engine()
         Session = sessionmaker(bind=self.engine)
         self.session = Session()
-    
+
+        #city_name -> city_id; the dimension rarely changes, so it is read
+        #once here and only unseen cities go to the database afterwards
+        self.city_cache = {}
+        self.warm_city_cache()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @contextmanager
+    def unit_of_work(self):
+        """Transaction scope: commits when the block finishes, rolls back if it raises
+
+        Yields:
+            The loader's session
+        """
+        try:
+            yield self.session
+            self._commit()
+        except BaseException:
+            self.session.rollback()
+            raise
+
+    def warm_city_cache(self):
+        """Load every known city into the cache with a single query"""
+        with self.unit_of_work() as session:
+            rows = session.execute(select(City.city_name, City.city_id)).all()
+        self.city_cache = dict(rows)
+        logger.debug(f"City cache warmed with {len(self.city_cache)} cities")
+
+    def _create_cities(self, cities):
+        """Insert cities that are not cached yet and cache their IDs
+
+        Uses INSERT ... ON CONFLICT DO NOTHING followed by a re-read, so a
+        concurrent loader creating the same city_name is not an error: the
+        losing side simply picks up the winner's city_id.
+
+        Args:
+            cities: List of dicts with city_name, country, latitude and longitude
+        """
+        stmt = self._upsert_insert(City).values(cities).on_conflict_do_nothing(index_elements=['city_name'])
+        names = [city['city_name'] for city in cities]
+        query = select(City.city_name, City.city_id).where(City.city_name.in_(names))
+        with metrics.timer('db', op='create_cities'), self.unit_of_work() as session:
+            session.execute(stmt)
+            self.city_cache.update(session.execute(query).all())
+        logger.info(f"Created or resolved {len(names)} new cities: {', '.join(names)}")
+
     def get_or_create_city(self, city_name, country, latitude, longitude):
         """Get existing city or create new one"""
-        city = self.session.query(City).filter_by(city_name=city_name).first()
-        
-        if city:
-            logger.debug(f"City {city_name} already exists (ID: {city.city_id})")
-            return city.city_id
-        else:
-            new_city = City(
-                city_name=city_name,
-                country=country,
-                latitude=latitude,
-                longitude=longitude
-            )
-            self.session.add(new_city)
-            self.session.commit()
-            logger.info(f"Created new city: {city_name} (ID: {new_city.city_id})")
-            return new_city.city_id
+        city_id = self.city_cache.get(city_name)
+
+        if city_id is not None:
+            logger.debug(f"City {city_name} already exists (ID: {city_id})")
+            return city_id
+
+        self._create_cities([{
+            'city_name': city_name,
+            'country': country,
+            'latitude': latitude,
+            'longitude': longitude
+        }])
+        return self.city_cache[city_name]
     
     def load_weather_record(self, weather_data):
-        """Load a single weather record into the database"""
+        """Load a single weather record into the database
+
+        Loading an observation that is already stored is a no-op.
+        """
         try:
             city_id = self.get_or_create_city(
                 city_name=weather_data['city'],
@@ -44,51 +122,253 @@ class DataLoader:
                 latitude=weather_data['latitude'],
                 longitude=weather_data['longitude']
             )
-            
-            weather_record = WeatherData(
-                city_id=city_id,
-                timestamp=weather_data['timestamp'],
-                temperature=weather_data['temperature'],
-                feels_like=weather_data['feels_like'],
-                temp_min=weather_data['temp_min'],
-                temp_max=weather_data['temp_max'],
-                humidity=weather_data['humidity'],
-                pressure=weather_data['pressure'],
-                weather_main=weather_data['weather_main'],
-                weather_description=weather_data['weather_description'],
-                wind_speed=weather_data['wind_speed'],
-                wind_direction=weather_data['wind_direction'],
-                cloudiness=weather_data['cloudiness'],
-                visibility=weather_data['visibility']
-            )
-            
-            self.session.add(weather_record)
-            self.session.commit()
+
+            row = {'city_id': city_id, **{col: weather_data.get(col) for col in WEATHER_COLUMNS}}
+            with self.unit_of_work():
+                self.insert_weather_rows([row])
+                self.upsert_latest([row])
+            metrics.inc('rows_loaded')
+            self.update_rollups(weather_data['timestamp'], weather_data['timestamp'], [city_id])
+            self.bump_data_version()
             logger.info(f"✓ Loaded weather data for {weather_data['city']}")
             
         except Exception as e:
-            self.session.rollback()
             logger.error(f"✗ Failed to load data for {weather_data['city']}: {str(e)}")
             raise
     
-    def load_weather_dataframe(self, df):
-        """Load multiple weather records from a DataFrame"""
-        logger.info(f"Loading {len(df)} weather records to database...")
-        
-        success_count = 0
+    def _upsert_insert(self, table):
+        """INSERT statement that supports ON CONFLICT for the current dialect"""
+        if self.engine.dialect.name == 'postgresql':
+            return postgresql.insert(table)
+        if self.engine.dialect.name == 'sqlite':
+            return sqlite.insert(table)
+        raise NotImplementedError(f"Bulk upsert not supported for {self.engine.dialect.name}")
+
+    def insert_weather_rows(self, rows):
+        """Insert weather_data rows, skipping observations that are already stored
+
+        (city_id, timestamp) is unique and timestamp is the upstream observation
+        time, so re-running a batch or overlapping runs insert nothing twice.
+        Runs in the caller's transaction.
+
+        Returns:
+            Number of rows actually inserted, or None if the driver cannot tell
+        """
+        stmt = self._upsert_insert(WeatherData).on_conflict_do_nothing(index_elements=['city_id', 'timestamp'])
+        with metrics.timer('db', op='insert_weather'):
+            result = self.session.connection().execute(stmt, rows)
+        return result.rowcount if result.rowcount >= 0 else None
+
+    def upsert_latest(self, rows):
+        """Upsert the newest of the given rows per city into latest_weather
+
+        Runs in the caller's transaction, so latest_weather commits or rolls
+        back together with the weather_data insert. Older rows (e.g. from a
+        backfill) never replace a newer observation.
+        """
+        newest = {}
+        for row in rows:
+            current = newest.get(row['city_id'])
+            if current is None or row['timestamp'] > current['timestamp']:
+                newest[row['city_id']] = row
+
+        if not newest:
+            return
+
+        stmt = self._upsert_insert(LatestWeather)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['city_id'],
+            set_={col: stmt.excluded[col] for col in WEATHER_COLUMNS},
+            where=LatestWeather.timestamp <= stmt.excluded.timestamp
+        )
+        with metrics.timer('db', op='upsert_latest'):
+            self.session.execute(stmt, list(newest.values()))
+
+    def resolve_city_ids(self, records):
+        """Map city names to city IDs, creating missing cities in one statement
+
+        Args:
+            records: Iterable of dicts with city, country, latitude and longitude
+        Returns:
+            Dictionary of city name -> city_id
+        """
+        names = []
+        missing = {}
+        for record in records:
+            name = record['city']
+            names.append(name)
+            if name not in self.city_cache and name not in missing:
+                missing[name] = {
+                    'city_name': name,
+                    'country': record['country'],
+                    'latitude': record['latitude'],
+                    'longitude': record['longitude']
+                }
+
+        if missing:
+            self._create_cities(list(missing.values()))
+
+        return {name: self.city_cache[name] for name in names if name in self.city_cache}
+
+    def _commit(self):
+        """Commit the session, timing the round trip"""
+        with metrics.timer('db', op='commit'):
+            self.session.commit()
+
+    def _load_rows_individually(self, rows):
+        """Fallback for a failed batch: insert rows one by one to report bad records
+
+        Returns:
+            (rows that committed, error_count)
+        """
+        loaded = []
         error_count = 0
-        
-        for _, row in df.iterrows():
+
+        for row in rows:
             try:
-                self.load_weather_record(row.to_dict())
-                success_count += 1
+                with self.unit_of_work():
+                    self.insert_weather_rows([row])
+                    self.upsert_latest([row])
+                loaded.append(row)
             except Exception as e:
                 error_count += 1
-                logger.error(f"Error loading record: {str(e)}")
-        
-        logger.info(f"Loading complete: {success_count} successful, {error_count} failed")
+                metrics.inc('rows_failed')
+                logger.error(f"✗ Failed to load record for city_id {row['city_id']} at {row['timestamp']}: {str(e)}")
+
+        return loaded, error_count
+
+    def load_weather_dataframe(self, df, batch_size=LOAD_BATCH_SIZE):
+        """Bulk load weather records from a DataFrame (see load_observations)"""
+        return self.load_observations(ObservationBatch.from_pandas(df), batch_size)
+
+    def load_weather_records(self, records, batch_size=LOAD_BATCH_SIZE):
+        """Bulk load a list of weather dicts (see load_observations)"""
+        return self.load_observations(ObservationBatch.from_records(records), batch_size)
+
+    def load_observations(self, batch, batch_size=LOAD_BATCH_SIZE, bump_version=True, return_keys=False):
+        """Bulk load an ObservationBatch and refresh derived tables
+
+        City IDs are resolved in one query and weather rows are written with
+        batched multi-row INSERTs. Row dicts are built one DB batch at a time,
+        so a large batch never exists as Python objects all at once. A batch
+        that fails is retried row by row so individual bad records are still
+        reported.
+
+        Args:
+            batch: ObservationBatch
+            batch_size: Rows per INSERT
+            bump_version: Bump the data version if new rows were stored; a backfill
+                          turns this off and bumps once when it is done
+            return_keys: Also return the (city_id, timestamp) keys of the rows that
+                         committed, e.g. to tell which payloads made it in
+        Returns:
+            (success_count, error_count), plus the set of loaded keys with return_keys
+        """
+        logger.info(f"Loading {len(batch)} weather records to database...")
+
+        if not len(batch):
+            return (0, 0, set()) if return_keys else (0, 0)
+
+        city_ids = self.resolve_city_ids(batch.cities())
+        names, inverse = np.unique(batch['city'].astype(str), return_inverse=True)
+        ids = np.array([city_ids.get(name) for name in names], dtype=object)[inverse]
+
+        success_count = 0
+        error_count = 0
+        inserted_count = 0
+        fallback_count = 0
+        loaded_keys = set()
+
+        for start in range(0, len(batch), batch_size):
+            rows = batch.rows(WEATHER_COLUMNS, start, start + batch_size, extra={'city_id': ids})
+            try:
+                with self.unit_of_work():
+                    inserted = self.insert_weather_rows(rows)
+                    self.upsert_latest(rows)
+                success_count += len(rows)
+                inserted_count += len(rows) if inserted is None else inserted
+            except Exception as e:
+                metrics.inc('batch_fallbacks')
+                logger.warning(f"Batch insert failed, retrying {len(rows)} rows individually: {str(e)}")
+                rows, failed = self._load_rows_individually(rows)
+                success_count += len(rows)
+                fallback_count += len(rows)
+                error_count += failed
+            if return_keys:
+                loaded_keys.update((row['city_id'], row['timestamp']) for row in rows)
+
+        timestamps = batch['timestamp'][~np.isnat(batch['timestamp'])]
+        if success_count and len(timestamps):
+            loaded_ids = list({city_id for city_id in ids.tolist() if city_id is not None})
+            self.update_rollups(timestamps.min().item(), timestamps.max().item(), loaded_ids)
+        #rows that were all stored already change nothing the dashboard shows
+        if bump_version and (inserted_count or fallback_count):
+            self.bump_data_version()
+
+        metrics.inc('rows_loaded', success_count)
+        metrics.inc('rows_inserted', inserted_count)
+        logger.info(f"Loading complete: {success_count} successful "
+                    f"({success_count - inserted_count} already loaded), {error_count} failed")
+        if return_keys:
+            return success_count, error_count, loaded_keys
         return success_count, error_count
-    
+
+    def load_rejects(self, rejects):
+        """Store records the transform step rejected, with their raw payloads
+
+        Args:
+            rejects: DataFrame with transform.REJECT_COLUMNS
+        Returns:
+            Number of rows stored
+        """
+        if rejects is None or rejects.empty:
+            return 0
+
+        rows = rejects.astype(object).where(rejects.notna(), None).to_dict('records')
+        try:
+            with metrics.timer('db', op='insert_rejects'), self.unit_of_work() as session:
+                session.execute(insert(WeatherReject), rows)
+        except Exception as e:
+            logger.error(f"Failed to store {len(rows)} rejected records: {str(e)}")
+            return 0
+
+        logger.info(f"Stored {len(rows)} rejected records in weather_rejects")
+        return len(rows)
+
+    def last_fetched_times(self):
+        """When each city was last fetched, from latest_weather
+
+        Returns:
+            Dictionary of city name -> fetched_at (or the observation time if unknown)
+        """
+        query = (
+            select(City.city_name, LatestWeather.fetched_at, LatestWeather.timestamp)
+            .join(LatestWeather, LatestWeather.city_id == City.city_id)
+        )
+        with self.unit_of_work() as session:
+            return {name: fetched_at or timestamp for name, fetched_at, timestamp in session.execute(query)}
+
+    def update_rollups(self, start, end, city_ids=None):
+        """Refresh the hourly/daily rollup buckets covering newly loaded rows"""
+        if self.engine.dialect.name != 'postgresql':
+            return
+
+        try:
+            with metrics.timer('db', op='refresh_rollups'), self.unit_of_work() as session:
+                written = refresh_rollups(session.connection(), start, end, city_ids)
+            logger.info(f"Refreshed {written} rollup buckets")
+        except Exception as e:
+            logger.error(f"Failed to refresh rollups (run rollups.py --rebuild): {str(e)}")
+
+    def bump_data_version(self):
+        """Mark newly committed data, so cached dashboard query results are refreshed"""
+        try:
+            with metrics.timer('db', op='bump_version'), self.unit_of_work() as session:
+                version = bump_data_version(session.connection())
+            logger.debug(f"Data version is now {version}")
+        except Exception as e:
+            logger.error(f"Failed to bump the data version: {str(e)}")
+
     def close(self):
-        """Close database session"""
+        """Close the session, returning its connection to the shared pool"""
         self.session.close()
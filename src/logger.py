@@ -5,12 +5,13 @@ Logging setup for the pipeline
 import logging
 from datetime import datetime
 import os
+from config import LOG_DIR
 
 def setup_logger():
     """setup logger that writes to both console and file"""
 
     #create logs directory if it doesnt exist
-    os.makedirs('logs',exist_ok=True)
+    os.makedirs(LOG_DIR,exist_ok=True)
 
     #create logger
     logger=logging.getLogger('weather pipeline')
@@ -29,7 +30,7 @@ def setup_logger():
     console_handler.setFormatter(console_format)
 
     #file handler (detailed logs)
-    log_filename=f"log/pipeline_{datetime.now().strftime('%Y%m%d')}.log"
+    log_filename=os.path.join(LOG_DIR,f"pipeline_{datetime.now().strftime('%Y%m%d')}.log")
     file_handler = logging.FileHandler(log_filename)
     file_handler.setLevel(logging.DEBUG)
     file_format=logging.Formatter(
@@ -0,0 +1,237 @@
+"""
+Pipeline metrics: per-stage timings, counters and gauges
+
+A process-wide registry that the hot paths record into (HTTP latency per
+city, parse time, DB round trips and commits, retries, 429s, rows loaded,
+queue depths). It can be exported as:
+
+- Prometheus text format, written atomically to METRICS_FILE (for the
+  node_exporter textfile collector) or served on METRICS_PORT
+- one JSON line per run appended to METRICS_JSON_LOG
+
+Only the standard library is used, so recording stays cheap and importing
+this module does not slow down startup.
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from config import METRICS_FILE, METRICS_JSON_LOG
+from logger import setup_logger
+from utils import utc_now
+
+logger = setup_logger()
+
+#histogram bucket upper bounds, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+PREFIX = 'weather_'
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class Timing:
+    """Histogram of observed durations for one metric/label set"""
+
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+
+class Metrics:
+    """Thread-safe registry of counters, gauges and timings"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {}
+        self.gauges = {}
+        self.timings = {}
+
+    def inc(self, name, value=1, **labels):
+        """Add value to a counter"""
+        key = _key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        """Set a gauge to its current value"""
+        with self.lock:
+            self.gauges[_key(name, labels)] = value
+
+    def observe(self, name, seconds, **labels):
+        """Record one duration"""
+        key = _key(name, labels)
+        with self.lock:
+            timing = self.timings.get(key)
+            if timing is None:
+                timing = self.timings[key] = Timing()
+            timing.observe(seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Time the body of a with block (recorded even if it raises)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def reset(self):
+        """Clear everything, e.g. between runs in a long-lived process"""
+        with self.lock:
+            self.started = time.time()
+            self.counters.clear()
+            self.gauges.clear()
+            self.timings.clear()
+
+    def snapshot(self):
+        """Plain-dict view of all metrics, for the JSON log"""
+        def flat(key):
+            name, labels = key
+            return name + _format_labels(labels)
+
+        with self.lock:
+            return {
+                'counters': {flat(key): value for key, value in self.counters.items()},
+                'gauges': {flat(key): value for key, value in self.gauges.items()},
+                'timings': {
+                    flat(key): {
+                        'count': t.count,
+                        'total_s': round(t.total, 6),
+                        'avg_s': round(t.total / t.count, 6) if t.count else 0,
+                        'max_s': round(t.max, 6)
+                    }
+                    for key, t in self.timings.items()
+                }
+            }
+
+    def to_prometheus(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = []
+
+        def group(entries):
+            names = {}
+            for (name, labels), value in sorted(entries.items()):
+                names.setdefault(name, []).append((labels, value))
+            return names.items()
+
+        with self.lock:
+            for name, series in group(self.counters):
+                lines.append(f"# TYPE {PREFIX}{name}_total counter")
+                lines.extend(f"{PREFIX}{name}_total{_format_labels(labels)} {value}" for labels, value in series)
+
+            for name, series in group(self.gauges):
+                lines.append(f"# TYPE {PREFIX}{name} gauge")
+                lines.extend(f"{PREFIX}{name}{_format_labels(labels)} {value}" for labels, value in series)
+
+            for name, series in group(self.timings):
+                metric = f"{PREFIX}{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                for labels, t in series:
+                    cumulative = 0
+                    for bound, count in zip(BUCKETS, t.buckets):
+                        cumulative += count
+                        lines.append(f"{metric}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"{metric}_bucket{_format_labels(labels, [('le', '+Inf')])} {t.count}")
+                    lines.append(f"{metric}_sum{_format_labels(labels)} {t.total:.6f}")
+                    lines.append(f"{metric}_count{_format_labels(labels)} {t.count}")
+
+        return '\n'.join(lines) + '\n'
+
+
+#process-wide registry used by the pipeline modules
+metrics = Metrics()
+
+
+def write_textfile(path=METRICS_FILE, registry=metrics):
+    """Write the Prometheus text file atomically so a scrape never sees half a file"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        f.write(registry.to_prometheus())
+    os.replace(tmp, path)
+
+
+def log_json(run, path=METRICS_JSON_LOG, registry=metrics, **fields):
+    """Append one structured JSON line describing a run
+
+    Args:
+        run: Name of the run ('extract', 'scheduler', 'shard', ...)
+        path: JSON-lines file to append to
+        fields: Extra top-level fields (worker_id, shard_id, ...)
+    """
+    record = {
+        #naive UTC, like every timestamp the pipeline stores
+        'time': utc_now().isoformat(timespec='seconds'),
+        'run': run,
+        'duration_s': round(time.time() - registry.started, 3),
+        **fields,
+        **registry.snapshot()
+    }
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a') as f:
+        f.write(json.dumps(record, default=str) + '\n')
+
+
+def export(run, registry=metrics, **fields):
+    """Write both the Prometheus text file and the JSON run log, never raising"""
+    try:
+        write_textfile(registry=registry)
+        log_json(run, registry=registry, **fields)
+    except OSError as e:
+        logger.warning(f"Failed to export metrics: {str(e)}")
+
+
+def serve(port, registry=metrics):
+    """Serve GET /metrics on a daemon thread
+
+    Returns:
+        The HTTPServer (call shutdown() to stop it)
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.to_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('', port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Serving metrics on :{port}/metrics")
+    return server
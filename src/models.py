@@ -1,7 +1,9 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, create_engine
+from sqlalchemy import Column, Integer, String, Text, Float, DateTime, ForeignKey, Index, PrimaryKeyConstraint, func, select, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import CreateColumn
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
-from datetime import datetime
+from sqlalchemy.orm import relationship, declared_attr
+from utils import utc_now
 import os
 from dotenv import load_dotenv
 
@@ -18,9 +20,19 @@ class City(Base):
 
 class WeatherData(Base):
     __tablename__ = 'weather_data'
+    # On PostgreSQL the table is range-partitioned by month on timestamp (see
+    # partitions.py), so the partition key has to be part of the primary key
+    # and of any unique index. timestamp is the upstream observation time
+    # (OWM `dt`), which makes (city_id, timestamp) the deduplication key;
+    # fetched_at records when the pipeline pulled it.
+    __table_args__ = (
+        Index('ux_weather_data_city_timestamp', 'city_id', text('timestamp DESC'), unique=True),
+        {'postgresql_partition_by': 'RANGE (timestamp)'},
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)
     city_id = Column(Integer, ForeignKey('cities.city_id'), nullable=False)
-    timestamp = Column(DateTime, nullable=False, default=datetime.now)
+    timestamp = Column(DateTime, primary_key=True, nullable=False, default=utc_now)
+    fetched_at = Column(DateTime, default=utc_now)
     temperature = Column(Float)
     feels_like = Column(Float)
     temp_min = Column(Float)
@@ -34,7 +46,151 @@ class WeatherData(Base):
     cloudiness = Column(Float)
     visibility = Column(Integer)
 
+class LatestWeather(Base):
+    """Newest observation per city, upserted by DataLoader alongside each insert"""
+    __tablename__ = 'latest_weather'
+    city_id = Column(Integer, ForeignKey('cities.city_id'), primary_key=True)
+    timestamp = Column(DateTime, nullable=False)
+    fetched_at = Column(DateTime)
+    temperature = Column(Float)
+    feels_like = Column(Float)
+    temp_min = Column(Float)
+    temp_max = Column(Float)
+    humidity = Column(Float)
+    pressure = Column(Float)
+    weather_main = Column(String(50))
+    weather_description = Column(String(100))
+    wind_speed = Column(Float)
+    wind_direction = Column(Float)
+    cloudiness = Column(Float)
+    visibility = Column(Integer)
+
+class WeatherReject(Base):
+    """Payloads the transform step refused (see transform.py), kept for inspection and reprocessing"""
+    __tablename__ = 'weather_rejects'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    city = Column(String(100), nullable=False)
+    fetched_at = Column(DateTime, nullable=False)
+    timestamp = Column(DateTime)
+    reason = Column(String(100), nullable=False)
+    payload = Column(Text, nullable=False)
+
+class RollupMixin:
+    """Per-city min/mean/max aggregates for one time bucket (see rollups.py)"""
+
+    @declared_attr
+    def city_id(cls):
+        return Column(Integer, ForeignKey('cities.city_id'), primary_key=True)
+
+    bucket = Column(DateTime, primary_key=True)
+    sample_count = Column(Integer, nullable=False)
+    temperature_min = Column(Float)
+    temperature_avg = Column(Float)
+    temperature_max = Column(Float)
+    temp_min = Column(Float)
+    temp_max = Column(Float)
+    humidity_min = Column(Float)
+    humidity_avg = Column(Float)
+    humidity_max = Column(Float)
+    wind_speed_min = Column(Float)
+    wind_speed_avg = Column(Float)
+    wind_speed_max = Column(Float)
+    pressure_min = Column(Float)
+    pressure_avg = Column(Float)
+    pressure_max = Column(Float)
+
+class WeatherHourly(RollupMixin, Base):
+    __tablename__ = 'weather_hourly'
+
+class WeatherDaily(RollupMixin, Base):
+    __tablename__ = 'weather_daily'
+
+class ExtractShard(Base):
+    """Work queue row for one shard of the city list (see sharding.py)"""
+    __tablename__ = 'extract_shards'
+    shard_id = Column(Integer, primary_key=True, autoincrement=False)
+    worker_id = Column(String(100))
+    lease_expires_at = Column(DateTime)
+    #compared with the database's now() by sharding.py, so it is set on the server too
+    next_run_at = Column(DateTime, nullable=False, server_default=func.now())
+    last_completed_at = Column(DateTime)
+
+class BackfillJob(Base):
+    """Time range a backfill job was first run with (see backfill.py)
+
+    A job started without an explicit end runs up to the time it was first
+    started; reruns reuse that end so they plan the same chunks.
+    """
+    __tablename__ = 'backfill_jobs'
+    job = Column(String(100), primary_key=True)
+    start = Column(DateTime)
+    end = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=utc_now)
+
+class BackfillChunk(Base):
+    """Checkpoint for one finished chunk of a backfill job (see backfill.py)
+
+    A rerun of the same job skips chunks that have a row here, so an
+    interrupted backfill resumes where it stopped.
+    """
+    __tablename__ = 'backfill_chunks'
+    job = Column(String(100), primary_key=True)
+    chunk_id = Column(String(40), primary_key=True)
+    label = Column(String(200))
+    rows_loaded = Column(Integer, nullable=False, default=0)
+    completed_at = Column(DateTime, nullable=False, default=utc_now)
+
+class DataVersion(Base):
+    """Single-row counter bumped after every committed load (see bump_data_version)
+
+    The dashboard's shared query cache keys its entries on this version, so
+    cached results stay valid until new data is committed.
+    """
+    __tablename__ = 'data_version'
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=utc_now)
+
+def bump_data_version(conn):
+    """Advance the data version by one, in the caller's transaction
+
+    Returns:
+        The new version
+    """
+    table = DataVersion.__table__
+    updated = conn.execute(table.update().where(table.c.id == 1)
+                           .values(version=table.c.version + 1, updated_at=utc_now()))
+    if updated.rowcount == 0:
+        conn.execute(table.insert().values(id=1, version=1, updated_at=utc_now()))
+    return conn.execute(select(table.c.version).where(table.c.id == 1)).scalar()
+
+def _sqlite_composite_autoincrement(table):
+    """The autoincrement column of a composite primary key (only weather_data has one)"""
+    auto = table.autoincrement_column
+    return auto if auto is not None and len(table.primary_key.columns) > 1 else None
+
+# SQLite only autoincrements a lone INTEGER PRIMARY KEY, so weather_data's
+# (id, timestamp) key is reduced to id there; the partition column only needs
+# to be part of the key on PostgreSQL.
+@compiles(CreateColumn, 'sqlite')
+def _sqlite_create_column(create, compiler, **kw):
+    column = create.element
+    if column is _sqlite_composite_autoincrement(column.table):
+        return f"{compiler.preparer.format_column(column)} INTEGER NOT NULL"
+    return compiler.visit_create_column(create, **kw)
+
+@compiles(PrimaryKeyConstraint, 'sqlite')
+def _sqlite_primary_key(constraint, compiler, **kw):
+    auto = _sqlite_composite_autoincrement(constraint.table)
+    if auto is not None:
+        return f"PRIMARY KEY ({compiler.preparer.format_column(auto)})"
+    return compiler.visit_primary_key_constraint(constraint, **kw)
+
 def get_database_url():
+    # DATABASE_URL wins when set, e.g. a throwaway database for benchmarks
+    url = os.getenv('DATABASE_URL')
+    if url:
+        return url
     host = os.getenv('DB_HOST', 'localhost')
     port = os.getenv('DB_PORT', '5432')
     database = os.getenv('DB_NAME', 'weather_pipeline')
@@ -43,8 +199,19 @@ def get_database_url():
     return f"postgresql://{user}:{password}@{host}:{port}/{database}"
 
 def create_tables():
-    engine = create_engine(get_database_url())
+    from db import get_engine
+
+    engine = get_engine(statement_timeout=0)
     Base.metadata.create_all(engine)
+    if engine.dialect.name == 'postgresql':
+        from partitions import ensure_partitions, is_partitioned
+        with engine.connect() as conn:
+            partitioned = is_partitioned(conn)
+        if not partitioned:
+            #create_all leaves an existing table alone, so an older database keeps its old layout
+            print("✗ weather_data predates partitioning; run: python3 src/partitions.py --migrate")
+            return engine
+        ensure_partitions(engine)
     print("✓ Tables created!")
     return engine
 
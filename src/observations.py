@@ -0,0 +1,153 @@
+"""
+Columnar batch of weather observations
+
+ObservationBatch is what travels from the transform step to the loader and
+the landing zone: one NumPy array per column instead of one dict per
+reading. Numeric and time columns are unboxed float64/datetime64 arrays,
+missing values are NaN/NaT, and conversion to pandas or Arrow reuses the
+arrays instead of copying them. Python objects are only built for the
+current DB batch, right before the INSERT.
+"""
+
+import numpy as np
+
+#column -> dtype, in the order the pipeline has always produced records
+COLUMNS = {
+    'city': object,
+    'country': object,
+    'timestamp': 'datetime64[us]',
+    'fetched_at': 'datetime64[us]',
+    'temperature': 'float64',
+    'feels_like': 'float64',
+    'temp_min': 'float64',
+    'temp_max': 'float64',
+    'humidity': 'float64',
+    'pressure': 'float64',
+    'weather_main': object,
+    'weather_description': object,
+    'wind_speed': 'float64',
+    'wind_direction': 'float64',
+    'cloudiness': 'float64',
+    'visibility': 'float64',
+    'latitude': 'float64',
+    'longitude': 'float64',
+}
+
+#float columns stored as integers in the database and in Parquet
+INTEGER_COLUMNS = {'visibility'}
+
+
+def _python_values(values, integer=False):
+    """Column slice -> list of Python values with None for NaN/NaT"""
+    if values.dtype.kind == 'f':
+        missing = np.isnan(values)
+        if integer:
+            values = np.where(missing, 0, values).astype('int64')
+        if missing.any():
+            values = values.astype(object)
+            values[missing] = None
+    elif values.dtype.kind == 'M':
+        missing = np.isnat(values)
+        if missing.any():
+            values = values.astype(object)
+            values[missing] = None
+    return values.tolist()
+
+
+class ObservationBatch:
+    """Structure-of-arrays batch of observations"""
+
+    __slots__ = ('columns',)
+
+    def __init__(self, columns):
+        """
+        Args:
+            columns: Dictionary of column name -> array-like, all the same length;
+                     missing columns are filled with NaN/NaT/None
+        """
+        size = len(next(iter(columns.values()))) if columns else 0
+        self.columns = {}
+        for name, dtype in COLUMNS.items():
+            values = columns.get(name)
+            if values is None:
+                values = np.full(size, None if dtype is object else np.nan,
+                                 dtype=object if dtype is object else 'float64')
+            self.columns[name] = np.asarray(values).astype(dtype, copy=False)
+
+    @classmethod
+    def from_pandas(cls, df):
+        """Wrap a DataFrame's columns (no copy for float and datetime columns)"""
+        columns = {}
+        for name, dtype in COLUMNS.items():
+            if name not in df:
+                continue
+            series = df[name]
+            if dtype == 'float64':
+                columns[name] = series.to_numpy(dtype='float64', na_value=np.nan)
+            elif dtype is object:
+                columns[name] = series.to_numpy(dtype=object)
+            else:
+                columns[name] = series.to_numpy(dtype='datetime64[us]')
+        return cls(columns)
+
+    @classmethod
+    def from_records(cls, records):
+        """Build a batch from record dicts (the pre-batch representation)"""
+        return cls({name: [record.get(name) for record in records] for name in COLUMNS})
+
+    def __len__(self):
+        return len(self.columns['city'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def take(self, selector):
+        """Rows selected by a boolean mask or an index array, as a new batch"""
+        return ObservationBatch({name: values[selector] for name, values in self.columns.items()})
+
+    def cities(self):
+        """First row of each distinct city, as the dicts DataLoader.resolve_city_ids expects"""
+        _, first = np.unique(self.columns['city'].astype(str), return_index=True)
+        return [
+            {'city': self.columns['city'][i], 'country': self.columns['country'][i],
+             'latitude': float(self.columns['latitude'][i]), 'longitude': float(self.columns['longitude'][i])}
+            for i in first
+        ]
+
+    def rows(self, names, start=0, stop=None, extra=None):
+        """Materialize rows [start:stop] as dicts for an executemany INSERT
+
+        Args:
+            names: Columns to include
+            start, stop: Row range, so only one DB batch of Python objects exists at a time
+            extra: Optional dictionary of name -> array of additional per-row columns
+        """
+        columns = {name: _python_values(self.columns[name][start:stop], name in INTEGER_COLUMNS) for name in names}
+        for name, values in (extra or {}).items():
+            columns[name] = values[start:stop].tolist()
+        keys = list(columns)
+        return [dict(zip(keys, values)) for values in zip(*columns.values())]
+
+    def to_pandas(self):
+        """DataFrame view of the batch (float and datetime columns are not copied)"""
+        import pandas as pd
+
+        return pd.DataFrame(self.columns, copy=False)
+
+    def to_arrow(self, schema=None):
+        """Arrow table of the batch; NaN/NaT become nulls
+
+        Args:
+            schema: Optional target schema (e.g. landing.SCHEMA); columns are cast to it
+        """
+        import pyarrow as pa
+
+        arrays = {}
+        for name, values in self.columns.items():
+            if name in INTEGER_COLUMNS:
+                array = pa.array(values, from_pandas=True).cast(pa.int64(), safe=False)
+            else:
+                array = pa.array(values, from_pandas=True)
+            arrays[name] = array
+        table = pa.table(arrays)
+        return table.select(schema.names).cast(schema) if schema is not None else table
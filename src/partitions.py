@@ -0,0 +1,216 @@
+"""
+Partition management for the time-partitioned weather_data table
+
+Creates monthly partitions ahead of time and detaches or drops the ones
+that fall outside the retention window. Meant to run from cron, e.g. daily:
+
+    python3 src/partitions.py --months-ahead 3 --retention-months 24 --drop
+
+A database created before weather_data was partitioned is converted once with:
+
+    python3 src/partitions.py --migrate
+"""
+
+import argparse
+import re
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from db import dispose_engines, get_engine
+from config import PARTITION_MONTHS_AHEAD, RETENTION_MONTHS
+from logger import setup_logger
+from utils import utc_now
+
+logger = setup_logger()
+
+PARTITION_NAME = re.compile(r'_y(\d{4})m(\d{2})$')
+
+
+def add_months(year, month, count):
+    """Shift a (year, month) pair by count months"""
+    index = year * 12 + (month - 1) + count
+    return index // 12, index % 12 + 1
+
+
+def partition_name(table, year, month):
+    return f"{table}_y{year:04d}m{month:02d}"
+
+
+def list_partitions(conn, table='weather_data'):
+    """Return the names of all partitions attached to a table"""
+    rows = conn.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = :table AND pg_table_is_visible(parent.oid)
+    """), {'table': table})
+    return [row[0] for row in rows]
+
+
+def ensure_partitions(engine, table='weather_data', months_ahead=PARTITION_MONTHS_AHEAD, today=None, since=None):
+    """Create monthly partitions from the current month up to months_ahead
+
+    A default partition catches rows outside every monthly range so inserts
+    never fail because the job has not run yet.
+
+    Args:
+        since: Optional earlier datetime to start from instead of the current
+               month, e.g. the start of a backfill
+    Returns:
+        List of partitions that were created
+    """
+    with engine.begin() as conn:
+        created = _create_partitions(conn, table, months_ahead, today or utc_now(), since)
+
+    for name in created:
+        logger.info(f"Created partition {name}")
+    return created
+
+
+def _create_partitions(conn, table, months_ahead, today, since):
+    """ensure_partitions inside the caller's transaction"""
+    first = since if since is not None and since < today else today
+    months = (today.year - first.year) * 12 + today.month - first.month + months_ahead
+    created = []
+    existing = set(list_partitions(conn, table))
+
+    default = f"{table}_default"
+    if default not in existing:
+        conn.execute(text(f"CREATE TABLE {default} PARTITION OF {table} DEFAULT"))
+        created.append(default)
+
+    for offset in range(months + 1):
+        year, month = add_months(first.year, first.month, offset)
+        name = partition_name(table, year, month)
+        if name in existing:
+            continue
+
+        end_year, end_month = add_months(year, month, 1)
+        try:
+            with conn.begin_nested():
+                conn.execute(text(
+                    f"CREATE TABLE {name} PARTITION OF {table} "
+                    f"FOR VALUES FROM ('{year:04d}-{month:02d}-01') TO ('{end_year:04d}-{end_month:02d}-01')"
+                ))
+        except DBAPIError as e:
+            #the default partition already holds rows for this month; they stay there
+            logger.warning(f"Could not create partition {name}: {str(e.orig).strip()}")
+            continue
+        created.append(name)
+    return created
+
+
+def is_partitioned(conn, table='weather_data'):
+    """True if table exists and is a partitioned table"""
+    kind = conn.execute(text("SELECT relkind FROM pg_class WHERE relname = :table AND pg_table_is_visible(oid)"),
+                        {'table': table}).scalar()
+    return kind == 'p'
+
+
+def migrate_weather_data(engine, months_ahead=PARTITION_MONTHS_AHEAD):
+    """Convert a weather_data table created before partitioning into the partitioned layout
+
+    In one transaction the old table is renamed to weather_data_unpartitioned
+    (its indexes and id sequence too), the partitioned table is created from
+    models.WeatherData with monthly partitions covering the old rows, and the
+    rows are copied with one row per (city_id, timestamp), the most recently
+    loaded one. Columns the old table lacks (e.g. fetched_at) are left null.
+    The old table is kept for checking and can be dropped afterwards.
+
+    Returns:
+        Number of rows copied, or None if weather_data is already partitioned
+    """
+    from models import WeatherData
+
+    legacy = 'weather_data_unpartitioned'
+    with engine.begin() as conn:
+        if is_partitioned(conn):
+            logger.info("weather_data is already partitioned, nothing to migrate")
+            return None
+
+        sequence = conn.execute(text("SELECT pg_get_serial_sequence('weather_data', 'id')")).scalar()
+        indexes = conn.execute(text(
+            "SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = 'weather_data'"
+        )).scalars().all()
+        conn.execute(text(f"ALTER TABLE weather_data RENAME TO {legacy}"))
+        for index in indexes:
+            conn.execute(text(f'ALTER INDEX "{index}" RENAME TO "{index}_unpartitioned"'))
+        if sequence:
+            conn.execute(text(f"ALTER SEQUENCE {sequence} RENAME TO {legacy}_id_seq"))
+
+        WeatherData.__table__.create(conn)
+        since = conn.execute(text(f"SELECT MIN(timestamp) FROM {legacy}")).scalar()
+        _create_partitions(conn, 'weather_data', months_ahead, utc_now(), since)
+
+        old_columns = set(conn.execute(text(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = :table"
+        ), {'table': legacy}).scalars())
+        columns = ', '.join(c.name for c in WeatherData.__table__.columns if c.name in old_columns)
+        copied = conn.execute(text(f"""
+            INSERT INTO weather_data ({columns})
+            SELECT DISTINCT ON (city_id, timestamp) {columns}
+            FROM {legacy}
+            WHERE timestamp IS NOT NULL
+            ORDER BY city_id, timestamp, id DESC
+        """)).rowcount
+        conn.execute(text("SELECT setval(pg_get_serial_sequence('weather_data', 'id'), "
+                          "COALESCE((SELECT MAX(id) FROM weather_data), 0) + 1, false)"))
+        total = conn.execute(text(f"SELECT COUNT(*) FROM {legacy}")).scalar()
+
+    logger.info(f"Migrated weather_data to the partitioned layout: {copied} of {total} rows copied "
+                f"(duplicates and rows without a timestamp dropped); the old rows stay in {legacy}")
+    return copied
+
+
+def expire_partitions(engine, table='weather_data', retention_months=RETENTION_MONTHS, drop=False, today=None):
+    """Detach (and optionally drop) monthly partitions older than the retention window
+
+    Returns:
+        List of partitions that were detached
+    """
+    today = today or utc_now()
+    cutoff = add_months(today.year, today.month, -retention_months)
+    expired = []
+
+    with engine.begin() as conn:
+        for name in sorted(list_partitions(conn, table)):
+            match = PARTITION_NAME.search(name)
+            if not match:
+                continue
+            if (int(match.group(1)), int(match.group(2))) >= cutoff:
+                continue
+
+            conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+            if drop:
+                conn.execute(text(f"DROP TABLE {name}"))
+            expired.append(name)
+
+    for name in expired:
+        logger.info(f"{'Dropped' if drop else 'Detached'} expired partition {name}")
+    return expired
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage weather_data monthly partitions")
+    parser.add_argument('--months-ahead', type=int, default=PARTITION_MONTHS_AHEAD,
+                        help="How many future months to pre-create")
+    parser.add_argument('--retention-months', type=int, default=RETENTION_MONTHS,
+                        help="Months of history to keep attached")
+    parser.add_argument('--drop', action='store_true',
+                        help="Drop expired partitions instead of only detaching them")
+    parser.add_argument('--migrate', action='store_true',
+                        help="Convert an unpartitioned weather_data table from an older release first")
+    args = parser.parse_args()
+
+    #DDL and partition detaches can outlast the default statement timeout
+    engine = get_engine(statement_timeout=0)
+    if args.migrate:
+        migrate_weather_data(engine, months_ahead=args.months_ahead)
+    ensure_partitions(engine, months_ahead=args.months_ahead)
+    expire_partitions(engine, retention_months=args.retention_months, drop=args.drop)
+    dispose_engines()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Hourly and daily rollups of weather_data
+
+weather_hourly and weather_daily hold per-city min/mean/max aggregates so
+dashboard comparisons do not have to scan raw observations; latest_weather
+keeps the newest observation per city for current-state views. DataLoader
+(and so backfill.py) refreshes only the buckets it just loaded; use the
+command line for a full rebuild after writing weather_data any other way:
+
+    python3 src/rollups.py --rebuild
+"""
+
+import argparse
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, text
+from db import dispose_engines, get_engine
+from models import bump_data_version
+from logger import setup_logger
+
+logger = setup_logger()
+
+#rollup table -> (date_trunc unit, bucket length)
+GRAINS = {
+    'weather_hourly': ('hour', timedelta(hours=1)),
+    'weather_daily': ('day', timedelta(days=1)),
+}
+
+#metric -> aggregates kept for it
+METRICS = {
+    'temperature': ('min', 'avg', 'max'),
+    'humidity': ('min', 'avg', 'max'),
+    'wind_speed': ('min', 'avg', 'max'),
+    'pressure': ('min', 'avg', 'max'),
+}
+
+
+def _aggregate_columns():
+    """(rollup column, SQL expression) pairs for every stored aggregate"""
+    columns = [('sample_count', 'COUNT(*)')]
+    for metric, aggregates in METRICS.items():
+        for agg in aggregates:
+            columns.append((f'{metric}_{agg}', f'{agg.upper()}({metric})'))
+    columns.append(('temp_min', 'MIN(temp_min)'))
+    columns.append(('temp_max', 'MAX(temp_max)'))
+    return columns
+
+
+def floor_bucket(value, unit):
+    """Truncate a datetime to the start of its hour or day"""
+    value = value.replace(minute=0, second=0, microsecond=0)
+    if unit == 'day':
+        value = value.replace(hour=0)
+    return value
+
+
+def refresh_rollups(conn, start, end, city_ids=None):
+    """Recompute every rollup bucket touching [start, end] from raw rows
+
+    Buckets are recomputed in full and upserted, so refreshing the same
+    range twice is harmless.
+
+    Args:
+        conn: Open connection; the caller owns the transaction
+        start: Earliest timestamp that was loaded
+        end: Latest timestamp that was loaded
+        city_ids: Optional list of cities to limit the refresh to
+    Returns:
+        Number of rollup rows written
+    """
+    columns = _aggregate_columns()
+    names = ', '.join(name for name, _ in columns)
+    exprs = ', '.join(expr for _, expr in columns)
+    updates = ', '.join(f'{name} = EXCLUDED.{name}' for name, _ in columns)
+    city_filter = "AND city_id IN :city_ids" if city_ids else ""
+
+    written = 0
+    for table, (unit, length) in GRAINS.items():
+        query = text(f"""
+        INSERT INTO {table} (city_id, bucket, {names})
+        SELECT city_id, date_trunc('{unit}', timestamp) AS bucket, {exprs}
+        FROM weather_data
+        WHERE timestamp >= :start AND timestamp < :end {city_filter}
+        GROUP BY city_id, bucket
+        ON CONFLICT (city_id, bucket) DO UPDATE SET {updates}
+        """)
+        params = {'start': floor_bucket(start, unit), 'end': floor_bucket(end, unit) + length}
+        if city_ids:
+            query = query.bindparams(bindparam('city_ids', expanding=True))
+            params['city_ids'] = list(city_ids)
+
+        written += conn.execute(query, params).rowcount
+
+    return written
+
+
+def rebuild_latest(conn):
+    """Repopulate latest_weather with the newest weather_data row per city"""
+    columns = ('timestamp, fetched_at, temperature, feels_like, temp_min, temp_max, humidity, pressure, '
+               'weather_main, weather_description, wind_speed, wind_direction, cloudiness, visibility')
+    updates = ', '.join(f'{col} = EXCLUDED.{col}' for col in columns.split(', '))
+    return conn.execute(text(f"""
+    INSERT INTO latest_weather (city_id, {columns})
+    SELECT DISTINCT ON (city_id) city_id, {columns}
+    FROM weather_data
+    ORDER BY city_id, timestamp DESC
+    ON CONFLICT (city_id) DO UPDATE SET {updates}
+    """)).rowcount
+
+
+def rebuild_rollups(engine, since=None):
+    """Drop and recompute rollups from raw weather_data (optionally from a start date)"""
+    with engine.begin() as conn:
+        start, end = conn.execute(text("SELECT MIN(timestamp), MAX(timestamp) FROM weather_data")).one()
+        if start is None:
+            logger.info("weather_data is empty, nothing to roll up")
+            return 0
+
+        if since is not None:
+            start = max(start, since)
+            for table, (unit, _) in GRAINS.items():
+                conn.execute(text(f"DELETE FROM {table} WHERE bucket >= :start"),
+                             {'start': floor_bucket(start, unit)})
+        else:
+            for table in GRAINS:
+                conn.execute(text(f"TRUNCATE {table}"))
+
+        written = refresh_rollups(conn, start, end)
+        rebuild_latest(conn)
+        bump_data_version(conn)
+
+    logger.info(f"Rebuilt rollups from {start} to {end}: {written} rows")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain weather_hourly / weather_daily rollups and latest_weather")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="Recompute rollups from raw weather_data")
+    parser.add_argument('--since', type=datetime.fromisoformat,
+                        help="Only rebuild buckets from this date on (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    if not args.rebuild:
+        parser.print_help()
+        return
+
+    #a full rebuild can outlast the default statement timeout
+    engine = get_engine(statement_timeout=0)
+    rebuild_rollups(engine, since=args.since)
+    dispose_engines()
+
+
+if __name__ == "__main__":
+    main()
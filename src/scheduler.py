@@ -0,0 +1,192 @@
+"""
+Long-running scheduler for the weather pipeline
+
+Keeps one WeatherExtractor and one DataLoader alive, so HTTP keep-alive
+connections, the DB connection, the city cache and the response cache stay
+warm between polls. Each city is polled at its tier's interval, at a fixed
+per-city offset within the interval, so requests are spread evenly instead
+of bursting at the top of the hour.
+
+    python3 src/scheduler.py
+
+SIGINT/SIGTERM finish the batch in progress and exit cleanly. Cities whose
+last observation is older than their interval (e.g. after downtime) are
+caught up immediately, once, rather than once per missed tick.
+"""
+
+import hashlib
+import heapq
+import os
+import signal
+import threading
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+from config import CITY_TIERS, SCHEDULER_MAX_BATCH, METRICS_PORT
+from extract import WeatherExtractor
+from landing import write_run
+from load import DataLoader
+from transform import transform_payloads
+from logger import setup_logger
+from metrics import metrics, serve as serve_metrics, write_textfile, log_json
+from utils import utc_epoch
+
+load_dotenv()
+logger = setup_logger()
+
+
+def city_offset(city, interval):
+    """Stable offset in [0, interval) seconds for a city's polls"""
+    digest = hashlib.md5(city.encode('utf-8')).hexdigest()
+    return int(digest, 16) % interval
+
+
+def next_slot(city, interval, after):
+    """First poll time for a city strictly after `after` (epoch seconds)"""
+    offset = city_offset(city, interval)
+    slots = (after - offset) // interval + 1
+    return offset + slots * interval
+
+
+class Scheduler:
+    """Polls cities on per-tier intervals until stopped"""
+
+    def __init__(self, extractor, loader, tiers=CITY_TIERS, max_batch=SCHEDULER_MAX_BATCH):
+        """
+        Args:
+            extractor: WeatherExtractor kept open for the life of the daemon
+            loader: DataLoader kept open for the life of the daemon
+            tiers: Dictionary of tier name -> {'interval': seconds, 'cities': [...]}
+            max_batch: Max cities fetched per scheduler tick
+        """
+        self.extractor = extractor
+        self.loader = loader
+        self.max_batch = max_batch
+        self.stop_event = threading.Event()
+
+        self.intervals = {}
+        for tier, spec in tiers.items():
+            for city in spec['cities']:
+                self.intervals[city] = spec['interval']
+
+        self.queue = []
+
+    def schedule_initial(self, now=None):
+        """Build the first schedule, catching up cities that are overdue"""
+        now = now or time.time()
+        try:
+            last_fetched = self.loader.last_fetched_times()
+        except Exception as e:
+            logger.warning(f"Could not read last fetch times, polling every city now: {str(e)}")
+            last_fetched = {}
+
+        overdue = 0
+        for city, interval in self.intervals.items():
+            last = last_fetched.get(city)
+            if last is None or now - utc_epoch(last) >= interval:
+                due = now
+                overdue += 1
+            else:
+                due = next_slot(city, interval, utc_epoch(last))
+            heapq.heappush(self.queue, (due, city))
+
+        logger.info(f"Scheduled {len(self.intervals)} cities, {overdue} due now")
+
+    def run_batch(self, cities):
+        """Fetch and load one batch of due cities"""
+        with metrics.timer('stage', stage='extract'):
+            raws = [raw for _, raw in self.extractor.iter_payloads(cities) if raw]
+        if not raws:
+            return 0
+
+        records, rejects = transform_payloads(raws)
+
+        try:
+            with metrics.timer('stage', stage='landing'):
+                write_run(raws, records)
+        except Exception as e:
+            logger.error(f"Failed to write landing file: {str(e)}")
+
+        with metrics.timer('stage', stage='load'):
+            success, errors, loaded = self.loader.load_observations(records, return_keys=True)
+            self.loader.load_rejects(rejects)
+        self.extractor.mark_loaded(raws, loaded, self.loader.city_cache)
+        if errors:
+            logger.warning(f"{errors} records failed to load")
+        return success
+
+    def tick(self, now=None):
+        """Run every city that is due; returns seconds until the next one is due"""
+        now = now or time.time()
+        due = []
+        while self.queue and self.queue[0][0] <= now and len(due) < self.max_batch:
+            scheduled, city = heapq.heappop(self.queue)
+            interval = self.intervals[city]
+            missed = int((now - scheduled) // interval)
+            if missed:
+                logger.warning(f"{city} is {missed} poll(s) behind, catching up once")
+            due.append(city)
+
+        if due:
+            try:
+                self.run_batch(due)
+            except Exception as e:
+                logger.error(f"Batch of {len(due)} cities failed: {str(e)}")
+
+            finished = time.time()
+            for city in due:
+                heapq.heappush(self.queue, (next_slot(city, self.intervals[city], finished), city))
+            self.export_metrics(len(due))
+
+        if not self.queue:
+            return None
+        return max(0, self.queue[0][0] - time.time())
+
+    def export_metrics(self, batch_size):
+        """Publish cumulative metrics after each batch"""
+        metrics.set_gauge('scheduler_queue', len(self.queue))
+        try:
+            write_textfile()
+            log_json('scheduler', batch_size=batch_size)
+        except OSError as e:
+            logger.warning(f"Failed to export metrics: {str(e)}")
+
+    def run(self):
+        """Main loop; returns after stop() is called"""
+        self.schedule_initial()
+        while not self.stop_event.is_set():
+            wait = self.tick()
+            self.stop_event.wait(wait)
+        logger.info("Scheduler stopped")
+
+    def stop(self, *_):
+        logger.info("Shutdown requested, finishing current batch...")
+        self.stop_event.set()
+
+
+def main():
+    api_key = os.getenv('WEATHER_API_KEY')
+    if not api_key:
+        logger.error("No API key found! check your .env file")
+        return
+
+    extractor = WeatherExtractor(api_key)
+    loader = DataLoader()
+    scheduler = Scheduler(extractor, loader)
+
+    if METRICS_PORT:
+        serve_metrics(METRICS_PORT)
+
+    signal.signal(signal.SIGTERM, scheduler.stop)
+    signal.signal(signal.SIGINT, scheduler.stop)
+
+    logger.info(f"Weather scheduler started at {datetime.now():%Y-%m-%d %H:%M:%S}")
+    try:
+        scheduler.run()
+    finally:
+        extractor.close()
+        loader.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""
+Sharded extraction across worker processes or nodes
+
+The city list (config.CITIES, or the cities table with --from-db) is split
+into SHARD_COUNT shards with jump consistent hashing. Each shard is a row
+in extract_shards; workers claim a due shard with
+
+    SELECT ... FOR UPDATE SKIP LOCKED
+
+and hold a time-limited lease on it, renewed by a heartbeat while they
+work. A worker that dies stops renewing, its lease expires and another
+worker picks the shard up, so unfinished work is rebalanced and no shard
+is fetched by two workers at once. A worker whose lease is lost stops
+fetching that shard. Start as many workers as needed:
+
+    python3 src/sharding.py --worker-id node-1
+
+SIGINT/SIGTERM stop the shard in progress, release its lease and exit.
+"""
+
+import argparse
+import hashlib
+import os
+import signal
+import socket
+import threading
+import time
+from dotenv import load_dotenv
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert
+from config import CITIES, SHARD_COUNT, SHARD_INTERVAL, SHARD_LEASE_SECONDS, METRICS_PORT
+from extract import WeatherExtractor
+from load import DataLoader
+from models import ExtractShard
+from stream import stream_to_database
+from logger import setup_logger
+from metrics import metrics, export as export_metrics, serve as serve_metrics
+
+load_dotenv()
+logger = setup_logger()
+
+
+def jump_hash(key, buckets):
+    """Jump consistent hash (Lamping & Veach): maps key to [0, buckets)
+
+    Growing from N to N+1 buckets only moves ~1/(N+1) of the keys.
+    """
+    key = int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) % (1 << 64)
+        j = int((b + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return b
+
+
+def shard_cities(cities, shard_id, shard_count=SHARD_COUNT):
+    """Cities belonging to one shard"""
+    return [city for city in cities if jump_hash(city, shard_count) == shard_id]
+
+
+def ensure_shards(engine, shard_count=SHARD_COUNT):
+    """Create the extract_shards rows that do not exist yet"""
+    ExtractShard.__table__.create(engine, checkfirst=True)
+    with engine.begin() as conn:
+        conn.execute(
+            insert(ExtractShard).values(next_run_at=func.now()).on_conflict_do_nothing(index_elements=['shard_id']),
+            [{'shard_id': shard_id} for shard_id in range(shard_count)]
+        )
+
+
+def claim_shard(engine, worker_id, lease_seconds=SHARD_LEASE_SECONDS, shard_count=SHARD_COUNT):
+    """Lease the most overdue shard that nobody holds
+
+    Returns:
+        shard_id, or None if no shard is due
+    """
+    with engine.begin() as conn:
+        row = conn.execute(text("""
+        UPDATE extract_shards
+        SET worker_id = :worker_id,
+            lease_expires_at = now() + make_interval(secs => :lease)
+        WHERE shard_id = (
+            SELECT shard_id FROM extract_shards
+            WHERE shard_id < :shard_count
+              AND next_run_at <= now()
+              AND (lease_expires_at IS NULL OR lease_expires_at < now())
+            ORDER BY next_run_at
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING shard_id
+        """), {'worker_id': worker_id, 'lease': lease_seconds, 'shard_count': shard_count}).first()
+    return row[0] if row else None
+
+
+def renew_lease(engine, shard_id, worker_id, lease_seconds=SHARD_LEASE_SECONDS):
+    """Extend a held lease; returns False if the lease was lost to another worker"""
+    with engine.begin() as conn:
+        result = conn.execute(text("""
+        UPDATE extract_shards
+        SET lease_expires_at = now() + make_interval(secs => :lease)
+        WHERE shard_id = :shard_id AND worker_id = :worker_id
+        """), {'shard_id': shard_id, 'worker_id': worker_id, 'lease': lease_seconds})
+    return result.rowcount == 1
+
+
+def release_shard(engine, shard_id, worker_id, completed, interval=SHARD_INTERVAL):
+    """Give a shard back; completed shards are scheduled `interval` seconds later
+
+    A shard that was not completed keeps its next_run_at, so the next free
+    worker retries it straight away.
+    """
+    if completed:
+        query = text("""
+        UPDATE extract_shards
+        SET worker_id = NULL,
+            lease_expires_at = NULL,
+            last_completed_at = now(),
+            next_run_at = GREATEST(next_run_at + make_interval(secs => :interval), now())
+        WHERE shard_id = :shard_id AND worker_id = :worker_id
+        """)
+    else:
+        query = text("""
+        UPDATE extract_shards
+        SET worker_id = NULL,
+            lease_expires_at = NULL
+        WHERE shard_id = :shard_id AND worker_id = :worker_id
+        """)
+
+    with engine.begin() as conn:
+        conn.execute(query, {'shard_id': shard_id, 'worker_id': worker_id, 'interval': interval})
+
+
+class Heartbeat(threading.Thread):
+    """Renews a shard lease in the background while the worker fetches it"""
+
+    def __init__(self, engine, shard_id, worker_id, lease_seconds=SHARD_LEASE_SECONDS):
+        super().__init__(daemon=True)
+        self.engine = engine
+        self.shard_id = shard_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self.stopped = threading.Event()
+        self.lost = False
+
+    def run(self):
+        while not self.stopped.wait(self.lease_seconds / 3):
+            try:
+                if not renew_lease(self.engine, self.shard_id, self.worker_id, self.lease_seconds):
+                    logger.error(f"Lost lease on shard {self.shard_id}")
+                    self.lost = True
+                    return
+            except Exception as e:
+                logger.warning(f"Lease renewal for shard {self.shard_id} failed: {str(e)}")
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def run_worker(extractor, loader, cities, worker_id, shard_count=SHARD_COUNT, interval=SHARD_INTERVAL,
+               lease_seconds=SHARD_LEASE_SECONDS, idle_seconds=10, stop_event=None):
+    """Claim and process shards until stop_event is set"""
+    engine = loader.engine
+    ensure_shards(engine, shard_count)
+    stop_event = stop_event or threading.Event()
+
+    while not stop_event.is_set():
+        shard_id = claim_shard(engine, worker_id, lease_seconds, shard_count)
+        if shard_id is None:
+            stop_event.wait(idle_seconds)
+            continue
+
+        members = shard_cities(cities, shard_id, shard_count)
+        logger.info(f"{worker_id} claimed shard {shard_id} ({len(members)} cities)")
+
+        heartbeat = Heartbeat(engine, shard_id, worker_id, lease_seconds)
+        heartbeat.start()
+        completed = False
+        try:
+            #another worker may own the shard once the lease is lost
+            stream_to_database(extractor, loader, members,
+                               should_stop=lambda: heartbeat.lost or stop_event.is_set())
+            completed = not (heartbeat.lost or stop_event.is_set())
+        except Exception as e:
+            logger.error(f"Shard {shard_id} failed, releasing it for retry: {str(e)}")
+        finally:
+            heartbeat.stop()
+            release_shard(engine, shard_id, worker_id, completed, interval)
+            metrics.inc('shards_processed', result='completed' if completed else 'released')
+            export_metrics('shard', worker_id=worker_id, shard_id=shard_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run one sharded extraction worker")
+    parser.add_argument('--worker-id', default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument('--shards', type=int, default=SHARD_COUNT)
+    parser.add_argument('--interval', type=int, default=SHARD_INTERVAL,
+                        help="Seconds between runs of the same shard")
+    parser.add_argument('--from-db', action='store_true',
+                        help="Use the cities table as the city registry instead of config.CITIES")
+    args = parser.parse_args()
+
+    api_key = os.getenv('WEATHER_API_KEY')
+    if not api_key:
+        logger.error("No API key found! check your .env file")
+        return
+
+    extractor = WeatherExtractor(api_key)
+    loader = DataLoader()
+    cities = sorted(loader.city_cache) if args.from_db else CITIES
+
+    if METRICS_PORT:
+        serve_metrics(METRICS_PORT)
+
+    stop_event = threading.Event()
+
+    def stop(*_):
+        logger.info("Shutdown requested, releasing the current shard...")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    try:
+        run_worker(extractor, loader, cities, args.worker_id, args.shards, args.interval, stop_event=stop_event)
+        logger.info("Worker stopped")
+    finally:
+        extractor.close()
+        loader.close()
+
+
+if __name__ == "__main__":
+    main()
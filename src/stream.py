@@ -0,0 +1,163 @@
+"""
+Streaming extract -> load pipeline with bounded memory
+
+The extractor runs on a background thread and pushes each record into a
+bounded queue as soon as it arrives; the loader drains the queue in
+micro-batches. Extraction and database writes overlap, and at most
+STREAM_QUEUE_SIZE + STREAM_BATCH_SIZE records are held in memory no
+matter how many cities are tracked.
+"""
+
+import queue
+import threading
+import time
+from config import STREAM_QUEUE_SIZE, STREAM_BATCH_SIZE, STREAM_FLUSH_SECONDS
+from logger import setup_logger
+from metrics import metrics
+
+logger = setup_logger()
+
+#marks the end of the extractor's output
+_DONE = object()
+
+#how often a producer blocked on a full queue checks whether the loader has stopped
+_PUT_TIMEOUT = 0.5
+
+
+def _put(records, item, stop):
+    """Put onto the bounded queue unless the loader side has stopped
+
+    Returns:
+        False if stop was set before the item could be queued
+    """
+    while not stop.is_set():
+        try:
+            records.put(item, timeout=_PUT_TIMEOUT)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _produce(extractor, cities, records, errors, stop):
+    """Extractor thread: push every successful raw payload onto the queue until stopped"""
+    payloads = extractor.iter_payloads(cities)
+    try:
+        for _, raw in payloads:
+            if raw and not _put(records, raw, stop):
+                return
+    except Exception as e:
+        errors.append(e)
+    finally:
+        #closing the generator waits for requests in flight and shuts the extractor's pool down
+        payloads.close()
+        _put(records, _DONE, stop)
+
+
+def stream_to_database(extractor, loader, cities, batch_size=STREAM_BATCH_SIZE,
+                       queue_size=STREAM_QUEUE_SIZE, flush_seconds=STREAM_FLUSH_SECONDS, on_batch=None,
+                       should_stop=None):
+    """Fetch cities and load them into the database as they arrive
+
+    Each micro-batch of raw payloads goes through transform.transform_payloads;
+    valid records are loaded and rejects are stored in weather_rejects. A
+    micro-batch is flushed when it reaches batch_size records, or flush_seconds
+    after the loader started waiting for its first record, whichever comes
+    first. Records arriving in the meantime do not push the flush back, so no
+    record waits longer than flush_seconds.
+
+    Args:
+        extractor: WeatherExtractor
+        loader: DataLoader
+        cities: Iterable of city names
+        batch_size: Max records per loader call
+        queue_size: Max records buffered between extractor and loader
+        flush_seconds: Max time a record waits in a partial batch
+        on_batch: Optional callback receiving each micro-batch after it is
+            loaded, as (raw payloads, ObservationBatch of transformed records)
+        should_stop: Optional callable checked between records; once it returns
+            True the batch in hand is flushed and the extractor is stopped
+    Returns:
+        (success_count, error_count)
+    """
+    #pandas comes in with the transform; keep it off the extractor's import path
+    from transform import transform_payloads
+
+    records = queue.Queue(maxsize=queue_size)
+    errors = []
+    stop = threading.Event()
+    producer = threading.Thread(target=_produce, args=(extractor, cities, records, errors, stop), daemon=True)
+    producer.start()
+    try:
+        success_count, error_count = _consume(records, extractor, loader, batch_size, flush_seconds, on_batch,
+                                              transform_payloads, should_stop)
+    finally:
+        #a failed load must not leave the producer blocked on a full queue
+        stop.set()
+        _drain(records)
+        producer.join()
+
+    if errors:
+        raise errors[0]
+
+    logger.info(f"Streaming load complete: {success_count} successful, {error_count} failed")
+    return success_count, error_count
+
+
+def _drain(records):
+    """Discard whatever the producer queued after the loader stopped"""
+    while True:
+        try:
+            records.get_nowait()
+        except queue.Empty:
+            return
+
+
+def _consume(records, extractor, loader, batch_size, flush_seconds, on_batch, transform_payloads, should_stop=None):
+    """Loader side of stream_to_database: micro-batch the queue until _DONE
+
+    Returns:
+        (success_count, error_count)
+    """
+
+    success_count = 0
+    error_count = 0
+    batch = []
+    deadline = time.monotonic() + flush_seconds
+    done = False
+
+    while not done:
+        try:
+            record = records.get(timeout=max(0, deadline - time.monotonic()))
+        except queue.Empty:
+            record = None
+
+        metrics.set_gauge('stream_queue_depth', records.qsize())
+        if record is _DONE:
+            done = True
+        elif record is not None:
+            batch.append(record)
+        if not done and should_stop and should_stop():
+            logger.warning("Streaming load stopped before the extractor finished")
+            done = True
+
+        if batch and (done or record is None or len(batch) >= batch_size):
+            transformed, rejects = transform_payloads(batch)
+            with metrics.timer('stage', stage='load'):
+                ok, failed, loaded = loader.load_observations(transformed, return_keys=True)
+                loader.load_rejects(rejects)
+            #only observations whose rows committed may be skipped by the cache
+            extractor.mark_loaded(batch, loaded, loader.city_cache)
+            success_count += ok
+            error_count += failed
+            if on_batch:
+                with metrics.timer('stage', stage='landing'):
+                    on_batch(batch, transformed)
+            metrics.inc('stream_batches')
+            logger.debug(f"Flushed {len(batch)} records, queue depth {records.qsize()}")
+            batch = []
+
+        if record is None or not batch:
+            deadline = time.monotonic() + flush_seconds
+
+    return success_count, error_count
@@ -0,0 +1,227 @@
+"""
+Vectorized transform from raw OWM payloads to weather records
+
+The extractor only does HTTP; it hands over raw payloads as
+{'city', 'fetched_at', 'payload'} dicts. transform_payloads() turns a batch
+of them into records in one columnar pass: fields are pulled out of the
+JSON once, then unit conversion, defaulting and range validation run as
+NumPy/pandas column operations. Valid rows come back as an
+ObservationBatch; rows that fail validation come back separately, with the
+reason and the original payload, for the weather_rejects table.
+
+Raw payloads are also kept in the raw landing zone, so a batch can be
+transformed again after a fix:
+
+    python3 src/transform.py reprocess --date 2025-10-16
+"""
+
+import argparse
+import json
+from datetime import date, datetime, timedelta
+import numpy as np
+import pandas as pd
+from observations import ObservationBatch
+from logger import setup_logger
+from metrics import metrics
+from utils import utc_now
+
+logger = setup_logger()
+
+#columns pulled out of each OWM current-weather payload, in _fields() order
+FIELDS = [
+    'country', 'dt', 'temperature', 'feels_like', 'temp_min', 'temp_max', 'humidity', 'pressure',
+    'weather_main', 'weather_description', 'wind_speed', 'wind_direction', 'cloudiness',
+    'visibility', 'latitude', 'longitude'
+]
+
+KELVIN_COLUMNS = ['temperature', 'feels_like', 'temp_min', 'temp_max']
+NUMERIC_COLUMNS = KELVIN_COLUMNS + ['humidity', 'pressure', 'wind_speed', 'wind_direction',
+                                    'cloudiness', 'visibility', 'latitude', 'longitude']
+
+#optional fields and the value used when OWM leaves them out (visibility stays unknown)
+DEFAULTS = {'country': 'Unknown', 'wind_speed': 0, 'wind_direction': 0, 'cloudiness': 0}
+
+#fields a record cannot be stored without
+REQUIRED = ['temperature', 'humidity', 'pressure', 'latitude', 'longitude', 'weather_main']
+
+#plausible ranges after unit conversion; rows outside them are rejected
+RANGES = {
+    'temperature': (-90, 60),
+    'humidity': (0, 100),
+    'pressure': (870, 1085),
+    'wind_speed': (0, 115),
+    'wind_direction': (0, 360),
+    'cloudiness': (0, 100),
+    'visibility': (0, 100000),
+    'latitude': (-90, 90),
+    'longitude': (-180, 180),
+}
+
+REJECT_COLUMNS = ['city', 'fetched_at', 'timestamp', 'reason', 'payload']
+
+
+_EMPTY = {}
+
+
+def _section(payload, key):
+    value = payload.get(key)
+    return value if isinstance(value, dict) else _EMPTY
+
+
+def _fields(payload):
+    """One payload -> tuple of FIELDS (None where missing)
+
+    This per-record loop is the only Python-level work in the transform, so it
+    does nothing but dictionary lookups.
+    """
+    if not isinstance(payload, dict):
+        return (None,) * len(FIELDS)
+    main = _section(payload, 'main')
+    wind = _section(payload, 'wind')
+    coord = _section(payload, 'coord')
+    weather = payload.get('weather')
+    condition = weather[0] if weather and isinstance(weather, list) and isinstance(weather[0], dict) else _EMPTY
+    return (
+        _section(payload, 'sys').get('country'), payload.get('dt'),
+        main.get('temp'), main.get('feels_like'), main.get('temp_min'), main.get('temp_max'),
+        main.get('humidity'), main.get('pressure'),
+        condition.get('main'), condition.get('description'),
+        wind.get('speed'), wind.get('deg'), _section(payload, 'clouds').get('all'),
+        payload.get('visibility'), coord.get('lat'), coord.get('lon')
+    )
+
+
+def transform_payloads(raws):
+    """Transform a batch of raw payloads into weather records
+
+    Args:
+        raws: List of {'city', 'fetched_at', 'payload'} dicts from the extractor
+    Returns:
+        (records, rejects) - records is an ObservationBatch, rejects a DataFrame
+        with REJECT_COLUMNS and the first failed check as reason
+    """
+    if not raws:
+        return ObservationBatch({}), pd.DataFrame(columns=REJECT_COLUMNS)
+
+    with metrics.timer('transform'):
+        frame = pd.DataFrame.from_records([_fields(raw['payload']) for raw in raws], columns=FIELDS)
+        frame.insert(0, 'city', [raw['city'] for raw in raws])
+        frame['fetched_at'] = pd.to_datetime([raw['fetched_at'] for raw in raws])
+
+        for col in NUMERIC_COLUMNS:
+            frame[col] = pd.to_numeric(frame[col], errors='coerce')
+        for col, default in DEFAULTS.items():
+            frame[col] = frame[col].fillna(default)
+
+        #observation time from the API, so re-fetching the same observation dedupes on load;
+        #stored as naive UTC so the key neither repeats at a DST fall-back nor depends on the host's zone
+        dt = pd.to_numeric(frame['dt'], errors='coerce')
+        frame['timestamp'] = pd.to_datetime(dt, unit='s').fillna(frame['fetched_at'])
+
+        frame[KELVIN_COLUMNS] = (frame[KELVIN_COLUMNS] - 273.15).round(2)
+
+        failed, reasons = _check(frame)
+        frame['visibility'] = frame['visibility'].round()
+        records = ObservationBatch.from_pandas(frame.loc[~failed])
+
+        rejects = frame.loc[failed, ['city', 'fetched_at', 'timestamp']].reset_index(drop=True)
+        rejects['reason'] = reasons[failed]
+        rejects['payload'] = [json.dumps(raws[i]['payload'], default=str) for i in np.flatnonzero(failed)]
+
+    _count_rejects(rejects, len(frame))
+    return records, rejects
+
+
+def _check(frame):
+    """Run the REQUIRED and RANGES checks over a frame of converted records
+
+    Returns:
+        (failed, reasons) - boolean mask and the first failed check per row ('' if none)
+    """
+    #first failing check wins; np.select evaluates them all column-wise
+    checks = [(frame[col].isna(), f"missing {col}") for col in REQUIRED]
+    for col, (low, high) in RANGES.items():
+        checks.append((frame[col].notna() & ~frame[col].between(low, high), f"{col} out of range"))
+    failed = np.logical_or.reduce([mask.to_numpy() for mask, _ in checks])
+    reasons = np.select([mask.to_numpy() for mask, _ in checks], [reason for _, reason in checks], default='')
+    return failed, reasons
+
+
+def _count_rejects(rejects, total):
+    if len(rejects):
+        for reason, count in rejects['reason'].value_counts().items():
+            metrics.inc('rows_rejected', int(count), reason=reason)
+        logger.warning(f"Rejected {len(rejects)} of {total} records: "
+                       f"{', '.join(f'{c} {r}' for r, c in rejects['reason'].value_counts().items())}")
+
+
+def validate_records(df):
+    """Validate records that are already in record form, e.g. archived dumps
+
+    Applies the same defaults and checks as transform_payloads, to values
+    that are already in Celsius. Records without fetched_at are stamped with
+    the current time.
+
+    Args:
+        df: DataFrame with ObservationBatch columns (city and timestamp at least)
+    Returns:
+        (records, rejects) - as for transform_payloads; a reject's payload is the record as JSON
+    """
+    if df.empty:
+        return ObservationBatch({}), pd.DataFrame(columns=REJECT_COLUMNS)
+
+    with metrics.timer('transform'):
+        frame = ObservationBatch.from_pandas(df).to_pandas()
+        for col, default in DEFAULTS.items():
+            frame[col] = frame[col].fillna(default)
+        frame['fetched_at'] = frame['fetched_at'].fillna(pd.Timestamp(utc_now()))
+
+        failed, reasons = _check(frame)
+        frame['visibility'] = frame['visibility'].round()
+        records = ObservationBatch.from_pandas(frame.loc[~failed])
+
+        rejects = frame.loc[failed, ['city', 'fetched_at', 'timestamp']].reset_index(drop=True)
+        rejects['reason'] = reasons[failed]
+        rejects['payload'] = [json.dumps(row, default=str) for row in frame.loc[failed].to_dict('records')]
+
+    _count_rejects(rejects, len(frame))
+    return records, rejects
+
+
+def reprocess(start, end):
+    """Transform raw landed payloads again and load them
+
+    Observations already in weather_data are left as they are (the load
+    dedupes on city and observation time), so this fills in rows that were
+    rejected or lost, not ones that were stored with older logic.
+
+    Returns:
+        (success_count, error_count, reject_count)
+    """
+    from landing import read_raw
+    from load import DataLoader
+
+    raws = read_raw(start=start, end=end)
+    logger.info(f"Reprocessing {len(raws)} raw payloads from {start:%Y-%m-%d %H:%M} to {end:%Y-%m-%d %H:%M}")
+    records, rejects = transform_payloads(raws)
+
+    with DataLoader() as loader:
+        success, errors = loader.load_observations(records)
+        loader.load_rejects(rejects)
+    return success, errors, len(rejects)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-run the transform over raw landed payloads")
+    sub = parser.add_subparsers(dest='command', required=True)
+    again = sub.add_parser('reprocess', help="Transform and load raw payloads for a day")
+    again.add_argument('--date', type=date.fromisoformat, required=True, help="Day to reprocess, UTC (YYYY-MM-DD)")
+    args = parser.parse_args()
+
+    start = datetime.combine(args.date, datetime.min.time())
+    success, errors, rejected = reprocess(start, start + timedelta(days=1))
+    print(f"Reprocessed: {success} loaded, {errors} failed, {rejected} rejected")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Utility functions and helpers shared across the pipeline
+"""
+
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+
+def parse_retry_after(value):
+    """Parse a Retry-After header (delta-seconds or HTTP-date) into seconds
+
+    Returns:
+        Seconds to wait, or None if the header is missing or unparseable
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def utc_now():
+    """Current time as a naive UTC datetime, the form every stored timestamp takes"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def utc_epoch(moment):
+    """Epoch seconds of a naive UTC datetime"""
+    return moment.replace(tzinfo=timezone.utc).timestamp()
+
+
+def utc_from_epoch(seconds):
+    """Naive UTC datetime for epoch seconds (the inverse of utc_epoch)"""
+    return datetime.fromtimestamp(seconds, timezone.utc).replace(tzinfo=None)
+
+
+def backoff_delay(attempt, base, cap, retry_after=None):
+    """Exponential backoff with jitter for a retry attempt
+
+    Args:
+        attempt: Zero-based retry attempt number
+        base: Delay for the first retry in seconds
+        cap: Upper bound for the computed delay
+        retry_after: Optional Retry-After header from the server, which wins when present
+    Returns:
+        Seconds to wait before the next attempt
+    """
+    server_delay = parse_retry_after(retry_after)
+    if server_delay is not None:
+        return server_delay
+
+    delay = min(cap, base * (2 ** attempt))
+    #equal jitter: keep half the delay, randomize the rest
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class TokenBucket:
+    """Thread-safe token bucket rate limiter"""
+
+    def __init__(self, rate, capacity=None):
+        """
+        Args:
+            rate: Tokens refilled per second
+            capacity: Maximum burst size (defaults to one second of tokens)
+        """
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, calls, burst=None):
+        """Build a bucket from a calls-per-minute API plan"""
+        return cls(calls / 60.0, burst)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens=1):
+        """Take tokens without blocking
+
+        Returns:
+            0 if the tokens were taken, otherwise seconds until they will be available
+        """
+        with self.lock:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0
+            return (tokens - self.tokens) / self.rate
+
+    def acquire(self, tokens=1):
+        """Block until tokens are available"""
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return
+            time.sleep(wait)
@@ -0,0 +1,53 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, 'src')
+
+#pipeline modules import each other from src/, the dashboard modules live at the root
+for path in (ROOT, SRC):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+@pytest.fixture
+def engine():
+    """In-memory SQLite database with every pipeline table, shared by all connections"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.pool import StaticPool
+    from models import Base
+
+    engine = create_engine('sqlite://', poolclass=StaticPool, connect_args={'check_same_thread': False})
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def add_weather(engine):
+    """Insert weather_data rows, creating their cities ("City <city_id>") as needed
+
+    Call as add_weather([(id, city_id, timestamp, temperature), ...]). ids are
+    explicit: SQLite does not number a composite primary key, and tests of
+    late commits need to choose them anyway.
+    """
+    from sqlalchemy import insert, select
+    from models import City, WeatherData
+
+    def add(rows):
+        with engine.begin() as conn:
+            known = set(conn.execute(select(City.city_id)).scalars())
+            cities = sorted({row[1] for row in rows} - known)
+            if cities:
+                conn.execute(insert(City), [{'city_id': city_id, 'city_name': f"City {city_id}", 'country': 'US',
+                                             'latitude': 0.0, 'longitude': 0.0} for city_id in cities])
+            conn.execute(insert(WeatherData), [
+                {'id': row_id, 'city_id': city_id, 'timestamp': timestamp, 'fetched_at': timestamp,
+                 'temperature': temperature, 'humidity': 50.0, 'pressure': 1010.0,
+                 'weather_main': 'Clear', 'weather_description': 'clear sky'}
+                for row_id, city_id, timestamp, temperature in rows
+            ])
+
+    return add
@@ -0,0 +1,65 @@
+import time
+
+from cache import DiskCache, MemoryCache, ResponseCache
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+
+
+def test_fresh_within_ttl():
+    cache = ResponseCache(MemoryCache(), ttl=300, observation_interval=600)
+    entry = {'fetched_at': 1000.0, 'data': {'dt': 0}}
+    assert cache.is_fresh(entry, now=1299.0)
+    assert not cache.is_fresh(entry, now=1300.0)
+
+
+def test_fresh_while_observation_is_recent():
+    cache = ResponseCache(MemoryCache(), ttl=300, observation_interval=600)
+    entry = {'fetched_at': 0.0, 'data': {'dt': 1000}}
+    assert cache.is_fresh(entry, now=1599.0)
+    assert not cache.is_fresh(entry, now=1600.0)
+    assert not cache.is_fresh({'fetched_at': 0.0, 'data': {}}, now=1000.0)
+
+
+def test_store_keeps_etag_only_for_identical_payload():
+    cache = ResponseCache(MemoryCache())
+    cache.store('Boston', {'dt': 1}, etag='"v1"')
+    assert cache.store('Boston', {'dt': 1})['etag'] == '"v1"'
+    assert cache.store('Boston', {'dt': 2})['etag'] is None
+    assert time.time() - cache.get('Boston')['fetched_at'] < 5
+
+
+def test_emitted_observations_are_skipped():
+    cache = ResponseCache(MemoryCache())
+    cache.store('Boston', {'dt': 100})
+    assert not cache.already_emitted('Boston', 100)
+
+    cache.mark_emitted('Boston', 100)
+    assert cache.already_emitted('Boston', 100)
+    assert cache.already_emitted('Boston', 90)
+    assert not cache.already_emitted('Boston', 110)
+    assert not cache.already_emitted('Boston', None)
+
+    #an older observation never moves the mark back
+    cache.mark_emitted('Boston', 50)
+    assert cache.already_emitted('Boston', 100)
+
+
+def test_disk_cache_survives_reopening(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = ResponseCache(DiskCache(path))
+    cache.store('Boston', {'dt': 100}, etag='"v1"')
+    cache.mark_emitted('Boston', 100)
+    cache.backend.close()
+
+    reopened = ResponseCache(DiskCache(path))
+    assert reopened.get('Boston')['etag'] == '"v1"'
+    assert reopened.already_emitted('Boston', 100)
+    reopened.backend.close()
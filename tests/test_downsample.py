@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from downsample import decimate, lttb, min_max
+
+
+def series(n=1000, seed=1):
+    rng = np.random.default_rng(seed)
+    return np.arange(n, dtype='float64'), rng.normal(size=n).cumsum()
+
+
+def test_lttb_keeps_the_budget_and_the_endpoints():
+    x, y = series()
+    kept = lttb(x, y, 100)
+
+    assert len(kept) == 100
+    assert kept[0] == 0 and kept[-1] == len(x) - 1
+    assert np.all(np.diff(kept) > 0)
+
+
+def test_lttb_keeps_a_spike():
+    x = np.arange(500, dtype='float64')
+    y = np.zeros(500)
+    y[237] = 50.0
+    assert 237 in lttb(x, y, 20)
+
+
+@pytest.mark.parametrize('points', [1, 2, 1000, 5000])
+def test_lttb_returns_everything_when_it_cannot_reduce(points):
+    x, y = series()
+    assert np.array_equal(lttb(x, y, points), np.arange(len(x)))
+
+
+def test_min_max_keeps_every_bucket_extreme():
+    x, y = series()
+    kept = min_max(x, y, 100)
+
+    assert kept[0] == 0 and kept[-1] == len(x) - 1
+    assert np.all(np.diff(kept) > 0)
+    assert len(kept) <= 100 + 2
+    bucket = (np.arange(len(y)) * 50) // len(y)
+    for b in range(50):
+        members = np.flatnonzero(bucket == b)
+        assert members[np.argmin(y[members])] in kept
+        assert members[np.argmax(y[members])] in kept
+    assert y.argmin() in kept and y.argmax() in kept
+
+
+def test_min_max_returns_everything_when_it_cannot_reduce():
+    x, y = series(10)
+    assert np.array_equal(min_max(x, y, 10), np.arange(10))
+    assert np.array_equal(min_max(x, y, 1), np.arange(10))
+
+
+def test_decimate_splits_the_budget_per_series():
+    times = pd.date_range('2025-01-01', periods=1000, freq='h')
+    df = pd.concat([
+        pd.DataFrame({'city_name': city, 'timestamp': times, 'temperature': series(seed=i)[1]})
+        for i, city in enumerate(['Boston', 'Miami'])
+    ], ignore_index=True)
+    df.loc[5, 'temperature'] = np.nan
+
+    out = decimate(df, 'timestamp', 'temperature', by='city_name', points=200)
+
+    assert out.groupby('city_name').size().to_dict() == {'Boston': 100, 'Miami': 100}
+    assert out['temperature'].notna().all()
+    for _, group in out.groupby('city_name'):
+        assert group['timestamp'].is_monotonic_increasing
+
+
+def test_decimate_leaves_small_frames_alone():
+    df = pd.DataFrame({'timestamp': pd.date_range('2025-01-01', periods=10, freq='h'), 'temperature': range(10)})
+    assert len(decimate(df, 'timestamp', 'temperature', points=100, method='min_max')) == 10
+
+
+def test_decimate_rejects_unknown_methods():
+    with pytest.raises(ValueError):
+        decimate(pd.DataFrame({'t': [], 'v': []}), 't', 'v', method='every_nth')
@@ -0,0 +1,86 @@
+from datetime import timedelta
+
+import pytest
+
+from observation_buffer import ObservationBuffer
+from utils import utc_now
+
+
+@pytest.fixture
+def now():
+    return utc_now().replace(microsecond=0)
+
+
+def buffered_ids(buffer):
+    return sorted(int(i) for i in buffer.frame()['id'])
+
+
+def test_refresh_reads_only_new_rows(engine, add_weather, now):
+    buffer = ObservationBuffer(engine, hours=24, refresh_interval=0, reread_ids=100)
+    add_weather([(i, 1, now - timedelta(minutes=i), 10.0) for i in (1, 2, 3)])
+    assert buffer.refresh() == 3
+
+    add_weather([(4, 2, now, 12.0)])
+    assert buffer.refresh() == 1
+    assert buffer.refresh() == 0
+    assert buffered_ids(buffer) == [1, 2, 3, 4]
+
+
+def test_late_commit_below_the_highest_id_is_picked_up(engine, add_weather, now):
+    buffer = ObservationBuffer(engine, hours=24, refresh_interval=0, reread_ids=10)
+    add_weather([(i, 1, now - timedelta(minutes=i), 10.0) for i in (1, 2, 3, 5, 6)])
+    buffer.refresh()
+
+    #id 4 was handed out before 5 and 6 but its transaction committed after them
+    add_weather([(4, 2, now, 12.0), (7, 2, now - timedelta(minutes=1), 13.0)])
+    assert buffer.refresh() == 2
+    assert buffered_ids(buffer) == [1, 2, 3, 4, 5, 6, 7]
+    assert buffer.record_count() == 7
+
+
+def test_rows_below_the_reread_window_are_not_read_again(engine, add_weather, now):
+    buffer = ObservationBuffer(engine, hours=24, refresh_interval=0, reread_ids=2)
+    add_weather([(i, 1, now - timedelta(minutes=i), 10.0) for i in range(1, 11) if i != 5])
+    buffer.refresh()
+
+    add_weather([(5, 2, now, 12.0)])
+    assert buffer.refresh() == 0
+    assert 5 not in buffered_ids(buffer)
+
+
+def test_unchanged_data_version_skips_the_query(engine, add_weather, now):
+    buffer = ObservationBuffer(engine, hours=24, refresh_interval=0)
+    add_weather([(1, 1, now, 10.0)])
+    assert buffer.refresh(version=1) == 1
+
+    add_weather([(2, 1, now - timedelta(minutes=5), 11.0)])
+    assert buffer.refresh(version=1) == 0
+    assert buffer.refresh(version=2) == 1
+
+
+def test_refresh_interval_limits_round_trips(engine, add_weather, now):
+    buffer = ObservationBuffer(engine, hours=24, refresh_interval=3600)
+    buffer.refresh()
+    add_weather([(1, 1, now, 10.0)])
+    assert buffer.refresh() == 0
+    assert buffer.refresh(force=True) == 1
+
+
+def test_rows_outside_the_window_are_evicted(engine, add_weather, now):
+    buffer = ObservationBuffer(engine, hours=2, refresh_interval=0)
+    add_weather([(1, 1, now - timedelta(hours=5), 10.0), (2, 1, now, 11.0)])
+    buffer.refresh()
+
+    assert buffered_ids(buffer) == [2]
+    assert buffer.covers(now - timedelta(hours=1))
+    assert not buffer.covers(now - timedelta(hours=5))
+
+
+def test_empty_buffer_answers_every_widget(engine):
+    buffer = ObservationBuffer(engine, hours=24, refresh_interval=0)
+    buffer.refresh()
+
+    assert buffer.record_count() == 0
+    assert buffer.condition_counts().empty
+    assert buffer.mean_by_city('temperature').empty
+    assert buffer.weather_rows_page(limit=10).empty
@@ -0,0 +1,66 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from observations import COLUMNS, ObservationBatch
+
+RECORDS = [
+    {'city': 'Boston', 'country': 'US', 'timestamp': datetime(2025, 1, 1, 0), 'temperature': 1.5,
+     'humidity': 80.0, 'visibility': 9999.0, 'latitude': 42.4, 'longitude': -71.1},
+    {'city': 'Miami', 'country': 'US', 'timestamp': datetime(2025, 1, 1, 1), 'temperature': 25.0,
+     'humidity': None, 'visibility': None, 'latitude': 25.8, 'longitude': -80.2},
+    {'city': 'Boston', 'country': 'US', 'timestamp': datetime(2025, 1, 1, 2), 'temperature': 2.0,
+     'humidity': 81.0, 'visibility': 10000.0, 'latitude': 42.4, 'longitude': -71.1},
+]
+
+
+def test_columns_are_typed_arrays():
+    batch = ObservationBatch.from_records(RECORDS)
+
+    assert len(batch) == 3
+    assert list(batch.columns) == list(COLUMNS)
+    assert batch['temperature'].dtype == np.float64
+    assert batch['timestamp'].dtype == np.dtype('datetime64[us]')
+    #missing columns and values become NaN/NaT/None
+    assert np.isnan(batch['humidity'][1])
+    assert np.isnat(batch['fetched_at']).all()
+    assert batch['weather_main'].tolist() == [None, None, None]
+
+
+def test_rows_materialize_python_values():
+    batch = ObservationBatch.from_records(RECORDS)
+    rows = batch.rows(['timestamp', 'humidity', 'visibility', 'fetched_at'], 1, 3,
+                      extra={'city_id': np.array([7, 8, 9])})
+
+    assert rows == [
+        {'timestamp': datetime(2025, 1, 1, 1), 'humidity': None, 'visibility': None, 'fetched_at': None,
+         'city_id': 8},
+        {'timestamp': datetime(2025, 1, 1, 2), 'humidity': 81.0, 'visibility': 10000, 'fetched_at': None,
+         'city_id': 9},
+    ]
+    assert isinstance(rows[1]['visibility'], int)
+
+
+def test_cities_are_first_rows_per_city():
+    cities = ObservationBatch.from_records(RECORDS).cities()
+    assert [city['city'] for city in cities] == ['Boston', 'Miami']
+    assert cities[0]['latitude'] == 42.4
+
+
+def test_take_and_pandas_round_trip():
+    batch = ObservationBatch.from_records(RECORDS).take(np.array([True, False, True]))
+    df = batch.to_pandas()
+
+    assert list(df['city']) == ['Boston', 'Boston']
+    assert df['timestamp'].iloc[1] == pd.Timestamp('2025-01-01 02:00')
+    again = ObservationBatch.from_pandas(df)
+    assert np.array_equal(again['temperature'], batch['temperature'])
+
+
+def test_to_arrow_turns_missing_values_into_nulls():
+    table = ObservationBatch.from_records(RECORDS).to_arrow()
+
+    assert str(table.schema.field('visibility').type) == 'int64'
+    assert table.column('visibility').to_pylist() == [9999, None, 10000]
+    assert table.column('humidity').null_count == 1
@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+import queries
+from observation_buffer import ObservationBuffer
+
+START = datetime(2025, 1, 1)
+HOURS = 6
+CITY_IDS = [1, 2, 3, 4, 5]
+PINNED = [4, 2]
+
+
+@pytest.fixture
+def weather(add_weather):
+    add_weather([(city_id * 100 + hour, city_id, START + timedelta(hours=hour), float(hour))
+                 for city_id in CITY_IDS for hour in range(HOURS)])
+
+
+def expected_keys(city_order, cities=CITY_IDS, since=START):
+    order = list(city_order) + [city_id for city_id in sorted(cities) if city_id not in city_order]
+    return [(city_id, START + timedelta(hours=hour))
+            for city_id in order if city_id in cities
+            for hour in reversed(range(HOURS)) if START + timedelta(hours=hour) >= since]
+
+
+def walk(read_page, limit, **kwargs):
+    """Follow a paged reader to the end; returns the (city_id, timestamp) of every row in order"""
+    keys, after = [], None
+    while True:
+        page = read_page(limit=limit, after=after, **kwargs)
+        keys += [(int(city_id), pd.Timestamp(ts).to_pydatetime())
+                 for city_id, ts in zip(page['city_id'], page['timestamp'])]
+        if len(page) < limit:
+            return keys
+        after = keys[-1]
+
+
+@pytest.fixture
+def buffer(engine, weather):
+    #keep the fixed test hours inside the buffer window
+    buffer = ObservationBuffer(engine, hours=24 * 365 * 100, refresh_interval=0)
+    buffer.refresh()
+    return buffer
+
+
+@pytest.mark.parametrize('limit', [1, 4, 6, 7, 100])
+@pytest.mark.parametrize('city_order', [[], PINNED])
+def test_keyset_pages_cover_every_row_once_in_order(engine, weather, limit, city_order):
+    keys = walk(lambda **kw: queries.weather_rows_page(engine, **kw), limit, city_order=city_order)
+    assert keys == expected_keys(city_order)
+
+
+def test_keyset_pages_apply_city_and_time_filters(engine, weather):
+    since = START + timedelta(hours=3)
+    keys = walk(lambda **kw: queries.weather_rows_page(engine, **kw), 2,
+                cities=['City 2', 'City 3', 'City 5'], since=since, city_order=PINNED)
+    assert keys == expected_keys(PINNED, cities=[2, 3, 5], since=since)
+
+
+def test_pinned_city_without_rows_is_skipped(engine, weather):
+    keys = walk(lambda **kw: queries.weather_rows_page(engine, **kw), 5, city_order=[99, 3])
+    assert keys == expected_keys([3])
+
+
+def test_page_has_the_data_table_columns(engine, weather):
+    page = queries.weather_rows_page(engine, limit=3, city_order=PINNED)
+    assert list(page.columns) == ['city_id', 'city_name', 'temperature', 'feels_like', 'humidity', 'pressure',
+                                  'weather_description', 'wind_speed', 'timestamp']
+    assert list(page['city_name']) == ['City 4'] * 3
+
+
+@pytest.mark.parametrize('limit', [1, 5, 100])
+def test_buffer_pages_match_the_database(engine, buffer, limit):
+    from_db = walk(lambda **kw: queries.weather_rows_page(engine, **kw), limit, city_order=PINNED)
+    from_buffer = walk(buffer.weather_rows_page, limit, city_order=PINNED)
+    assert from_buffer == from_db
+
+
+def test_export_chunks_follow_the_page_order(engine, weather):
+    chunks = list(queries.iter_weather_rows(engine, city_order=PINNED, chunksize=7))
+
+    assert [len(chunk) for chunk in chunks] == [7, 7, 7, 7, 2]
+    assert 'city_id' not in chunks[0].columns
+    names = [name for chunk in chunks for name in chunk['city_name']]
+    assert names == [f"City {city_id}" for city_id, _ in expected_keys(PINNED)]
@@ -0,0 +1,80 @@
+import pickle
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from query_cache import MemoryBackend, QueryCache, SQLiteBackend, dumps, loads
+
+
+def test_dataframes_round_trip_through_arrow():
+    df = pd.DataFrame({'city_name': ['Boston', None], 'temperature': [1.5, np.nan],
+                       'timestamp': pd.to_datetime(['2025-01-01 00:00', '2025-01-01 01:00'])})
+    value = dumps(df)
+
+    assert value.startswith(b'arrow:')
+    pd.testing.assert_frame_equal(loads(value), df)
+
+
+@pytest.mark.parametrize('result', [
+    42, None, ['Boston', 'Miami'],
+    {'total_cities': 2, 'avg_temperature': np.float64(3.5), 'hottest': {'city_name': 'Miami', 'temperature': 25.0}},
+])
+def test_other_results_round_trip_through_json(result):
+    value = dumps(result)
+    assert value.startswith(b'json:')
+    assert loads(value) == result
+
+
+def test_unsupported_results_are_refused():
+    with pytest.raises(TypeError):
+        dumps({'at': datetime(2025, 1, 1)})
+
+
+def test_pickled_entries_are_never_loaded():
+    with pytest.raises(ValueError):
+        loads(pickle.dumps(pd.DataFrame({'a': [1]})))
+
+
+def cache(backend=None, version=1):
+    versions = {'current': version}
+    return QueryCache(backend or MemoryBackend(), lambda: versions['current'], version_check=0), versions
+
+
+def test_results_are_cached_per_arguments_and_version():
+    query_cache, versions = cache()
+    calls = []
+
+    @query_cache.cached
+    def load(city):
+        calls.append(city)
+        return pd.DataFrame({'city_name': [city]})
+
+    assert load('Boston')['city_name'][0] == 'Boston'
+    assert load('Boston')['city_name'][0] == 'Boston'
+    load('Miami')
+    versions['current'] = 2
+    load('Boston')
+
+    assert calls == ['Boston', 'Miami', 'Boston']
+    assert (query_cache.hits, query_cache.misses) == (1, 3)
+
+
+def test_cached_none_is_a_hit():
+    query_cache, _ = cache()
+    calls = []
+    for _ in range(2):
+        query_cache.get_or_compute('nothing', (), lambda: calls.append(1))
+    assert calls == [1]
+
+
+def test_foreign_entries_are_recomputed(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'cache.sqlite'))
+    query_cache, _ = cache(backend)
+    key = query_cache._key('load', ())
+    backend.set(key, pickle.dumps('planted'), 60)
+
+    assert query_cache.get_or_compute('load', (), lambda: 'computed') == 'computed'
+    assert loads(backend.get(key)) == 'computed'
+    backend.close()
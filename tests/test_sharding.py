@@ -0,0 +1,30 @@
+from collections import Counter
+
+from sharding import jump_hash, shard_cities
+
+CITIES = [f"City {i}" for i in range(2000)]
+
+
+def test_jump_hash_is_stable_and_in_range():
+    for city in CITIES[:100]:
+        bucket = jump_hash(city, 16)
+        assert 0 <= bucket < 16
+        assert jump_hash(city, 16) == bucket
+    assert {jump_hash(city, 1) for city in CITIES[:100]} == {0}
+
+
+def test_jump_hash_spreads_keys_evenly():
+    counts = Counter(jump_hash(city, 16) for city in CITIES)
+    assert len(counts) == 16
+    assert max(counts.values()) < 2 * len(CITIES) / 16
+
+
+def test_jump_hash_moves_only_keys_for_the_new_bucket():
+    moved = [city for city in CITIES if jump_hash(city, 16) != jump_hash(city, 17)]
+    assert all(jump_hash(city, 17) == 16 for city in moved)
+    assert len(moved) < 2 * len(CITIES) / 17
+
+
+def test_shards_partition_the_city_list():
+    shards = [shard_cities(CITIES, shard_id, 8) for shard_id in range(8)]
+    assert sorted(city for shard in shards for city in shard) == sorted(CITIES)
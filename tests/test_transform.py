@@ -0,0 +1,115 @@
+import json
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from transform import REJECT_COLUMNS, transform_payloads, validate_records
+
+FETCHED_AT = datetime(2025, 10, 16, 12, 5)
+
+
+def payload(**overrides):
+    data = {
+        'dt': 1760616000,
+        'coord': {'lat': 42.36, 'lon': -71.06},
+        'sys': {'country': 'US'},
+        'main': {'temp': 288.15, 'feels_like': 287.0, 'temp_min': 286.0, 'temp_max': 290.0,
+                 'humidity': 70, 'pressure': 1013},
+        'weather': [{'main': 'Clouds', 'description': 'broken clouds'}],
+        'wind': {'speed': 4.1, 'deg': 200},
+        'clouds': {'all': 75},
+        'visibility': 10000,
+    }
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(data.get(key), dict):
+            data[key] = {**data[key], **value}
+        else:
+            data[key] = value
+    return data
+
+
+def raw(city='Boston', **overrides):
+    return {'city': city, 'fetched_at': FETCHED_AT, 'payload': payload(**overrides)}
+
+
+def test_valid_payload_is_converted():
+    records, rejects = transform_payloads([raw()])
+
+    assert len(records) == 1 and rejects.empty
+    row = records.to_pandas().iloc[0]
+    assert row['city'] == 'Boston'
+    assert row['temperature'] == pytest.approx(15.0)
+    assert row['weather_main'] == 'Clouds'
+    #observation time is the payload's dt, as naive UTC
+    assert row['timestamp'] == pd.Timestamp('2025-10-16 12:00:00')
+
+
+def test_missing_optional_fields_get_defaults():
+    records, rejects = transform_payloads([raw(wind=None, clouds=None, sys=None, visibility=None)])
+
+    row = records.to_pandas().iloc[0]
+    assert rejects.empty
+    assert (row['wind_speed'], row['cloudiness'], row['country']) == (0, 0, 'Unknown')
+    assert np.isnan(row['visibility'])
+
+
+def test_missing_dt_falls_back_to_fetch_time():
+    records, _ = transform_payloads([raw(dt=None)])
+    assert records.to_pandas().iloc[0]['timestamp'] == pd.Timestamp(FETCHED_AT)
+
+
+@pytest.mark.parametrize('overrides, reason', [
+    ({'main': {'temp': 400.0}}, 'temperature out of range'),
+    ({'main': {'humidity': 130}}, 'humidity out of range'),
+    ({'main': {'pressure': 500}}, 'pressure out of range'),
+    ({'wind': {'speed': -1}}, 'wind_speed out of range'),
+    ({'coord': {'lat': 95}}, 'latitude out of range'),
+    ({'main': {'temp': None}}, 'missing temperature'),
+    ({'weather': []}, 'missing weather_main'),
+    ({'main': {'humidity': 'n/a'}}, 'missing humidity'),
+])
+def test_implausible_records_are_rejected(overrides, reason):
+    records, rejects = transform_payloads([raw('Bad', **overrides), raw('Good')])
+
+    assert list(records.to_pandas()['city']) == ['Good']
+    assert list(rejects.columns) == REJECT_COLUMNS
+    assert list(rejects['city']) == ['Bad']
+    assert rejects.loc[0, 'reason'] == reason
+    assert json.loads(rejects.loc[0, 'payload']) == payload(**overrides)
+
+
+def test_first_failed_check_is_the_reason():
+    _, rejects = transform_payloads([raw(main={'temp': None, 'humidity': 130})])
+    assert list(rejects['reason']) == ['missing temperature']
+
+
+def test_non_dict_payload_is_rejected():
+    records, rejects = transform_payloads([{'city': 'Boston', 'fetched_at': FETCHED_AT, 'payload': 'oops'}])
+    assert len(records) == 0
+    assert rejects.loc[0, 'reason'] == 'missing temperature'
+
+
+def test_empty_batch():
+    records, rejects = transform_payloads([])
+    assert len(records) == 0
+    assert list(rejects.columns) == REJECT_COLUMNS
+
+
+def test_validate_records_applies_the_same_checks():
+    df = pd.DataFrame({
+        'city': ['Boston', 'Miami'],
+        'timestamp': pd.to_datetime(['2025-01-01 00:00', '2025-01-01 01:00']),
+        'temperature': [5.0, 75.0],
+        'humidity': [60.0, 60.0],
+        'pressure': [1010.0, 1010.0],
+        'weather_main': ['Clear', 'Clear'],
+        'latitude': [42.0, 25.0],
+        'longitude': [-71.0, -80.0],
+    })
+    records, rejects = validate_records(df)
+
+    assert list(records.to_pandas()['city']) == ['Boston']
+    assert list(rejects['reason']) == ['temperature out of range']
+    assert records.to_pandas().iloc[0]['wind_speed'] == 0
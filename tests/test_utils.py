@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import pytest
+
+import utils
+from utils import TokenBucket, backoff_delay, parse_retry_after, utc_epoch, utc_from_epoch
+
+
+def test_parse_retry_after_seconds():
+    assert parse_retry_after('120') == 120.0
+    assert parse_retry_after('-5') == 0.0
+
+
+def test_parse_retry_after_http_date():
+    when = datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert 25 <= parse_retry_after(format_datetime(when, usegmt=True)) <= 30
+
+
+@pytest.mark.parametrize('value', [None, '', 'soon'])
+def test_parse_retry_after_unusable(value):
+    assert parse_retry_after(value) is None
+
+
+def test_backoff_delay_prefers_retry_after():
+    assert backoff_delay(5, base=2, cap=60, retry_after='7') == 7.0
+
+
+def test_backoff_delay_is_capped_with_equal_jitter():
+    for attempt, delay in [(0, 2), (2, 8), (10, 60)]:
+        for _ in range(50):
+            assert delay / 2 <= backoff_delay(attempt, base=2, cap=60) <= delay
+
+
+def test_utc_from_epoch_round_trips():
+    moment = datetime(2025, 3, 30, 1, 30)
+    assert utc_from_epoch(utc_epoch(moment)) == moment
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(utils.time, 'monotonic', clock)
+    return clock
+
+
+def test_token_bucket_allows_burst_then_waits(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+    assert [bucket.try_acquire() for _ in range(3)] == [0, 0, 0]
+    assert bucket.try_acquire() == pytest.approx(0.5)
+
+
+def test_token_bucket_refills_up_to_capacity(clock):
+    bucket = TokenBucket(rate=2, capacity=3)
+    for _ in range(3):
+        bucket.try_acquire()
+    clock.now += 1
+    assert bucket.try_acquire(2) == 0
+    assert bucket.try_acquire() == pytest.approx(0.5)
+
+    clock.now += 100
+    assert bucket.try_acquire(3) == 0
+    assert bucket.try_acquire() > 0
+
+
+def test_token_bucket_per_minute():
+    bucket = TokenBucket.per_minute(60, burst=10)
+    assert bucket.rate == 1
+    assert bucket.capacity == 10